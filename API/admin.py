@@ -1,12 +1,12 @@
 from django.contrib import admin
 from .models import APIUserProfile, CustomThumbnailSize,\
-                    AccountTypePermissions, GeneratedImage, StoredImage
+                    AccountTypePermissions, GeneratedImage, StoredImage, ImageBlob, UploadSession
 
 
 class AccountTypePermissionsAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'create_200px_thumbnail_perm', 'create_400px_thumbnail_perm',
                     'create_original_img_link_perm', 'create_time_limited_link_perm',
-                    'create_custom_sized_thumbnail_perm')
+                    'create_custom_sized_thumbnail_perm', 'lazy_thumbnails', 'webp_quality', 'avif_quality')
 
 
 class CustomThumbnailSizeAdmin(admin.ModelAdmin):
@@ -18,15 +18,25 @@ class APIUserProfileAdmin(admin.ModelAdmin):
 
 
 class StoredImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'file')
+    list_display = ('id', 'file', 'blob')
+
+
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sha256', 'file', 'refcount', 'created')
 
 
 class GeneratedImagesAdmin(admin.ModelAdmin):
-    list_display = ('id', 'source_image', 'modified_image', 'type', 'slug', 'created', 'expire_date')
+    list_display = ('id', 'source_image', 'modified_image', 'type', 'slug', 'created', 'expire_date', 'status')
+
+
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'owner', 'file_name', 'size', 'offset', 'created', 'expire_date')
 
 
 admin.site.register(AccountTypePermissions, AccountTypePermissionsAdmin)
 admin.site.register(CustomThumbnailSize, CustomThumbnailSizeAdmin)
 admin.site.register(APIUserProfile, APIUserProfileAdmin)
 admin.site.register(StoredImage, StoredImageAdmin)
+admin.site.register(ImageBlob, ImageBlobAdmin)
 admin.site.register(GeneratedImage, GeneratedImagesAdmin)
+admin.site.register(UploadSession, UploadSessionAdmin)
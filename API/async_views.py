@@ -0,0 +1,101 @@
+"""
+Serving of views by ASGI without blocking event loop. Views of DRF and of Django 3.2 class based views are sync,
+and Django runs sync code of all async requests in one thread. Views wrapped with async_view run in threads of
+executor instead, so many requests are handled at once, while request bodies are received and responses sent
+by event loop without holding any thread.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponse
+from django.urls import URLPattern, URLResolver
+from API.query_budget import record_thread_queries
+
+_request_executor = None
+_request_executor_lock = threading.Lock()
+
+
+def get_request_executor():
+    """
+    Returns executor running sync code of async requests, with ASGI_SYNC_WORKERS threads
+    """
+    global _request_executor
+    with _request_executor_lock:
+        if _request_executor is None:
+            _request_executor = ThreadPoolExecutor(max_workers=settings.ASGI_SYNC_WORKERS,
+                                                   thread_name_prefix='asgi-sync')
+        return _request_executor
+
+
+def _run_in_thread(func, args, kwargs):
+    # Database connections of thread are closed after each call, unless CONN_MAX_AGE keeps them open,
+    # as they are at the end of WSGI requests
+    close_old_connections()
+    try:
+        with record_thread_queries():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Runs sync code, like ORM queries, thumbnail rendering or reading of files, in thread of request executor.
+    Context variables, like timer of request stages, are copied to the thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_request_executor(),
+                                      partial(context.run, _run_in_thread, func, args, kwargs))
+
+
+def read_file_response(response):
+    """
+    Returns response with content of file of FileResponse, which is sent by ASGI handler without reading file
+    in event loop. Thumbnails are small enough to be held in memory.
+    """
+    try:
+        buffered = HttpResponse(b''.join(response.streaming_content), status=response.status_code)
+    finally:
+        response.file_to_stream.close()
+    for header, value in response.items():
+        buffered[header] = value
+    return buffered
+
+
+def _call_view(view, request, args, kwargs):
+    response = view(request, *args, **kwargs)
+    if isinstance(response, FileResponse):
+        response = read_file_response(response)
+    return response
+
+
+def async_view(view):
+    """
+    Wraps sync view to be run by run_sync, along with reading of file it responds with.
+    Attributes of view, like query_budget or class of DRF view, are kept.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run_sync(_call_view, view, request, args, kwargs)
+    return wrapper
+
+
+def async_urlpatterns(patterns, names):
+    """
+    Returns copy of url patterns, with views of patterns of given names wrapped with async_view
+    :param names: names of url patterns, like 'display_image'
+    """
+    wrapped = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(pattern.pattern, async_urlpatterns(pattern.url_patterns, names),
+                                  pattern.default_kwargs, pattern.app_name, pattern.namespace)
+        elif pattern.name in names:
+            pattern = URLPattern(pattern.pattern, async_view(pattern.callback), pattern.default_args, pattern.name)
+        wrapped.append(pattern)
+    return wrapped
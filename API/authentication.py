@@ -0,0 +1,91 @@
+import copy
+from collections import namedtuple
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from API.cache import TTLCache
+from API.models import APIUserProfile
+
+
+# Caches are cleared on Token, User and APIUserProfile changes by handlers in API.signals
+token_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)    # token key -> (user_id, token)
+user_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)     # user id -> User
+profile_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)  # user id -> ProfileRecord
+
+
+class ProfileRecord(namedtuple('ProfileRecord', ['user_id', 'profile_id', 'account_type_id'])):
+    """
+    Compact, immutable view of APIUserProfile of authenticated user
+    """
+    __slots__ = ()
+
+    def to_profile(self):
+        """
+        Builds unsaved APIUserProfile, usable as value of foreign keys without querying the database
+        """
+        return APIUserProfile(id=self.profile_id, user_id=self.user_id, account_type_id=self.account_type_id)
+
+
+def clear_auth_caches():
+    token_cache.clear()
+    user_cache.clear()
+    profile_cache.clear()
+
+
+def _cached_user(user_id):
+    """
+    Returns copy of cached user, so changes made while handling one request are not seen by others
+    """
+    user = user_cache.get(user_id)
+    return copy.copy(user) if user is not None else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication resolving token keys from in-process cache, instead of querying Token and User
+    on every request.
+    """
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user_id, token = entry
+            user = _cached_user(user_id)
+            if user is not None:
+                return user, token
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user.id, token))
+        user_cache.set(user.id, user)
+        return _cached_user(user.id) or user, token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication resolving user of validated token from in-process cache
+    """
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = _cached_user(user_id)
+            if user is not None:
+                return user
+
+        user = super().get_user(validated_token)
+        user_cache.set(user.id, user)
+        return _cached_user(user.id) or user
+
+
+def get_profile(user):
+    """
+    Resolves profile of user authenticated by DRF.
+    :param user: request.user
+    :return: ProfileRecord
+    :raises APIUserProfile.DoesNotExist: user has no profile assigned
+    """
+    record = profile_cache.get(user.id)
+    if record is None:
+        profile = APIUserProfile.objects.values('id', 'account_type_id').get(user_id=user.id)
+        record = ProfileRecord(user_id=user.id, profile_id=profile['id'], account_type_id=profile['account_type_id'])
+        profile_cache.set(user.id, record)
+    return record
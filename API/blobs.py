@@ -0,0 +1,153 @@
+import hashlib
+from collections import Counter, defaultdict
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from easy_thumbnails.models import Source, Thumbnail
+from API.metrics import increment, stage
+from API.models import ImageBlob
+
+
+def hash_file(file):
+    """
+    Returns sha256 hex digest of uploaded file content. Digest computed while file was being received
+    is used when file has one.
+    :param file: UploadedFile
+    """
+    digest = getattr(file, 'sha256', None)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        file.seek(0)
+    return digest
+
+
+def acquire_blob(file):
+    """
+    Returns blob with content of uploaded file, creating it when content was not uploaded before,
+    and increases its reference count. Should be called in transaction with creation of StoredImage using blob.
+    :param file: UploadedFile
+    :return: ImageBlob
+    """
+    digest = hash_file(file)
+    blob, created = ImageBlob.objects.select_for_update().get_or_create(sha256=digest,
+                                                                      defaults={'width': 0, 'height': 0})
+    if created:
+        blob.width, blob.height = getattr(file, 'image_size', None) or get_image_dimensions(file)
+        with stage('storage'):
+            blob.file.save(file.name, file, save=False)
+        increment('bytes_written', file.size, label='source')
+        blob.refcount = 1
+        blob.save()
+    else:
+        # Row is locked until end of transaction, so refcount of object stays current
+        ImageBlob.objects.filter(id=blob.id).update(refcount=F('refcount') + 1)
+        blob.refcount += 1
+    return blob
+
+
+def acquire_blobs(files):
+    """
+    Returns blobs with content of many uploaded files, like acquire_blob called for each of them, with number
+    of queries independent of number of files. Files with the same content share blob.
+    Should be called in transaction with creation of StoredImage objects using blobs.
+    :param files: list of UploadedFile
+    :return: list of ImageBlob, in order of files
+    """
+    digests = [hash_file(file) for file in files]
+    uses = Counter(digests)
+    blobs = {blob.sha256: blob for blob in ImageBlob.objects.select_for_update().filter(sha256__in=uses)}
+    existing = set(blobs)
+
+    new_blobs = {}
+    for file, digest in zip(files, digests):
+        if digest not in blobs and digest not in new_blobs:
+            blob = ImageBlob(sha256=digest, refcount=uses[digest])
+            blob.width, blob.height = getattr(file, 'image_size', None) or get_image_dimensions(file)
+            with stage('storage'):
+                blob.file.save(file.name, file, save=False)
+            increment('bytes_written', file.size, label='source')
+            new_blobs[digest] = blob
+    if new_blobs:
+        # Blobs inserted meanwhile by other uploads are skipped, and copies of their files are deleted
+        ImageBlob.objects.bulk_create(new_blobs.values(), ignore_conflicts=True)
+        for blob in ImageBlob.objects.select_for_update().filter(sha256__in=new_blobs):
+            created = new_blobs[blob.sha256]
+            if blob.file.name != created.file.name:
+                created.file.storage.delete(created.file.name)
+                existing.add(blob.sha256)
+            blobs[blob.sha256] = blob
+
+    # Reference counts of existing blobs are increased with one query per distinct number of uses
+    ids_by_uses = defaultdict(list)
+    for digest in existing:
+        ids_by_uses[uses[digest]].append(blobs[digest].id)
+        blobs[digest].refcount += uses[digest]
+    for count, ids in ids_by_uses.items():
+        ImageBlob.objects.filter(id__in=ids).update(refcount=F('refcount') + count)
+    return [blobs[digest] for digest in digests]
+
+
+def delete_files_on_commit(names, storage=default_storage):
+    """
+    Deletes files from storage once current transaction commits, so rows restored by rollback keep their files.
+    Files already missing are skipped.
+    :return: number of files to be deleted
+    """
+    names = [name for name in names if name and storage.exists(name)]
+
+    def delete_files():
+        for name in names:
+            if storage.exists(name):
+                storage.delete(name)
+    if names:
+        transaction.on_commit(delete_files)
+    return len(names)
+
+
+def release_blob(blob_id):
+    """
+    Decreases reference count of blob. Blob no longer used by any StoredImage is deleted with its file,
+    and files of thumbnails rendered from it. Files are deleted once deletion of blob is committed.
+    A new blob with the same content, created meanwhile, is saved under another name by storage.
+    :return: number of deleted files
+    """
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(id=blob_id).first()
+        if blob is None:
+            return 0
+        if blob.refcount > 1:
+            ImageBlob.objects.filter(id=blob_id).update(refcount=F('refcount') - 1)
+            return 0
+
+        names = [blob.file.name] + list(Thumbnail.objects.filter(source__name=blob.file.name)
+                                        .values_list('name', flat=True))
+        deleted_files = delete_files_on_commit(names, blob.file.storage)
+        Source.objects.filter(name=blob.file.name).delete()
+        blob.delete()
+    return deleted_files
+
+
+def save_source_image(serializer, owner):
+    """
+    Saves image sent to serializer as StoredImage using blob, instead of its own copy of file.
+    File saved for new blob is deleted when saving fails.
+    :param serializer: valid serializer of StoredImage, with file field
+    :param owner: APIUserProfile of user uploading image
+    :return: StoredImage
+    """
+    blob = None
+    try:
+        with transaction.atomic():
+            blob = acquire_blob(serializer.validated_data['file'])
+            return serializer.save(owner=owner, blob=blob, file=blob.file.name,
+                                   img_width=blob.width, img_height=blob.height)
+    except Exception:
+        # File of blob created in rolled back block is not used by any blob. Blob which existed before has
+        # reference count above 1 after it was acquired.
+        if blob is not None and blob.refcount == 1:
+            blob.file.storage.delete(blob.file.name)
+        raise
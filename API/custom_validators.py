@@ -25,24 +25,54 @@ class MaxValueValidatorIgnoreNull(MaxValueValidator):
         return a > b
 
 
+# Descriptions of allowed image types reported by libmagic, and their formats reported by Pillow
+ALLOWED_MAGIC_TYPES = ("PNG image data", "JPEG image data,")
+ALLOWED_IMAGE_FORMATS = ("PNG", "JPEG")
+# Number of bytes from beginning of file which are enough for libmagic to identify image type
+MAGIC_SNIFF_SIZE = 2048
+
+
+def is_allowed_magic_type(head):
+    """
+    Check if beginning of file is beginning of an allowed-type image
+    :param head: first MAGIC_SNIFF_SIZE bytes of file
+    """
+    mimetype = magic.from_buffer(bytes(head))
+    return mimetype.startswith(ALLOWED_MAGIC_TYPES)
+
+
+IMAGE_EXTENSIONS = ['jpg', 'png']
+IMAGE_TYPE_ERROR = f'Incorrect file type. Allowed types: {" ".join(IMAGE_EXTENSIONS)}'
+
+
+def validate_image_name(name):
+    """
+    Check if file name has extension of allowed-type image
+    :param name: name of file
+    """
+    if name[-3:] not in IMAGE_EXTENSIONS:
+        raise ValidationError(IMAGE_TYPE_ERROR)
+
+
 def validate_image_type(value):
     """
     Check if models.ImageField object is an allowed-type image
     :param value: models.ImageField object to identify
     """
-    extensions = ['jpg', 'png']
-    short = value.name[-3:]
-    error_msg = f'Incorrect file type. Allowed types: {" ".join(extensions)}'
+    validate_image_name(value.name)
 
-    if short not in extensions:
-        raise ValidationError(error_msg)
+    # Files received by IngestingUploadHandler were identified while they were uploaded
+    image_format = getattr(value, 'image_format', None)
+    if image_format is not None:
+        if image_format not in ALLOWED_IMAGE_FORMATS:
+            raise ValidationError(IMAGE_TYPE_ERROR)
+        return
 
-    # Check if mimetype starts with any of allowed item from valid_data
-    mimetype = magic.from_buffer(value.read())
-    valid_data = ("PNG image data", "JPEG image data,")
-    def check_correct_type(x): return True if mimetype.startswith(x) else False
-    if not any(map(check_correct_type, valid_data)):
-        raise ValidationError(error_msg)
+    # Check if mimetype of beginning of file starts with any of ALLOWED_MAGIC_TYPES
+    head = value.read(MAGIC_SNIFF_SIZE)
+    value.seek(0)
+    if not is_allowed_magic_type(head):
+        raise ValidationError(IMAGE_TYPE_ERROR)
 
     # There still are more ways to check if file is a secure to open image,
     # but there is no need to overthink validation for this project
@@ -0,0 +1,273 @@
+import math
+from io import BytesIO
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from easy_thumbnails import engine, utils
+from easy_thumbnails.exceptions import InvalidImageFormatError
+from PIL import Image
+
+try:
+    import pyvips
+except (ImportError, OSError):
+    # Package is missing, or libvips library could not be loaded
+    pyvips = None
+
+# Image formats named like by Pillow, of loaders used by libvips
+VIPS_LOADER_FORMATS = {
+    'jpegload': 'JPEG',
+    'pngload': 'PNG',
+    'webpload': 'WEBP',
+    'gifload': 'GIF',
+    'heifload': 'AVIF',
+    'tiffload': 'TIFF',
+}
+
+
+class ImageEngine:
+    """
+    Image processing backend used for reading uploaded images and rendering thumbnails, selected by
+    THUMBNAIL_ENGINE. Images passed between methods are objects of library used by engine.
+    """
+    name = None
+    # Engine can be used in render processes forked from web or worker process
+    fork_safe = True
+
+    def probe(self, source):
+        """
+        Reads image format and dimensions from image header, without decoding image
+        :param source: file object
+        :return: tuple of format, like 'JPEG', and (width, height)
+        :raise OSError: source is not an image
+        """
+        raise NotImplementedError
+
+    def open(self, thumbnailer, missing_options):
+        """
+        Opens source image of thumbnailer once for all missing thumbnails
+        :param missing_options: dict of thumbnail type: options of thumbnail
+        :return: dict of thumbnail type: source image resize_crop is called with
+        """
+        raise NotImplementedError
+
+    def resize_crop(self, image, options, thumbnailer):
+        """
+        Scales image to cover size from options, and crops it to that size around its centre
+        :return: thumbnail image
+        """
+        raise NotImplementedError
+
+    def is_transparent(self, image):
+        raise NotImplementedError
+
+    def can_encode(self, extension):
+        """
+        Checks if images can be encoded in format of file extension, like 'webp'
+        """
+        raise NotImplementedError
+
+    def encode(self, image, extension, **options):
+        """
+        :param extension: extension of file name, deciding format, like 'jpg'
+        :param options: quality, and other options of encoder
+        :return: encoded image as bytes
+        """
+        raise NotImplementedError
+
+    def load(self, data):
+        """
+        Opens encoded image, like thumbnail file
+        """
+        raise NotImplementedError
+
+
+def read_source(thumbnailer):
+    """
+    Returns content of source file of thumbnailer
+    """
+    # Closed file is closed again after reading, as in engine.generate_source_image
+    was_closed = getattr(thumbnailer, 'closed', False)
+    thumbnailer.open()
+    try:
+        thumbnailer.seek(0)
+        return thumbnailer.read()
+    finally:
+        if was_closed:
+            thumbnailer.close()
+
+
+def get_reduction_factor(source_size, options):
+    """
+    Returns how many times source image can be shrunk before final resize of thumbnail,
+    so that shrunk image is still THUMBNAIL_REDUCING_GAP times larger than resized image.
+    Factor below 2 means image should not be shrunk.
+    :param source_size: (width, height) of source image, after EXIF orientation is applied
+    :param options: thumbnail options containing target size
+    """
+    target_width, target_height = (float(side) for side in options['size'])
+    scale = max(target_width / source_size[0], target_height / source_size[1])
+    if scale <= 0:
+        return 1
+    return 1 / (scale * settings.THUMBNAIL_REDUCING_GAP)
+
+
+def load_source_image(thumbnailer, missing_options):
+    """
+    Decodes source image of thumbnailer only at resolution required by largest of missing thumbnails.
+    JPEG images are decoded with DCT-domain scaling (draft mode), when all thumbnails are much smaller than
+    source. Original-size thumbnail always requires full decode. Truncated source fails to decode, instead of
+    switching process-global ImageFile.LOAD_TRUNCATED_IMAGES while other threads decode.
+    """
+    image = Image.open(BytesIO(read_source(thumbnailer)))
+    if image.format == 'JPEG':
+        # EXIF orientation applied after decoding may swap width and height, so both are checked
+        factor = min(get_reduction_factor(source_size, options)
+                     for source_size in (image.size, image.size[::-1])
+                     for options in missing_options.values())
+        if factor >= 2:
+            image.draft(image.mode, (math.ceil(image.width / factor), math.ceil(image.height / factor)))
+    image.load()
+    return utils.exif_orientation(image)
+
+
+def decode_source_image(thumbnailer, missing_options):
+    """
+    Opens and decodes source image of thumbnailer, once for all missing thumbnails.
+    With THUMBNAIL_DRAFT_DECODING disabled image is fully decoded using source generators from easy_thumbnails
+    settings.
+    """
+    if settings.THUMBNAIL_DRAFT_DECODING:
+        return load_source_image(thumbnailer, missing_options)
+    options = next(iter(missing_options.values()))
+    image = engine.generate_source_image(thumbnailer, options, thumbnailer.source_generators, fail_silently=False)
+    if image is None:
+        raise InvalidImageFormatError(f"The source file does not appear to be an image: '{thumbnailer.name}'")
+    return image
+
+
+def prepare_source_images(source_image, missing_options):
+    """
+    Shrinks decoded source image with Image.reduce for thumbnails much smaller than it, which is much faster
+    than resampling full image. Image reduced by the same factor is shared between thumbnails.
+    :return: dict of thumbnail type: image to be processed into thumbnail
+    """
+    if not settings.THUMBNAIL_DRAFT_DECODING:
+        return {thumbnail_type: source_image for thumbnail_type in missing_options}
+    reduced_images = {1: source_image}
+    prepared = {}
+    for thumbnail_type, options in missing_options.items():
+        factor = max(1, int(get_reduction_factor(source_image.size, options)))
+        if factor not in reduced_images:
+            reduced_images[factor] = source_image.reduce(factor)
+        prepared[thumbnail_type] = reduced_images[factor]
+    return prepared
+
+
+
+class PillowEngine(ImageEngine):
+    """
+    Uses Pillow and processors of easy_thumbnails, rendering the same thumbnails as Thumbnailer.get_thumbnail
+    """
+    name = 'pillow'
+
+    def probe(self, source):
+        with Image.open(source) as image:
+            return image.format, image.size
+
+    def open(self, thumbnailer, missing_options):
+        return prepare_source_images(decode_source_image(thumbnailer, missing_options), missing_options)
+
+    def resize_crop(self, image, options, thumbnailer):
+        return engine.process_image(image, options, thumbnailer.thumbnail_processors)
+
+    def is_transparent(self, image):
+        return utils.is_transparent(image)
+
+    def can_encode(self, extension):
+        Image.init()
+        return Image.EXTENSION.get(f'.{extension}') in Image.SAVE
+
+    def encode(self, image, extension, **options):
+        return engine.save_pil_image(image, filename=f'image.{extension}', **options).read()
+
+    def load(self, data):
+        image = Image.open(BytesIO(data))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if utils.is_transparent(image) else 'RGB')
+        return image
+
+
+class VipsEngine(ImageEngine):
+    """
+    Uses libvips through pyvips. Source is decoded while it is being resized, at reduced scale when its format
+    allows it, so full size source is not kept in memory. Source file is read once for all thumbnails.
+    """
+    name = 'vips'
+    # Worker threads of libvips are not copied into forked process, which blocks waiting for them
+    fork_safe = False
+
+    def __init__(self):
+        if pyvips is None:
+            raise ImproperlyConfigured("THUMBNAIL_ENGINE 'vips' requires pyvips package and libvips library")
+
+    def probe(self, source):
+        stream = pyvips.SourceCustom()
+        stream.on_read(source.read)
+        try:
+            image = pyvips.Image.new_from_source(stream, '', access='sequential')
+            loader = image.get('vips-loader')
+        except pyvips.Error as e:
+            raise OSError(str(e)) from e
+        return VIPS_LOADER_FORMATS.get(loader.split('_')[0]), (image.width, image.height)
+
+    def open(self, thumbnailer, missing_options):
+        data = read_source(thumbnailer)
+        return {thumbnail_type: data for thumbnail_type in missing_options}
+
+    def resize_crop(self, image, options, thumbnailer):
+        width, height = (int(side) for side in options['size'])
+        try:
+            return pyvips.Image.thumbnail_buffer(image, width, height=height,
+                                                 crop='centre' if options.get('crop') else 'none',
+                                                 size='both' if options.get('upscale') else 'down')
+        except pyvips.Error as e:
+            raise InvalidImageFormatError(str(e)) from e
+
+    def is_transparent(self, image):
+        return image.hasalpha()
+
+    def can_encode(self, extension):
+        return f'.{extension}' in pyvips.get_suffixes()
+
+    def encode(self, image, extension, quality=85, **options):
+        extension = extension.lower()
+        save_options = {'strip': True}
+        if extension in ('jpg', 'jpeg'):
+            if image.hasalpha():
+                # Transparency layer is dropped, as by Pillow engine
+                image = image.extract_band(0, n=image.bands - 1)
+            save_options.update(Q=quality, optimize_coding=True)
+        elif extension in ('webp', 'avif'):
+            save_options['Q'] = quality
+        if extension == 'avif':
+            save_options['compression'] = 'av1'
+        return image.write_to_buffer(f'.{extension}', **save_options)
+
+    def load(self, data):
+        return pyvips.Image.new_from_buffer(data, '')
+
+
+IMAGE_ENGINES = {
+    PillowEngine.name: PillowEngine,
+    VipsEngine.name: VipsEngine,
+}
+
+
+def get_image_engine(name=None):
+    """
+    Returns image engine selected by THUMBNAIL_ENGINE
+    :param name: name of engine used instead of THUMBNAIL_ENGINE
+    """
+    name = name or settings.THUMBNAIL_ENGINE
+    if name not in IMAGE_ENGINES:
+        raise ImproperlyConfigured(f"Unknown THUMBNAIL_ENGINE '{name}', choose one of {', '.join(IMAGE_ENGINES)}")
+    return IMAGE_ENGINES[name]()
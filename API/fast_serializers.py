@@ -0,0 +1,58 @@
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from API.models import GeneratedImage
+
+# Columns of StoredImage and GeneratedImage read by serialize_images
+IMAGE_VALUES = ('id', 'file')
+THUMBNAIL_VALUES = ('source_image_id', 'id', 'type', 'slug', 'expire_date', 'created', 'status')
+
+_datetime_field = serializers.DateTimeField()
+
+
+def get_thumbnail_rows(image_ids):
+    """
+    Returns values of thumbnails of images, ordered by id, in order of THUMBNAIL_VALUES
+    """
+    return GeneratedImage.objects.filter(source_image_id__in=image_ids).order_by('id') \
+        .values_list(*THUMBNAIL_VALUES)
+
+
+def get_file_url_builder(request):
+    """
+    Returns function building absolute url of file of StoredImage, same as returned by serializer file field.
+    Urls of files in file system storage only differ by name, so their prefix is built once.
+    """
+    if isinstance(default_storage, FileSystemStorage):
+        prefix = request.build_absolute_uri(default_storage.url(''))
+        return lambda name: prefix + filepath_to_uri(name).lstrip('/')
+    return lambda name: request.build_absolute_uri(default_storage.url(name))
+
+
+def serialize_images(images, thumbnail_rows, request):
+    """
+    Builds representation of images and their thumbnails, equal to StoredImageSerializer output, without
+    instantiating models or serializer fields. Prefixes of urls are built once per call.
+    :param images: dicts with IMAGE_VALUES of StoredImage objects
+    :param thumbnail_rows: tuples with THUMBNAIL_VALUES of their GeneratedImage objects
+    :param request: request urls are built for
+    :return: list of dicts
+    """
+    file_url = get_file_url_builder(request)
+    image_url_prefix = request.build_absolute_uri(request.get_host() + '/i/')
+    to_datetime = _datetime_field.to_representation
+
+    thumbnails = {image['id']: [] for image in images}
+    for source_image_id, thumbnail_id, thumbnail_type, slug, expire_date, created, status in thumbnail_rows:
+        thumbnails[source_image_id].append({
+            'id': thumbnail_id,
+            'type': thumbnail_type,
+            'image_url': image_url_prefix + slug + '/',
+            'expire_date': to_datetime(expire_date) if expire_date else None,
+            'created': to_datetime(created) if created else None,
+            'status': status,
+        })
+    return [{'id': image['id'],
+             'file': file_url(image['file']) if image['file'] else None,
+             'thumbnails': thumbnails[image['id']]}
+            for image in images]
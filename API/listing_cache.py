@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from API.models import StoredImage
+
+VERSION_KEY_PREFIX = 'api:listing:version:'
+PAYLOAD_KEY_PREFIX = 'api:listing:payload:'
+
+# Images of thumbnails changed inside collect_listing_changes block of current thread
+_collected = threading.local()
+
+
+def get_listing_cache():
+    """
+    Returns cache selected by LISTING_CACHE_BACKEND, or None if listing cache is disabled
+    """
+    alias = settings.LISTING_CACHE_BACKEND
+    return caches[alias] if alias else None
+
+
+def get_listing_version(owner_id):
+    """
+    Returns version of images of user, changed whenever any of his images or thumbnails changes.
+    Missing version is seeded from clock, so it never repeats version evicted from cache.
+    :param owner_id: id of APIUserProfile
+    """
+    cache = get_listing_cache()
+    key = VERSION_KEY_PREFIX + str(owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_listing_versions(owner_ids):
+    cache = get_listing_cache()
+    for owner_id in owner_ids:
+        key = VERSION_KEY_PREFIX + str(owner_id)
+        if not cache.add(key, time.time_ns(), timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Evicted meanwhile
+                cache.add(key, time.time_ns(), timeout=None)
+
+
+def mark_owners_changed(owner_ids):
+    """
+    Changes versions of images of users once current transaction commits, so responses cached under new
+    version are built from committed data
+    :param owner_ids: ids of APIUserProfile objects
+    """
+    if get_listing_cache() is None:
+        return
+    owner_ids = set(owner_ids)
+    if owner_ids:
+        transaction.on_commit(lambda: bump_listing_versions(owner_ids))
+
+
+def mark_images_changed(image_ids):
+    """
+    Changes versions of owners of images, once current transaction commits. Inside collect_listing_changes block
+    images are collected, and their owners are looked up with single query at the end of the block.
+    :param image_ids: ids of StoredImage objects
+    """
+    if get_listing_cache() is None:
+        return
+    collected = getattr(_collected, 'image_ids', None)
+    if collected is not None:
+        collected.update(image_ids)
+        return
+    mark_owners_changed(StoredImage.objects.filter(id__in=set(image_ids)).values_list('owner_id', flat=True))
+
+
+@contextmanager
+def collect_listing_changes():
+    """
+    Collects images of thumbnails changed inside the block, like thumbnails deleted by reaper, so their owners
+    are looked up with single query instead of one query per thumbnail
+    """
+    if getattr(_collected, 'image_ids', None) is not None:
+        yield
+        return
+    _collected.image_ids = set()
+    try:
+        yield
+        image_ids = _collected.image_ids
+    finally:
+        _collected.image_ids = None
+    if image_ids:
+        mark_images_changed(image_ids)
+
+
+def get_payload_key(request, owner_id, version, *parts):
+    """
+    Returns key of serialized response, specific to version of images of user, and to request host, scheme,
+    path with query (like cursor of page) and negotiated media type, which all affect the response
+    """
+    variant = '\n'.join([request.build_absolute_uri(), getattr(request, 'accepted_media_type', ''),
+                         *(str(part) for part in parts)])
+    return f'{PAYLOAD_KEY_PREFIX}{owner_id}:{version}:{hashlib.md5(variant.encode("utf-8")).hexdigest()}'
+
+
+def get_etag(payload_key):
+    # Key identifies version and variant of response, so it is a strong validator
+    return '"%s"' % hashlib.md5(payload_key.encode('utf-8')).hexdigest()
+
+
+def get_cached_payload(payload_key):
+    return get_listing_cache().get(payload_key)
+
+
+def set_cached_payload(payload_key, data):
+    get_listing_cache().set(payload_key, data, settings.LISTING_CACHE_TTL_SECONDS)
@@ -0,0 +1,24 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API.thumbnails import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Renders thumbnails queued by image uploads. Runs until stopped, unless --once is passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process currently queued jobs and exit')
+        parser.add_argument('--poll-interval', type=float, default=settings.THUMBNAIL_WORKER_POLL_SECONDS,
+                            help='Seconds to wait before checking for new jobs when queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_jobs()
+            if processed:
+                self.stdout.write(f'Processed {processed} thumbnail jobs')
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API.reaper import reap_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired thumbnails, their files, source images left without thumbnails ' \
+           'and expired upload sessions. ' \
+           'Can be stopped at any time and run again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.REAPER_BATCH_SIZE,
+                            help='Number of thumbnails deleted in single transaction')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this number of batches, remaining thumbnails are deleted by next run')
+
+    def handle(self, *args, **options):
+        result = reap_expired(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        rate = result.thumbnails / result.seconds if result.seconds else 0
+        self.stdout.write(f'Deleted {result.thumbnails} expired thumbnails, {result.sources} source images '
+                          f'and {result.files} files in {result.batches} batches, '
+                          f'{result.seconds:.2f}s ({rate:.0f} thumbnails/s), '
+                          f'and {result.sessions} expired upload sessions')
@@ -0,0 +1,223 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Upper bounds of histogram buckets of stage durations, in seconds
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TOTAL_STAGE = 'total'
+
+# Timer of request handled in current thread or task, set by StageTimingMiddleware
+_current_timer = ContextVar('stage_timer', default=None)
+
+_metrics_lock = threading.Lock()
+_histograms = {}                # (endpoint, stage) -> Histogram
+_counters = defaultdict(int)    # (name, label value) -> value
+
+
+class Histogram:
+    """
+    Counts of observed values falling into buckets, with their sum, like Prometheus histogram
+    """
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one counts values above all buckets
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        :return: list of tuples of bucket upper bound and number of values up to it, ending with '+Inf'
+        """
+        counts = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+
+class StageTimer:
+    """
+    Measures time spent in named stages of single request. Stages can be nested, time of nested stage is
+    not counted into enclosing one, so durations of all stages add up to at most total time of request.
+    Stages entered many times are summed.
+    """
+    def __init__(self):
+        self.endpoint = None  # set by view measured as endpoint, timings of other requests are dropped
+        self.durations = {}   # stage: seconds, in order stages were first entered
+        self._stack = []      # [stage, time it was entered or resumed]
+        self._started = time.perf_counter()
+
+    def _add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            self._add(self._stack[-1][0], now - self._stack[-1][1])
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self._add(name, now - started)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def finish(self):
+        self.durations[TOTAL_STAGE] = time.perf_counter() - self._started
+
+    def header(self):
+        """
+        :return: value of Server-Timing header, durations in milliseconds
+        """
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.durations.items())
+
+
+@contextmanager
+def stage(name):
+    """
+    Measures code run inside as stage of request handled in current thread, does nothing outside of requests.
+    Code run in render pool is counted into stage which waits for it.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit()
+
+
+def timed_endpoint(endpoint):
+    """
+    Decorator of view method, marking requests handled by it to have their stages timed as given endpoint
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            timer = _current_timer.get()
+            if timer is not None:
+                timer.endpoint = endpoint
+            return method(view, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def start_timer():
+    """
+    Starts timer of request handled inside, stages are recorded in it
+    :return: StageTimer
+    """
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+        timer.finish()
+
+
+def observe_stages(timer):
+    """
+    Adds durations of stages of timed endpoint to histograms
+    """
+    with _metrics_lock:
+        for name, seconds in timer.durations.items():
+            key = (timer.endpoint, name)
+            if key not in _histograms:
+                _histograms[key] = Histogram()
+            _histograms[key].observe(seconds)
+
+
+def increment(name, value=1, label=None):
+    """
+    Increases counter, see COUNTERS
+    :param label: value of label of counter, if it has one
+    """
+    with _metrics_lock:
+        _counters[(name, label)] += value
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# Name, help text and name of label of counters
+COUNTERS = [
+    ('thumbnails_rendered', 'Thumbnails rendered and saved to storage', None),
+    ('bytes_written', 'Bytes of images written to storage', 'kind'),
+]
+METRIC_PREFIX = 'imageupload_'
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def get_cache_stats():
+    """
+    :return: dict of cache name: dict with hits and misses, of caches kept by this process
+    """
+    # Imported here, so this module can be imported by modules these caches depend on
+    from API.authentication import profile_cache, token_cache, user_cache
+    from API.plans import plan_cache
+    from img.resolver import get_resolver
+
+    stats = {'slug': get_resolver().stats()}
+    for name, cache in (('token', token_cache), ('user', user_cache), ('profile', profile_cache),
+                        ('plan', plan_cache)):
+        stats[name] = {'hits': cache.hits, 'misses': cache.misses}
+    return stats
+
+
+def render_metrics():
+    """
+    Returns metrics collected by this process in Prometheus text format
+    """
+    lines = []
+    name = f'{METRIC_PREFIX}stage_duration_seconds'
+    lines += [f'# HELP {name} Time spent in stages of requests', f'# TYPE {name} histogram']
+    with _metrics_lock:
+        for (endpoint, stage_name), histogram in sorted(_histograms.items()):
+            for bound, count in histogram.cumulative_counts():
+                lines.append(f'{name}_bucket{_labels(endpoint=endpoint, stage=stage_name, le=bound)} {count}')
+            lines.append(f'{name}_sum{_labels(endpoint=endpoint, stage=stage_name)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{_labels(endpoint=endpoint, stage=stage_name)} {histogram.count}')
+        counters = dict(_counters)
+
+    for counter, help_text, label_name in COUNTERS:
+        name = f'{METRIC_PREFIX}{counter}_total'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        values = sorted((label, value) for (key, label), value in counters.items() if key == counter)
+        if not values and label_name is None:
+            values = [(None, 0)]
+        for label, value in values:
+            lines.append(f'{name}{_labels(**{label_name: label}) if label_name else ""} {value}')
+
+    cache_stats = get_cache_stats()
+    for kind in ('hits', 'misses'):
+        name = f'{METRIC_PREFIX}cache_{kind}_total'
+        lines += [f'# HELP {name} Lookups of in-process caches which {"found" if kind == "hits" else "missed"} '
+                  f'entry', f'# TYPE {name} counter']
+        lines += [f'{name}{_labels(cache=cache)} {stats[kind]}' for cache, stats in cache_stats.items()]
+    name = f'{METRIC_PREFIX}cache_hit_ratio'
+    lines += [f'# HELP {name} Share of lookups of in-process caches which found entry', f'# TYPE {name} gauge']
+    for cache, stats in cache_stats.items():
+        lookups = stats['hits'] + stats['misses']
+        lines.append(f'{name}{_labels(cache=cache)} {stats["hits"] / lookups if lookups else 0:.4f}')
+    return '\n'.join(lines) + '\n'
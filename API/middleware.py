@@ -0,0 +1,88 @@
+import asyncio
+from django.conf import settings
+from API.metrics import observe_stages, start_timer
+from API.query_budget import QueryRecorder, RequestQueries, get_view_budget, report_problems, \
+                             request_queries_recorded
+
+
+class SyncAndAsyncMiddleware:
+    """
+    Base of middleware handling requests in mode of its handler: sync requests served by WSGI with handle,
+    and async requests served by ASGI with ahandle, so async requests do not switch threads in it
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Marks instance as coroutine function, so it is awaited by Django, like MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.ahandle(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def ahandle(self, request):
+        raise NotImplementedError
+
+
+class StageTimingMiddleware(SyncAndAsyncMiddleware):
+    """
+    Times stages of requests to views marked with timed_endpoint. Durations are added to histograms exposed
+    by /api/metrics/, and sent in Server-Timing header when SERVER_TIMING_HEADER is set.
+    """
+    def handle(self, request):
+        with start_timer() as timer:
+            response = self.get_response(request)
+        return self.add_timings(timer, response)
+
+    async def ahandle(self, request):
+        # Timer is copied to threads running sync code of request, along with other context variables
+        with start_timer() as timer:
+            response = await self.get_response(request)
+        return self.add_timings(timer, response)
+
+    @staticmethod
+    def add_timings(timer, response):
+        if timer.endpoint is not None:
+            observe_stages(timer)
+            if settings.SERVER_TIMING_HEADER:
+                response['Server-Timing'] = timer.header()
+        return response
+
+
+class QueryBudgetMiddleware(SyncAndAsyncMiddleware):
+    """
+    Records queries of each request when QUERY_BUDGET_MODE is set, and reports requests exceeding budget
+    declared on their view with query_budget, or running the same query QUERY_REPEAT_THRESHOLD times or more
+    """
+    def handle(self, request):
+        if settings.QUERY_BUDGET_MODE is None:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    async def ahandle(self, request):
+        if settings.QUERY_BUDGET_MODE is None:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        with recorder.record_threads():
+            response = await self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    def report(self, request, recorder):
+        resolver_match = getattr(request, 'resolver_match', None)
+        view, budget = get_view_budget(resolver_match.func, request.method) if resolver_match else (None, None)
+        request_queries = RequestQueries(request.method, request.path, view, budget, recorder.queries)
+        request_queries_recorded.send(sender=self.__class__, request_queries=request_queries)
+        report_problems(request_queries)
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0002_thumbnail_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generatedimage',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=15, unique=True),
+        ),
+    ]
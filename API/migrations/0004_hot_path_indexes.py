@@ -0,0 +1,28 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0003_unique_generated_image_slug'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedimage',
+            index=models.Index(condition=models.Q(('expire_date__isnull', False)), fields=['expire_date'], name='generatedimage_expiring_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storedimage',
+            index=models.Index(fields=['owner', 'id'], name='storedimage_owner_id_idx'),
+        ),
+        # Single column index of owner is replaced by storedimage_owner_id_idx, which is created first
+        migrations.AlterField(
+            model_name='storedimage',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='API.apiuserprofile'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttypepermissions',
+            name='lazy_thumbnails',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='generatedimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('deferred', 'Deferred')], default='ready', max_length=10),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:05
+
+import API.utils
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0005_lazy_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.ImageField(height_field='height', upload_to=API.utils.blob_directory_path, width_field='width')),
+                ('height', models.PositiveIntegerField(blank=True)),
+                ('width', models.PositiveIntegerField(blank=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='generatedimage',
+            name='modified_image',
+            field=models.ImageField(blank=True, max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='storedimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='images', to='API.imageblob'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:09
+
+import API.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0006_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imageblob',
+            name='file',
+            field=models.FileField(upload_to=API.utils.blob_directory_path),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.9 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0008_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedimage',
+            index=models.Index(condition=models.Q(('expire_date__isnull', False)), fields=['id', 'expire_date'], name='generatedimage_expiring_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.9 on 2026-10-18 20:19
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0009_expiring_thumbnail_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttypepermissions',
+            name='avif_quality',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='accounttypepermissions',
+            name='webp_quality',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,8 +1,10 @@
 import os
+import uuid
 from django.core.validators import MaxValueValidator
 from django.db import models
 from django.contrib.auth.models import User
-from .utils import user_directory_path, set_generated_image_model_slug_and_expire_date
+from .utils import user_directory_path, blob_directory_path, set_generated_image_model_slug_and_expire_date, \
+                   save_with_unique_slug
 from .custom_validators import MinValueValidatorIgnoreNull, MaxValueValidatorIgnoreNull, \
                                validate_image_type
 
@@ -33,6 +35,11 @@ class AccountTypePermissions(models.Model):
     create_original_img_link_perm = models.BooleanField(default=False)
     create_custom_sized_thumbnail_perm = models.BooleanField(default=False)
     create_time_limited_link_perm = models.BooleanField(default=False)
+    # Thumbnails are rendered when first viewed, instead of during upload
+    lazy_thumbnails = models.BooleanField(default=False)
+    # Quality of WebP and AVIF variants of thumbnails, THUMBNAIL_VARIANT_QUALITY is used when not set
+    webp_quality = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MaxValueValidator(100)])
+    avif_quality = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MaxValueValidator(100)])
     custom_size = models.ManyToManyField(CustomThumbnailSize, blank=True,
                                          default=None)
 
@@ -53,11 +60,31 @@ class APIUserProfile(models.Model):
         return f'{self.user.username}'
 
 
+class ImageBlob(models.Model):
+    """
+    Uploaded image content, stored once no matter how many times it was uploaded.
+    File is named after sha256 hash of its content, so thumbnails rendered from it are shared as well.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    # Dimensions are set when blob is created, from image header read during upload
+    file = models.FileField(upload_to=blob_directory_path)
+    height = models.PositiveIntegerField(blank=True)
+    width = models.PositiveIntegerField(blank=True)
+    refcount = models.PositiveIntegerField(default=0)  # number of StoredImage objects using blob
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.sha256}'
+
+
 class StoredImage(models.Model):
     """
     Data on image uploaded by user
     """
-    owner = models.ForeignKey(APIUserProfile, on_delete=models.CASCADE)
+    # Lookups by owner use storedimage_owner_id_idx index, declared in Meta
+    owner = models.ForeignKey(APIUserProfile, on_delete=models.CASCADE, db_index=False)
+    # File of image uploaded with blob is blob file. Images uploaded before blobs were introduced have none
+    blob = models.ForeignKey(ImageBlob, null=True, blank=True, related_name='images', on_delete=models.PROTECT)
     img_height = models.PositiveIntegerField(blank=True)
     img_width = models.PositiveIntegerField(blank=True)
     file = models.ImageField(height_field='img_height',
@@ -65,6 +92,12 @@ class StoredImage(models.Model):
                              upload_to=user_directory_path,
                              validators=[validate_image_type])
 
+    class Meta:
+        indexes = [
+            # Listing images of user ordered by id, and finding his latest image
+            models.Index(fields=['owner', 'id'], name='storedimage_owner_id_idx'),
+        ]
+
     def __str__(self):
         return f'{os.path.basename(self.file.name)}'
 
@@ -73,9 +106,21 @@ class GeneratedImage(models.Model):
     """
     Data on images generated using source image and thumbnail sizes permissions
     """
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_DEFERRED = 'deferred'  # rendered on first view
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_DEFERRED, 'Deferred'),
+    ]
+
     source_image = models.ForeignKey(StoredImage, related_name='thumbnails', on_delete=models.PROTECT)
-    modified_image = models.ImageField(blank=True)
-    slug = models.SlugField(max_length=15, blank=True)
+    # Url of thumbnail, which includes name of blob file and thumbnail options
+    modified_image = models.ImageField(blank=True, max_length=255)
+    slug = models.SlugField(max_length=15, blank=True, unique=True)
     expire_time = models.IntegerField(default=None, blank=True, null=True, validators=[
         MinValueValidatorIgnoreNull(300),
         MaxValueValidatorIgnoreNull(30000)
@@ -83,6 +128,20 @@ class GeneratedImage(models.Model):
     expire_date = models.DateTimeField(blank=True, null=True)  # checked when img is accessed
     type = models.CharField(max_length=100)
     created = models.DateTimeField(auto_now=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_READY)
+    # Urls of thumbnail encoded in other formats, like {'webp': url}. Empty url means variant is not smaller
+    # than thumbnail, and thumbnail is sent instead
+    variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only time limited thumbnails have expire date, partial index skips all other rows
+            models.Index(fields=['expire_date'], name='generatedimage_expiring_idx',
+                         condition=models.Q(expire_date__isnull=False)),
+            # Reaper walks time limited thumbnails in order of id
+            models.Index(fields=['id', 'expire_date'], name='generatedimage_expiring_id_idx',
+                         condition=models.Q(expire_date__isnull=False)),
+        ]
 
     def __str__(self):
         return f'{self.id}'
@@ -92,5 +151,53 @@ class GeneratedImage(models.Model):
         In addition to standard save procedure, generate unique slug
         used for URL and set expire_date if expire_time is set
         """
+        slug_generated = not self.slug
         set_generated_image_model_slug_and_expire_date(self)
-        super().save(*args, **kwargs)
+        if slug_generated:
+            # Generated slug is replaced, if it turns out to collide with existing one
+            save_with_unique_slug(lambda: super(GeneratedImage, self).save(*args, **kwargs), [self])
+        else:
+            super().save(*args, **kwargs)
+
+
+class ThumbnailJob(models.Model):
+    """
+    Queued rendering of pending thumbnails of source image,
+    processed by process_thumbnails management command
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    source_image = models.ForeignKey(StoredImage, related_name='thumbnail_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.id}'
+
+
+class UploadSession(models.Model):
+    """
+    Resumable upload of single image, received in chunks. Chunks are appended to file in UPLOAD_SESSION_ROOT
+    directory, which is turned into StoredImage when session is finalized.
+    Session not finalized before expire_date is deleted with its file.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(APIUserProfile, related_name='upload_sessions', on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)  # number of bytes received so far
+    created = models.DateTimeField(auto_now_add=True)
+    expire_date = models.DateTimeField(db_index=True)  # moved forward by each received chunk
+
+    def __str__(self):
+        return f'{self.id}'
@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class StoredImageCursorPagination(CursorPagination):
+    """
+    Pages of images of user, ordered by id. Cursor points to id of last image of previous page, so every page
+    is fetched with index range scan, whatever its position in the list, and images uploaded meanwhile
+    do not shift pages. Page size can be chosen by page_size parameter, up to IMAGE_LIST_MAX_PAGE_SIZE.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.IMAGE_LIST_PAGE_SIZE
+        self.max_page_size = settings.IMAGE_LIST_MAX_PAGE_SIZE
@@ -0,0 +1,99 @@
+from collections import namedtuple
+from django.conf import settings
+from API.cache import TTLCache
+from API.models import AccountTypePermissions
+
+
+# Plans are dropped by signal handlers in API.signals when account type or its custom sizes change
+plan_cache = TTLCache(settings.THUMBNAIL_PLAN_CACHE_SIZE, settings.THUMBNAIL_PLAN_CACHE_TTL_SECONDS)
+
+
+class ThumbnailPlan(namedtuple('ThumbnailPlan', ['account_type_id', 'allow_200', 'allow_400', 'allow_original',
+                                                 'allow_time_limited', 'custom_sizes', 'lazy',
+                                                 'variant_qualities'])):
+    """
+    Immutable summary of AccountTypePermissions, deciding which thumbnails user is allowed to create.
+    custom_sizes is a tuple of side lengths of square custom thumbnails.
+    Thumbnails of lazy plans are rendered when first viewed.
+    variant_qualities is a tuple of (format, quality) pairs, overriding THUMBNAIL_VARIANT_QUALITY.
+    """
+    __slots__ = ()
+
+    def variant_quality(self, image_format):
+        """
+        Returns quality of thumbnail variants encoded in image_format, like 'webp'
+        """
+        return dict(self.variant_qualities).get(image_format) or settings.THUMBNAIL_VARIANT_QUALITY[image_format]
+
+    def upload_types(self, width, height):
+        """
+        Returns types of thumbnails created for uploaded image
+        :param width: width of uploaded image
+        :param height: height of uploaded image
+        :return: list of thumbnail types, like '200x200'
+        """
+        thumbnail_types = []
+        if self.allow_200:
+            thumbnail_types.append('200x200')
+        if self.allow_400:
+            thumbnail_types.append('400x400')
+        if self.allow_original:
+            thumbnail_types.append(f'{width}x{height}')
+            # Custom sized thumbnails are created along with original image link
+            thumbnail_types.extend(f'{size}x{size}' for size in self.custom_sizes)
+        return thumbnail_types
+
+    def allows_time_limited(self, img_type):
+        """
+        Checks if time limited thumbnail of passed type can be created
+        :param img_type: side length of square thumbnail, like '200'
+        """
+        if not self.allow_time_limited:
+            return False
+        try:
+            size = int(img_type)
+        except (TypeError, ValueError):
+            return False
+        if size == 200:
+            return self.allow_200
+        if size == 400:
+            return self.allow_400
+        return size in self.custom_sizes
+
+
+# Plan of profile without account type, which does not allow to create any thumbnails
+EMPTY_PLAN = ThumbnailPlan(account_type_id=None, allow_200=False, allow_400=False, allow_original=False,
+                           allow_time_limited=False, custom_sizes=(), lazy=False, variant_qualities=())
+
+
+def compile_plan(account_type):
+    """
+    Builds ThumbnailPlan of AccountTypePermissions object
+    """
+    custom_sizes = sorted({custom_size.size for custom_size in account_type.custom_size.all()})
+    return ThumbnailPlan(account_type_id=account_type.id,
+                         allow_200=account_type.create_200px_thumbnail_perm,
+                         allow_400=account_type.create_400px_thumbnail_perm,
+                         allow_original=account_type.create_original_img_link_perm,
+                         allow_time_limited=account_type.create_time_limited_link_perm,
+                         custom_sizes=tuple(custom_sizes),
+                         lazy=account_type.lazy_thumbnails,
+                         variant_qualities=tuple((image_format, quality) for image_format, quality
+                                                 in (('webp', account_type.webp_quality),
+                                                     ('avif', account_type.avif_quality))
+                                                 if quality is not None))
+
+
+def get_thumbnail_plan(account_type_id):
+    """
+    Returns cached ThumbnailPlan of account type, compiling it when missing
+    :param account_type_id: id of AccountTypePermissions, or None
+    """
+    if account_type_id is None:
+        return EMPTY_PLAN
+    plan = plan_cache.get(account_type_id)
+    if plan is None:
+        account_type = AccountTypePermissions.objects.prefetch_related('custom_size').get(id=account_type_id)
+        plan = compile_plan(account_type)
+        plan_cache.set(account_type_id, plan)
+    return plan
@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+import time
+import traceback
+from collections import defaultdict, namedtuple
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+RecordedQuery = namedtuple('RecordedQuery', ['sql', 'shape', 'duration', 'stack'])
+# Queries of single request, view which handled it and its budget (None when not declared)
+RequestQueries = namedtuple('RequestQueries', ['method', 'path', 'view', 'budget', 'queries'])
+
+# Sent with RequestQueries of every request checked by QueryBudgetMiddleware, before problems are reported
+request_queries_recorded = Signal()
+
+# Recorder of async request handled in current context, entered by threads running its sync code
+_current_recorder = ContextVar('query_recorder', default=None)
+
+# Transaction control statements are counted, but not reported as repeated
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT', 'ROLLBACK')
+STACK_FRAMES = 8  # innermost frames of project code kept with each query
+
+_placeholder_list = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_values_rows = re.compile(r'VALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))*')
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r'\b\d+(?:\.\d+)?\b')
+_whitespace = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """
+    Decorator of view method or function, declaring number of queries a single request to it may run
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def normalize_sql(sql):
+    """
+    Returns shape of SQL statement, the same for statements which differ only in parameters, lengths of IN lists
+    or numbers of inserted rows
+    """
+    shape = _values_rows.sub(r'VALUES \1, ...', sql)
+    shape = _placeholder_list.sub('(%s, ...)', shape)
+    shape = _string_literal.sub('?', shape)
+    shape = _number_literal.sub('?', shape)
+    return _whitespace.sub(' ', shape).strip()
+
+
+def get_project_stack():
+    """
+    :return: innermost frames of project code calling current function, formatted, outermost first
+    """
+    frames = [frame for frame in traceback.extract_stack()[:-2]
+              if frame.filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in frame.filename
+              and frame.filename != __file__]
+    return tuple(f'{os.path.relpath(frame.filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}'
+                 for frame in frames[-STACK_FRAMES:])
+
+
+class QueryRecorder:
+    """
+    Records SQL statements executed on database connections of current thread, with their shapes, durations
+    and stacks of project code which executed them
+    """
+    def __init__(self, capture_stacks=True):
+        self.capture_stacks = capture_stacks
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(RecordedQuery(sql, normalize_sql(sql), time.perf_counter() - start,
+                                              get_project_stack() if self.capture_stacks else ()))
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @contextmanager
+    def record_threads(self):
+        """
+        Records queries of sync code of async request handled inside, run in other threads by
+        API.async_views.run_sync
+        """
+        token = _current_recorder.set(self)
+        try:
+            yield self
+        finally:
+            _current_recorder.reset(token)
+
+
+@contextmanager
+def record_thread_queries():
+    """
+    Records queries run inside, in current thread, by recorder of async request which started the code, if any
+    """
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.record():
+        yield
+
+
+def find_repeated_queries(queries, threshold):
+    """
+    Finds queries of the same shape executed at least threshold times, a sign of query run in a loop (N+1)
+    :return: dict of shape: list of RecordedQuery
+    """
+    by_shape = defaultdict(list)
+    for query in queries:
+        if not query.shape.upper().startswith(TRANSACTION_STATEMENTS):
+            by_shape[query.shape].append(query)
+    return {shape: repeated for shape, repeated in by_shape.items() if len(repeated) >= threshold}
+
+
+def get_view_budget(view_func, method):
+    """
+    Finds budget declared with query_budget on view function, method of class based view or action of viewset
+    handling request method
+    :return: tuple of name of view and its budget, or None
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return view_func.__qualname__, getattr(view_func, 'query_budget', None)
+    actions = getattr(view_func, 'actions', None)
+    handler_name = actions.get(method.lower()) if actions else method.lower()
+    handler = getattr(view_class, handler_name or '', None)
+    return f'{view_class.__name__}.{handler_name or method.lower()}', getattr(handler, 'query_budget', None)
+
+
+def format_stack(stack):
+    return ''.join(f'\n        {frame}' for frame in stack)
+
+
+def get_problems(request_queries, repeat_threshold):
+    """
+    :return: list of descriptions of exceeded budget and repeated queries of request, with stack traces
+    """
+    problems = []
+    queries = request_queries.queries
+    if request_queries.budget is not None and len(queries) > request_queries.budget:
+        listed = ''.join(f'\n    {query.shape}{format_stack(query.stack)}' for query in queries)
+        problems.append(f'{len(queries)} queries run, budget is {request_queries.budget}:{listed}')
+    for shape, repeated in find_repeated_queries(queries, repeat_threshold).items():
+        problems.append(f'query run {len(repeated)} times: {shape}{format_stack(repeated[0].stack)}')
+    return problems
+
+
+def report_problems(request_queries):
+    """
+    Logs problems of request with stack traces, or raises QueryBudgetExceeded, depending on QUERY_BUDGET_MODE
+    """
+    problems = get_problems(request_queries, settings.QUERY_REPEAT_THRESHOLD)
+    if not problems:
+        return
+    message = f'{request_queries.method} {request_queries.path} ({request_queries.view}): ' + '\n'.join(problems)
+    if settings.QUERY_BUDGET_MODE == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
+from easy_thumbnails.models import Source, Thumbnail
+from API.blobs import delete_files_on_commit
+from API.listing_cache import collect_listing_changes
+from API.models import GeneratedImage, StoredImage
+from API.resumable import reap_upload_sessions
+from API.utils import get_storage_name
+
+logger = logging.getLogger(__name__)
+
+ReapResult = namedtuple('ReapResult', ['thumbnails', 'sources', 'files', 'batches', 'seconds', 'sessions'])
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def release_sources(source_ids):
+    """
+    Deletes source images which have no thumbnails left. Files of source images stored in blobs are deleted
+    once blob is not used by other source images, files of older source images are deleted on commit,
+    along with files of all thumbnails rendered from them by easy_thumbnails.
+    :param source_ids: ids of StoredImage objects which could be left without thumbnails
+    :return: tuple of numbers of deleted source images and files
+    """
+    orphans = list(StoredImage.objects.filter(id__in=source_ids, thumbnails__isnull=True))
+    if not orphans:
+        return 0, 0
+    names = [source.file.name for source in orphans if source.blob_id is None]
+    thumbnail_names = list(Thumbnail.objects.filter(source__name__in=names).values_list('name', flat=True))
+    deleted_files = delete_files_on_commit(names + thumbnail_names)
+    Source.objects.filter(name__in=names).delete()
+
+    # Deleted with single query, while post_delete handler releasing blob receives objects from the list
+    collector = Collector(using=StoredImage.objects.db)
+    collector.collect(orphans)
+    collector.delete()
+    deleted_files += sum(getattr(source, 'released_files', 0) for source in orphans)
+    return len(orphans), deleted_files
+
+
+def reap_batch(now, last_id, batch_size):
+    """
+    Deletes single batch of thumbnails which expired before now, with id larger than last_id.
+    Rows are locked and rows locked by other reapers are skipped, so reapers can run in multiple processes.
+    Files are deleted once batch commits, so rows of batch rolled back keep their files.
+    :return: tuple of id of last row in batch (None when there was nothing to delete), and numbers of deleted
+             thumbnails, source images and files
+    """
+    with transaction.atomic(), collect_listing_changes():
+        rows = list(GeneratedImage.objects.select_for_update(skip_locked=True)
+                    .filter(expire_date__lte=now, id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', 'modified_image', 'source_image_id', 'variants')[:batch_size])
+        if not rows:
+            return None, 0, 0, 0
+        ids = [row[0] for row in rows]
+        image_urls = {row[1] for row in rows if row[1]}
+
+        # Files can be shared with thumbnails that did not expire, rendered from the same source and size,
+        # along with variants encoded from them
+        shared_urls = set(GeneratedImage.objects.filter(modified_image__in=image_urls).exclude(id__in=ids)
+                          .values_list('modified_image', flat=True))
+        variant_urls = {url for row in rows if row[1] not in shared_urls for url in row[3].values() if url}
+        names = [get_storage_name(url) for url in (image_urls - shared_urls) | variant_urls]
+        deleted_files = delete_files_on_commit(names)
+        Thumbnail.objects.filter(name__in=names).delete()
+
+        deleted_thumbnails = GeneratedImage.objects.filter(id__in=ids).delete()[1].get(GeneratedImage._meta.label, 0)
+        deleted_sources, deleted_source_files = release_sources({row[2] for row in rows})
+    return ids[-1], deleted_thumbnails, deleted_sources, deleted_files + deleted_source_files
+
+
+def reap_expired(batch_size=None, max_batches=None):
+    """
+    Deletes expired thumbnails and their files in batches of batch_size rows, walking rows in order of id.
+    Source images left without thumbnails and expired upload sessions are deleted as well.
+    :param batch_size: number of thumbnails deleted in single transaction, REAPER_BATCH_SIZE by default
+    :param max_batches: number of batches after which reaper stops, remaining rows are deleted by next run
+    :return: ReapResult
+    """
+    batch_size = batch_size or settings.REAPER_BATCH_SIZE
+    now = timezone.now()
+    started = time.monotonic()
+    last_id = 0
+    thumbnails = sources = files = batches = 0
+    while max_batches is None or batches < max_batches:
+        last_id, batch_thumbnails, batch_sources, batch_files = reap_batch(now, last_id, batch_size)
+        if last_id is None:
+            break
+        batches += 1
+        thumbnails += batch_thumbnails
+        sources += batch_sources
+        files += batch_files
+    sessions = reap_upload_sessions(now)
+    return ReapResult(thumbnails, sources, files, batches, time.monotonic() - started, sessions)
+
+
+def _run_scheduler(interval, stop_event):
+    while not stop_event.wait(interval):
+        try:
+            result = reap_expired()
+            if result.thumbnails:
+                logger.info('Reaped %d expired thumbnails and %d source images', result.thumbnails, result.sources)
+        except Exception:
+            logger.exception('Reaping expired thumbnails failed')
+
+
+def start_reaper_scheduler():
+    """
+    Starts thread reaping expired thumbnails every REAPER_INTERVAL_SECONDS, when REAPER_SCHEDULER_ENABLED is set.
+    Thread is started once per process.
+    :return: event stopping the thread once set, or None if scheduler is disabled
+    """
+    global _scheduler
+    if not settings.REAPER_SCHEDULER_ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            stop_event = threading.Event()
+            thread = threading.Thread(target=_run_scheduler, args=(settings.REAPER_INTERVAL_SECONDS, stop_event),
+                                      name='thumbnail-reaper', daemon=True)
+            thread.start()
+            _scheduler = stop_event
+        return _scheduler
@@ -0,0 +1,150 @@
+import fcntl
+import hashlib
+import os
+import re
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+from API.models import UploadSession
+from API.upload_handlers import probe_image
+
+# Number of bytes read from request body or assembled file at once
+CHUNK_SIZE = 64 * 2 ** 10
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class AssembledUploadedFile(UploadedFile):
+    """
+    File assembled from chunks of upload session, with content hash, image format and size read like by
+    IngestingUploadHandler. File storage moves it to its place instead of copying, like temporary uploaded file.
+    """
+    def __init__(self, path, name, size):
+        super().__init__(open(path, 'rb'), name, None, size)
+        self.path = path
+        self.sha256 = None
+        self.image_format = None
+        self.image_size = None
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def get_session_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, f'{session.id}.part')
+
+
+def get_session_expire_date(now=None):
+    return (now or timezone.now()) + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+
+
+def parse_content_range(header):
+    """
+    Parses Content-Range header of received chunk, like 'bytes 0-1023/4096'
+    :return: tuple of first byte, last byte and size of whole file, or None if header is not valid
+    """
+    match = CONTENT_RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    start, end, total = (int(group) for group in match.groups())
+    if end < start or end >= total:
+        return None
+    return start, end, total
+
+
+def create_session(owner_id, file_name, size):
+    """
+    Starts upload session, with empty file chunks are appended to
+    :param owner_id: id of APIUserProfile of user uploading image
+    :return: UploadSession
+    """
+    session = UploadSession.objects.create(owner_id=owner_id, file_name=file_name, size=size,
+                                           expire_date=get_session_expire_date())
+    os.makedirs(settings.UPLOAD_SESSION_ROOT, exist_ok=True)
+    open(get_session_path(session), 'wb').close()
+    return session
+
+
+@contextmanager
+def lock_session_file(session):
+    """
+    Opens file of session, locked so that only one request at a time, in any process, writes, finalizes or
+    cancels the session. Database transaction is not held while slow client sends its chunk.
+    :return: context manager yielding opened file, or None when file is locked by other request or was deleted
+    """
+    try:
+        part_file = open(get_session_path(session), 'r+b')
+    except FileNotFoundError:
+        yield None
+        return
+    with part_file:
+        try:
+            fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield None
+            return
+        # Lock is released when file is closed
+        yield part_file
+
+
+def append_chunk(session, part_file, stream, length):
+    """
+    Writes chunk read from stream at offset of session, overwriting data left by previously interrupted chunk.
+    Chunk is written without loading it into memory. Offset and expire date of session are updated.
+    :param part_file: file of session, locked with lock_session_file
+    :param stream: file-like object, like request body
+    :param length: number of bytes of chunk
+    :return: number of bytes written, smaller than length if stream ended early
+    """
+    written = 0
+    part_file.seek(session.offset)
+    part_file.truncate()
+    while written < length and stream is not None:
+        data = stream.read(min(CHUNK_SIZE, length - written))
+        if not data:
+            break
+        part_file.write(data)
+        written += len(data)
+    part_file.flush()
+    session.offset += written
+    session.expire_date = get_session_expire_date()
+    # Session deleted meanwhile by reaper is not saved again
+    UploadSession.objects.filter(id=session.id).update(offset=session.offset, expire_date=session.expire_date)
+    return written
+
+
+def assemble_file(session):
+    """
+    Returns received file of complete session, hashed and probed for image header in single pass
+    :return: AssembledUploadedFile
+    """
+    file = AssembledUploadedFile(get_session_path(session), session.file_name, session.size)
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks(CHUNK_SIZE):
+        sha256.update(chunk)
+    file.sha256 = sha256.hexdigest()
+    file.image_format, file.image_size = probe_image(file)
+    return file
+
+
+def delete_session(session):
+    """
+    Deletes session and its file, unless the file was moved to file storage
+    """
+    path = get_session_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+    session.delete()
+
+
+def reap_upload_sessions(now=None):
+    """
+    Deletes sessions which were not finalized before their expire date
+    :return: number of deleted sessions
+    """
+    expired = list(UploadSession.objects.filter(expire_date__lte=now or timezone.now()))
+    for session in expired:
+        delete_session(session)
+    return len(expired)
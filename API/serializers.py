@@ -1,5 +1,40 @@
-from API.models import StoredImage, GeneratedImage
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_image_file_extension
+from django.db import models
+from django.conf import settings
+from API.custom_validators import validate_image_name
+from API.models import StoredImage, GeneratedImage, UploadSession
 from rest_framework import serializers
+from rest_framework.fields import empty
+
+
+class IngestedImageField(serializers.ImageField):
+    """
+    Image field accepting files received by IngestingUploadHandler without opening them again with Pillow,
+    since their header was already read. Reports reason of rejection of file discarded by upload handler.
+    """
+    def validate_empty_values(self, data):
+        if data is empty or data is None or data == '':
+            request = self.context.get('request')
+            for rejection in getattr(request, 'upload_rejections', []):
+                if rejection.field_name == self.field_name:
+                    raise serializers.ValidationError(rejection.message)
+        return super().validate_empty_values(data)
+
+    def to_internal_value(self, data):
+        if getattr(data, 'image_format', None) is None:
+            return super().to_internal_value(data)
+        file = serializers.FileField.to_internal_value(self, data)
+        # Extension is checked the same way as by Django image field
+        try:
+            validate_image_file_extension(file)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return file
+
+
+# Model image fields are represented by IngestedImageField
+INGESTED_FIELD_MAPPING = {**serializers.ModelSerializer.serializer_field_mapping, models.ImageField: IngestedImageField}
 
 
 class GeneratedImageSerializer(serializers.ModelSerializer):
@@ -10,20 +45,23 @@ class GeneratedImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = GeneratedImage
-        fields = ['id', 'type', 'image_url', 'expire_date', 'created']
+        fields = ['id', 'type', 'image_url', 'expire_date', 'created', 'status']
 
     def get_image_url(self, generatedimage):
-        """ Gets urls for generated images"""
-        request = self.context.get('request')
-        slug = generatedimage.slug
-        image_url = request.get_host() + '/i/' + slug + '/'
-        return request.build_absolute_uri(image_url)
+        """ Gets urls for generated images, their common prefix is built once per request"""
+        prefix = self.context.get('image_url_prefix')
+        if prefix is None:
+            # Context is shared by nested serializers, so prefix is reused by all listed images
+            request = self.context.get('request')
+            prefix = self.context['image_url_prefix'] = request.build_absolute_uri(request.get_host() + '/i/')
+        return prefix + generatedimage.slug + '/'
 
 
 class StoredImageSerializer(serializers.ModelSerializer):
     """
     Displays info on all images and related thumbnails for specified user
     """
+    serializer_field_mapping = INGESTED_FIELD_MAPPING
     queryset = GeneratedImage.objects.all()
     thumbnails = GeneratedImageSerializer(queryset, many=True, read_only=True)
 
@@ -40,6 +78,7 @@ class TimeLimitedImageSerializer(serializers.ModelSerializer):
     When user sends expire_time and type fields with other data to serializer, those fields are used only in
     the view, to generate specified thumbnails.
     """
+    serializer_field_mapping = INGESTED_FIELD_MAPPING
     queryset = GeneratedImage.objects.all()
     expire_time = serializers.IntegerField(min_value=300, max_value=30000, read_only=True)
     type = serializers.IntegerField(min_value=50, max_value=4000, read_only=True)
@@ -48,3 +87,25 @@ class TimeLimitedImageSerializer(serializers.ModelSerializer):
         model = StoredImage
         fields = ['id', 'file', 'type', 'expire_time']
         read_only_fields = ['id']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Starts resumable upload of image of given name and size in bytes, and displays its progress
+    """
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'file_name', 'size', 'offset', 'expire_date']
+        read_only_fields = ['id', 'offset', 'expire_date']
+
+    def validate_file_name(self, value):
+        try:
+            validate_image_name(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Size must be between 1 and {settings.IMAGE_UPLOAD_MAX_SIZE} bytes.')
+        return value
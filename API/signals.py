@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from API.authentication import profile_cache, token_cache, user_cache
+from API.blobs import release_blob
+from API.listing_cache import mark_images_changed, mark_owners_changed
+from API.models import AccountTypePermissions, APIUserProfile, CustomThumbnailSize, GeneratedImage, StoredImage
+from API.plans import plan_cache
+
+
+@receiver([post_save, post_delete], sender=Token, dispatch_uid='api_token_changed')
+def token_changed(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='api_user_changed')
+def user_changed(sender, instance, **kwargs):
+    # Cached tokens of user are resolved again, because user is not cached anymore
+    user_cache.delete(instance.id)
+    profile_cache.delete(instance.id)
+
+
+@receiver([post_save, post_delete], sender=APIUserProfile, dispatch_uid='api_profile_changed')
+def profile_changed(sender, instance, **kwargs):
+    profile_cache.delete(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=AccountTypePermissions, dispatch_uid='api_account_type_changed')
+def account_type_changed(sender, instance, **kwargs):
+    plan_cache.delete(instance.id)
+
+
+@receiver([post_save, post_delete], sender=CustomThumbnailSize, dispatch_uid='api_custom_size_changed')
+def custom_size_changed(sender, instance, **kwargs):
+    # Size can be shared by many account types
+    plan_cache.clear()
+
+
+@receiver(m2m_changed, sender=AccountTypePermissions.custom_size.through, dispatch_uid='api_custom_sizes_changed')
+def custom_sizes_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Sizes were changed from CustomThumbnailSize side, which can affect any account type
+        plan_cache.clear()
+    else:
+        plan_cache.delete(instance.id)
+
+
+@receiver(post_delete, sender=StoredImage, dispatch_uid='api_stored_image_deleted')
+def stored_image_deleted(sender, instance, **kwargs):
+    # Number of deleted files is kept on instance, for code reporting deleted files
+    if instance.blob_id is not None:
+        instance.released_files = release_blob(instance.blob_id)
+
+
+@receiver([post_save, post_delete], sender=StoredImage, dispatch_uid='api_stored_image_listing_changed')
+def stored_image_listing_changed(sender, instance, **kwargs):
+    mark_owners_changed([instance.owner_id])
+
+
+@receiver([post_save, post_delete], sender=GeneratedImage, dispatch_uid='api_generated_image_listing_changed')
+def generated_image_listing_changed(sender, instance, **kwargs):
+    # Owner is known without query when thumbnail was created or loaded along with its image
+    source_image = GeneratedImage.source_image.field.get_cached_value(instance, None)
+    if source_image is not None:
+        mark_owners_changed([source_image.owner_id])
+    else:
+        mark_images_changed([instance.source_image_id])
@@ -1,6 +1,12 @@
 import os
 import shutil
 import pytest
+from django.test import override_settings
+from API.authentication import clear_auth_caches
+from API.metrics import reset_metrics
+from API.plans import plan_cache
+from API.query_budget import request_queries_recorded
+from img.resolver import get_resolver
 from ImageUploadAPI.settings import TEST_API_DIR, TESTS_MEDIA_DIR
 
 
@@ -17,3 +23,34 @@ def setup_and_teardown():
         directory = TESTS_MEDIA_DIR + '/' + folder
         print("Removing: " + directory)
         shutil.rmtree(directory)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    """Users, profiles, thumbnail plans, slugs and metrics of previous test are not visible in next one"""
+    clear_auth_caches()
+    plan_cache.clear()
+    get_resolver().clear()
+    reset_metrics()
+
+
+@pytest.fixture(autouse=True)
+def query_budgets():
+    """Requests running more queries than budget of their view, or repeating the same query, fail tests"""
+    with override_settings(QUERY_BUDGET_MODE='raise'):
+        yield
+
+
+@pytest.fixture
+def request_queries():
+    """
+    Records queries of every request sent during test
+    :return: list of RequestQueries, in order of requests
+    """
+    recorded = []
+
+    def record(sender, request_queries, **kwargs):
+        recorded.append(request_queries)
+    request_queries_recorded.connect(record, weak=False)
+    yield recorded
+    request_queries_recorded.disconnect(record)
@@ -6,11 +6,13 @@ from django.test import override_settings
 from rest_framework.authtoken.models import Token
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
-from API.models import CustomThumbnailSize, AccountTypePermissions, APIUserProfile, StoredImage, GeneratedImage
+from API.models import CustomThumbnailSize, AccountTypePermissions, APIUserProfile, StoredImage, GeneratedImage, \
+    ThumbnailJob
 from API.test.constants_tests import TEST_USER_LOGIN, TEST_USER_PASS, ENDPOINT_ALL, \
     CONTENT_TYPE_DEFAULT, MOCK_IMAGE_PATH, MOCK_WRONG_FILE_TYPE_PATH, TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, \
     CONTENT_TYPE_PNG, MOCK_ALT_IMAGE_PATH, TEST_PROFILE_TYPE_NAME
 from API.test.utils import db_data_preparation, create_test_client
+from API.thumbnails import process_pending_jobs
 
 
 pytestmark = pytest.mark.django_db  # all test functions are permitted to access test db
@@ -40,11 +42,12 @@ def test_all_endpoint_list():
     json_dict = json.loads(response.content)
 
     assert response.status_code == 200
-    assert len(json_dict) == 2
-    assert len(json_dict[0].keys()) == 3
-    assert len(json_dict[1].keys()) == 3
-    assert len(json_dict[0]['thumbnails'][0].keys()) == 5
-    assert len(json_dict[1]['thumbnails'][0].keys()) == 5
+    assert json_dict['next'] is None
+    assert len(json_dict['results']) == 2
+    assert len(json_dict['results'][0].keys()) == 3
+    assert len(json_dict['results'][1].keys()) == 3
+    assert len(json_dict['results'][0]['thumbnails'][0].keys()) == 6
+    assert len(json_dict['results'][1]['thumbnails'][0].keys()) == 6
 
 
 @override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
@@ -64,9 +67,9 @@ def test_all_endpoint_retrieve():
     get_json_dict = json.loads(get_response.content)
 
     assert get_response.status_code == 200
-    assert len(get_json_dict) == 1
-    assert len(get_json_dict[0].keys()) == 3
-    assert len(get_json_dict[0]['thumbnails'][0].keys()) == 5
+    assert len(get_json_dict['results']) == 1
+    assert len(get_json_dict['results'][0].keys()) == 3
+    assert len(get_json_dict['results'][0]['thumbnails'][0].keys()) == 6
 
 
 @override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
@@ -82,9 +85,53 @@ def test_all_endpoint_create():
     response = client.post(ENDPOINT_ALL, {'file': mock_image}, format='multipart')
     json_dict = json.loads(response.content.decode('utf8'))
 
-    assert response.status_code == 201
-    assert len(json.loads(response.content)) == 3
+    assert response.status_code == 202
+    assert len(json.loads(response.content)) == 4
     assert len(json_dict['thumbnails'].keys()) == 5
+    assert set(json_dict['thumbnails_status'].values()) == {GeneratedImage.STATUS_PENDING}
+    assert ThumbnailJob.objects.count() == 1
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_all_endpoint_create_without_queue():
+    """
+    Post image to /api/all/ with thumbnail queue disabled, thumbnails should be rendered during request
+    """
+    initial_data = db_data_preparation()
+    client = create_test_client(initial_data, authorize=True)
+    mock_image = SimpleUploadedFile(name=MOCK_IMAGE_PATH, content=open(MOCK_IMAGE_PATH, 'rb').read(),
+                                    content_type=CONTENT_TYPE_PNG)
+
+    response = client.post(ENDPOINT_ALL, {'file': mock_image}, format='multipart')
+    json_dict = json.loads(response.content.decode('utf8'))
+
+    assert response.status_code == 201
+    assert set(json_dict['thumbnails_status'].values()) == {GeneratedImage.STATUS_READY}
+    assert ThumbnailJob.objects.count() == 0
+    assert GeneratedImage.objects.filter(modified_image='').count() == 0
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_all_endpoint_retrieve_reports_thumbnail_status():
+    """
+    Thumbnails are reported as pending until thumbnail worker renders them
+    """
+    initial_data = db_data_preparation()
+    client = create_test_client(initial_data, authorize=True)
+    mock_image = SimpleUploadedFile(name=MOCK_IMAGE_PATH, content=open(MOCK_IMAGE_PATH, 'rb').read(),
+                                    content_type=CONTENT_TYPE_PNG)
+
+    post_response = client.post(ENDPOINT_ALL, {'file': mock_image}, format='multipart')
+    created_item_id = json.loads(post_response.content)['id']
+    pending_response = client.get(reverse('standard-detail', args=[created_item_id]))
+    process_pending_jobs()
+    ready_response = client.get(reverse('standard-detail', args=[created_item_id]))
+
+    pending_statuses = {item['status'] for item in json.loads(pending_response.content)['thumbnails']}
+    ready_statuses = {item['status'] for item in json.loads(ready_response.content)['thumbnails']}
+    assert pending_statuses == {GeneratedImage.STATUS_PENDING}
+    assert ready_statuses == {GeneratedImage.STATUS_READY}
+    assert ThumbnailJob.objects.count() == 0
 
 
 @override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
@@ -0,0 +1,83 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from rest_framework.authtoken.models import Token
+from API.models import GeneratedImage
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, MOCK_IMAGE_PATH
+from API.test.test_metrics import parse_server_timing
+from API.test.utils import db_data_preparation
+from API.utils import get_storage_name
+from ImageUploadAPI.asgi import application
+
+
+# Sync code of async requests runs in threads of request executor, with connections of their own
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def asgi_request(method, path, body=b'', headers=None, chunks=1):
+    """
+    Sends request to ASGI application, with body split into chunks
+    :return: tuple of status code, dict of headers, body of response and number of received body messages
+    """
+    size = -(-len(body) // chunks) or 1
+    messages = [{'type': 'http.request', 'body': body[start:start + size], 'more_body': start + size < len(body)}
+                for start in range(0, max(len(body), 1), size)]
+    received = []
+    sent = []
+
+    async def receive():
+        received.append(messages[len(received)])
+        return received[-1]
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'root_path': '',
+             'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 50000), 'scheme': 'http'}
+    async_to_sync(application)(scope, receive, send)
+    response_headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+    return sent[0]['status'], response_headers, b''.join(message.get('body', b'') for message in sent[1:]), \
+        len(received)
+
+
+def upload_body():
+    with open(MOCK_IMAGE_PATH, 'rb') as file:
+        return encode_multipart(BOUNDARY, {'file': file})
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file',
+                   THUMBNAIL_QUEUE_ENABLED=False)
+def test_upload_and_display_served_by_asgi(request_queries):
+    token = Token.objects.create(user=db_data_preparation()['test_user'])
+    body = upload_body()
+    headers = {'Authorization': f'Token {token.key}', 'Content-Type': MULTIPART_CONTENT,
+               'Content-Length': str(len(body))}
+
+    status, response_headers, _, received = asgi_request('POST', '/api/all/', body, headers, chunks=4)
+
+    assert (status, received) == (201, 4)
+    assert {'auth', 'receive', 'db', 'render', 'total'} <= set(parse_server_timing(response_headers))
+    upload_queries = request_queries[-1]
+    assert upload_queries.view == 'ImageUploadView.create' and upload_queries.queries
+
+    thumbnail = GeneratedImage.objects.get(type='200x200')
+    status, response_headers, content, _ = asgi_request('GET', f'/i/{thumbnail.slug}/')
+    assert status == 200
+    with default_storage.open(get_storage_name(thumbnail.modified_image.name)) as file:
+        assert content == file.read()
+    assert response_headers['Content-Type'].startswith('image/')
+    assert int(response_headers['Content-Length']) == len(content)
+
+
+@override_settings(ASGI_MAX_BODY_SIZE=1000)
+def test_body_over_limit_rejected_before_it_is_received():
+    body = upload_body()
+
+    status, _, _, received = asgi_request('POST', '/api/all/', body, {'Content-Length': str(len(body))}, chunks=4)
+    assert (status, received) == (413, 0)
+    # Body of unknown length is rejected once received part exceeds limit
+    status, _, _, received = asgi_request('POST', '/api/all/', body, chunks=len(body) // 600)
+    assert (status, received) == (413, 2)
@@ -0,0 +1,69 @@
+import pytest
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from API.authentication import get_profile
+from API.models import AccountTypePermissions, StoredImage
+from API.test.constants_tests import ENDPOINT_ALL, TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('scheme', ['Token', 'Bearer'])
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_endpoint_queries_with_cached_authentication(scheme, django_assert_num_queries):
+    """
+    Once user and thumbnail plan are resolved, requests only run queries of the endpoint itself
+    """
+    client = create_credentials_client(db_data_preparation(), scheme)
+    assert post_image(client).status_code == 202
+    image_id = StoredImage.objects.get().id
+
+    # Blob and source image in savepoint, thumbnails in savepoint, thumbnail job, and serialized thumbnails
+    with django_assert_num_queries(10):
+        assert post_image(client).status_code == 202
+    # Page of images, and thumbnails of all images on page
+    with django_assert_num_queries(2):
+        assert client.get(ENDPOINT_ALL).status_code == 200
+    with django_assert_num_queries(2):
+        assert client.get(f'{ENDPOINT_ALL}{image_id}/').status_code == 200
+    # Blob and source image in savepoint, easy_thumbnails source and thumbnail records, and thumbnail
+    with django_assert_num_queries(13):
+        assert post_image(client, '/api/timed/', expire_time=300, type='200').status_code == 201
+
+
+def test_deleted_token_is_rejected():
+    initial_data = db_data_preparation()
+    client = create_credentials_client(initial_data)
+    assert client.get(ENDPOINT_ALL).status_code == 200
+
+    Token.objects.filter(user=initial_data['test_user']).get().delete()
+
+    assert client.get(ENDPOINT_ALL).status_code == 401
+
+
+def test_deactivated_user_is_rejected():
+    initial_data = db_data_preparation()
+    client = create_credentials_client(initial_data, scheme='Bearer')
+    assert client.get(ENDPOINT_ALL).status_code == 200
+
+    initial_data['test_user'].is_active = False
+    initial_data['test_user'].save()
+
+    assert client.get(ENDPOINT_ALL).status_code == 401
+
+
+def test_profile_cache_cleared_on_profile_change():
+    initial_data = db_data_preparation()
+    user = initial_data['test_user']
+    profile = initial_data['test_api_user_profile']
+    assert get_profile(user).account_type_id == initial_data['test_account_type'].id
+
+    profile.account_type = AccountTypePermissions.objects.create(name='other')
+    profile.save()
+
+    record = get_profile(user)
+    assert record.account_type_id == profile.account_type_id
+    assert record.to_profile().id == profile.id
+
@@ -0,0 +1,116 @@
+import json
+import pytest
+from io import BytesIO
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from API.models import GeneratedImage, ImageBlob, StoredImage, ThumbnailJob
+from API.upload_handlers import IngestedUploadedFile
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, CONTENT_TYPE_PNG
+from API.test.utils import db_data_preparation, create_test_client
+
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT_BATCH = '/api/all/batch/'
+
+
+def make_images(count, offset=0):
+    """
+    :return: list of files of png images, each of different content
+    """
+    files = []
+    for index in range(offset, offset + count):
+        image = BytesIO()
+        Image.new('RGB', (300, 200), (index * 20 % 256, 100, 150)).save(image, 'PNG')
+        files.append(SimpleUploadedFile(f'image_{index}.png', image.getvalue(), CONTENT_TYPE_PNG))
+    return files
+
+
+def post_batch(client, files):
+    response = client.post(ENDPOINT_BATCH, {'files': files}, format='multipart')
+    return response, json.loads(response.content.decode('utf8'))
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_batch_upload_reports_result_of_every_file():
+    client = create_test_client(db_data_preparation())
+    files = make_images(2)
+    files.insert(1, SimpleUploadedFile('notes.txt', b'not an image' * 300, 'text/plain'))
+
+    response, results = post_batch(client, files)
+
+    assert response.status_code == 207
+    assert [(result['file_name'], result['status']) for result in results] == \
+        [('notes.txt', 400), ('image_0.png', 201), ('image_1.png', 201)]
+    assert StoredImage.objects.count() == 2
+    for result in results[1:]:
+        image = StoredImage.objects.get(id=result['data']['id'])
+        assert set(result['data']['thumbnails'].keys()) == set(image.thumbnails.values_list('type', flat=True))
+        assert set(result['data']['thumbnails_status'].values()) == {'ready'}
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_batch_upload_shares_blob_of_duplicates():
+    client = create_test_client(db_data_preparation())
+    first, second = make_images(1), make_images(1)
+
+    response, results = post_batch(client, first + second)
+
+    assert [result['status'] for result in results] == [201, 201]
+    blob = ImageBlob.objects.get()
+    assert blob.refcount == 2
+    first_files, second_files = (
+        dict(GeneratedImage.objects.filter(source_image_id=result['data']['id']).values_list('type', 'modified_image'))
+        for result in results)
+    assert first_files and first_files == second_files
+    assert len(set(GeneratedImage.objects.values_list('modified_image', flat=True))) == len(first_files)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=True)
+def test_batch_upload_queries_do_not_depend_on_number_of_files():
+    client = create_test_client(db_data_preparation())
+    post_batch(client, make_images(1))
+
+    query_counts = []
+    for offset, count in ((10, 2), (20, 6)):
+        with CaptureQueriesContext(connection) as queries:
+            response, results = post_batch(client, make_images(count, offset))
+        assert {result['status'] for result in results} == {202}
+        query_counts.append(len(queries))
+
+    assert query_counts[0] == query_counts[1]
+    assert ThumbnailJob.objects.count() == 9
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_UPLOAD_MAX_SIZE=2048,
+                   THUMBNAIL_QUEUE_ENABLED=False)
+def test_batch_upload_skips_too_large_file():
+    client = create_test_client(db_data_preparation())
+    large = BytesIO()
+    Image.effect_noise((200, 200), 50).save(large, 'PNG')
+    files = make_images(1)
+    files.insert(0, SimpleUploadedFile('large.png', large.getvalue(), CONTENT_TYPE_PNG))
+
+    response, results = post_batch(client, files)
+
+    assert response.status_code == 207
+    assert [(result['file_name'], result['status']) for result in results] == [('large.png', 413), ('image_0.png', 201)]
+    assert StoredImage.objects.count() == 1
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, BATCH_UPLOAD_MAX_FILES=2)
+def test_batch_upload_rejects_files_over_limit_before_receiving_them(monkeypatch):
+    client = create_test_client(db_data_preparation())
+    created = []
+    monkeypatch.setattr(IngestedUploadedFile, '__init__',
+                        lambda self, *args: created.append(args[0]) or TemporaryUploadedFile.__init__(self, *args))
+
+    response, data = post_batch(client, make_images(4))
+
+    assert response.status_code == 400
+    assert data == {"files": ["Ensure this field has no more than 2 files."]}
+    assert created == ['image_0.png', 'image_1.png']
+    assert not StoredImage.objects.exists()
@@ -0,0 +1,94 @@
+import os
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import override_settings
+from easy_thumbnails.models import Thumbnail
+from API import blobs
+from API.models import GeneratedImage, ImageBlob, StoredImage
+from API.serializers import StoredImageSerializer
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, MOCK_IMAGE_PATH, CONTENT_TYPE_PNG
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+
+
+pytestmark = pytest.mark.django_db
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_same_content_uploads_share_blob_and_thumbnails():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    thumbnail_count = Thumbnail.objects.count()
+
+    post_image(client)
+
+    first, second = StoredImage.objects.order_by('id')
+    blob = ImageBlob.objects.get()
+    assert blob.refcount == 2
+    assert first.file.name == second.file.name == blob.file.name
+    assert blob.file.name.startswith(f'blobs/{blob.sha256[:2]}/{blob.sha256}')
+    assert (second.img_width, second.img_height) == (blob.width, blob.height)
+    # Thumbnails of second upload are taken from thumbnails rendered for the first one
+    assert Thumbnail.objects.count() == thumbnail_count
+    assert set(first.thumbnails.values_list('modified_image', flat=True)) == \
+        set(second.thumbnails.values_list('modified_image', flat=True))
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_blob_deleted_with_last_image(django_capture_on_commit_callbacks):
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    post_image(client)
+    blob = ImageBlob.objects.get()
+    thumbnail_names = list(Thumbnail.objects.values_list('name', flat=True))
+
+    for image in StoredImage.objects.order_by('id'):
+        with django_capture_on_commit_callbacks(execute=True):
+            GeneratedImage.objects.filter(source_image=image).delete()
+            image.delete()
+        if StoredImage.objects.exists():
+            assert ImageBlob.objects.get().refcount == 1
+            assert os.path.exists(blob.file.path)
+
+    assert not ImageBlob.objects.exists()
+    assert not os.path.exists(blob.file.path)
+    assert not any(os.path.exists(os.path.join(TESTS_MEDIA_ROOT, name)) for name in thumbnail_names)
+    assert not Thumbnail.objects.exists()
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_blob_files_kept_when_deletion_rolls_back():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    image = StoredImage.objects.get()
+    thumbnail_names = list(Thumbnail.objects.values_list('name', flat=True))
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            GeneratedImage.objects.filter(source_image=image).delete()
+            image.delete()
+            raise RuntimeError
+
+    blob = ImageBlob.objects.get()
+    assert os.path.exists(blob.file.path)
+    assert all(os.path.exists(os.path.join(TESTS_MEDIA_ROOT, name)) for name in thumbnail_names)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_file_of_new_blob_deleted_when_image_is_not_saved(monkeypatch):
+    initial_data = db_data_preparation()
+    serializer = StoredImageSerializer(data={'file': SimpleUploadedFile('image.png', open(MOCK_IMAGE_PATH, 'rb').read(),
+                                                                        content_type=CONTENT_TYPE_PNG)})
+    assert serializer.is_valid()
+    acquired = []
+    acquire_blob = blobs.acquire_blob
+    monkeypatch.setattr(blobs, 'acquire_blob', lambda file: acquired.append(acquire_blob(file)) or acquired[-1])
+
+    def failing_save(**kwargs):
+        raise RuntimeError
+    monkeypatch.setattr(serializer, 'save', failing_save)
+    with pytest.raises(RuntimeError):
+        blobs.save_source_image(serializer, initial_data['test_api_user_profile'])
+
+    assert not ImageBlob.objects.exists()
+    assert not os.path.exists(acquired[0].file.path)
@@ -0,0 +1,128 @@
+import pytest
+from io import BytesIO
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from easy_thumbnails.files import get_thumbnailer
+from PIL import Image
+from API.engines import get_image_engine, pyvips
+from API.models import StoredImage
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.utils import db_data_preparation
+from API.thumbnails import render_thumbnails, get_thumbnail_options
+
+
+ENGINES = [
+    'pillow',
+    pytest.param('vips', marks=pytest.mark.skipif(pyvips is None, reason='pyvips is not installed')),
+]
+
+# Source size, thumbnail type and expected size of thumbnail
+SIZES = [
+    ((300, 200), '200x200', (200, 200)),
+    ((200, 300), '150x50', (150, 50)),
+    ((100, 80), '400x400', (400, 400)),
+    ((640, 480), '640x480', (640, 480)),
+    ((4000, 3000), '200x200', (200, 200)),
+]
+
+
+def encode_image(image, image_format):
+    data = BytesIO()
+    image.save(data, image_format)
+    return data.getvalue()
+
+
+def striped_image(size, colors, vertical):
+    """
+    Returns image made of stripes of equal width, left to right (or top to bottom)
+    """
+    image = Image.new('RGB', size)
+    count = len(colors)
+    for index, color in enumerate(colors):
+        if vertical:
+            box = (size[0] * index // count, 0, size[0] * (index + 1) // count, size[1])
+        else:
+            box = (0, size[1] * index // count, size[0], size[1] * (index + 1) // count)
+        image.paste(color, box)
+    return image
+
+
+def render(engine_name, data, thumbnail_type, extension='jpg'):
+    """
+    Resizes and crops encoded image with engine, like thumbnails are rendered
+    :return: rendered thumbnail, decoded with Pillow
+    """
+    image_engine = get_image_engine(engine_name)
+    thumbnailer = get_thumbnailer(BytesIO(data), relative_name='source.png')
+    options = thumbnailer.get_options(get_thumbnail_options(thumbnail_type))
+    source = image_engine.open(thumbnailer, {thumbnail_type: options})[thumbnail_type]
+    thumbnail = image_engine.resize_crop(source, options, thumbnailer)
+    return Image.open(BytesIO(image_engine.encode(thumbnail, extension, quality=90)))
+
+
+@pytest.mark.parametrize('engine_name', ENGINES)
+@pytest.mark.parametrize('source_size,thumbnail_type,expected_size', SIZES)
+def test_engine_renders_thumbnail_of_requested_size(engine_name, source_size, thumbnail_type, expected_size):
+    data = encode_image(Image.new('RGB', source_size, (10, 120, 200)), 'JPEG')
+
+    assert render(engine_name, data, thumbnail_type).size == expected_size
+
+
+@pytest.mark.parametrize('engine_name', ENGINES)
+@pytest.mark.parametrize('source_size,vertical', [((600, 200), True), ((200, 600), False)])
+def test_engine_crops_around_centre(engine_name, source_size, vertical):
+    # Middle stripe covers square crop of the source, outer stripes are cut off
+    source = striped_image(source_size, [(255, 0, 0), (0, 255, 0), (0, 0, 255)], vertical)
+
+    thumbnail = render(engine_name, encode_image(source, 'PNG'), '100x100', 'png').convert('RGB')
+
+    for point in ((1, 1), (98, 1), (50, 50), (1, 98), (98, 98)):
+        red, green, blue = thumbnail.getpixel(point)
+        assert green > 200 and red < 40 and blue < 40
+
+
+@pytest.mark.parametrize('engine_name', ENGINES)
+def test_engine_keeps_transparency_of_png(engine_name):
+    source = Image.new('RGBA', (300, 200), (255, 0, 0, 0))
+    source.paste((0, 0, 255, 255), (100, 50, 200, 150))
+    image_engine = get_image_engine(engine_name)
+    thumbnailer = get_thumbnailer(BytesIO(encode_image(source, 'PNG')), relative_name='source.png')
+    options = thumbnailer.get_options(get_thumbnail_options('200x200'))
+    thumbnail = image_engine.resize_crop(image_engine.open(thumbnailer, {'200x200': options})['200x200'],
+                                         options, thumbnailer)
+
+    assert image_engine.is_transparent(thumbnail)
+    rendered = Image.open(BytesIO(image_engine.encode(thumbnail, 'png')))
+    assert rendered.mode == 'RGBA'
+    assert rendered.getpixel((1, 1))[3] == 0
+    assert rendered.getpixel((100, 100))[3] == 255
+    # Transparency layer is dropped from JPEG
+    assert Image.open(BytesIO(image_engine.encode(thumbnail, 'jpg'))).mode == 'RGB'
+
+
+@pytest.mark.parametrize('engine_name', ENGINES)
+def test_engine_probes_header(engine_name):
+    image_engine = get_image_engine(engine_name)
+
+    assert image_engine.probe(BytesIO(encode_image(Image.new('RGB', (640, 480)), 'JPEG'))) == ('JPEG', (640, 480))
+    assert image_engine.probe(BytesIO(encode_image(Image.new('RGBA', (30, 20)), 'PNG'))) == ('PNG', (30, 20))
+    with pytest.raises(OSError):
+        image_engine.probe(BytesIO(b'not an image' * 100))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('engine_name', ENGINES)
+def test_render_thumbnails_with_engine(engine_name):
+    owner = db_data_preparation()['test_api_user_profile']
+    thumbnail_types = ['200x200', '400x400', '300x200']
+
+    with override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_ENGINE=engine_name):
+        source_file = default_storage.save(f'engines/{engine_name}.jpg', BytesIO(
+            encode_image(Image.new('RGB', (300, 200), (200, 30, 30)), 'JPEG')))
+        source_image = StoredImage.objects.create(owner=owner, file=source_file)
+        results = render_thumbnails(source_image.file, thumbnail_types)
+
+        for thumbnail_type, result in results.items():
+            assert result.error is None
+            with default_storage.open(result.url[len(TESTS_MEDIA_URL):]) as file:
+                assert '%dx%d' % Image.open(file).size == thumbnail_type
@@ -0,0 +1,66 @@
+import pytest
+from datetime import timedelta
+from django.db.models import Prefetch
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from API.fast_serializers import IMAGE_VALUES, get_thumbnail_rows, serialize_images
+from API.models import APIUserProfile, GeneratedImage, StoredImage
+from API.serializers import StoredImageSerializer
+from API.test.utils import db_data_preparation
+
+
+pytestmark = pytest.mark.django_db
+
+
+def create_images(profile):
+    """
+    Inserts images with various file names, and thumbnails of all statuses, with and without expire date
+    """
+    names = ['user_1/image.png', 'blobs/ab/ab12.jpg', 'user_1/zdjęcie z wakacji (1).png', '']
+    images = StoredImage.objects.bulk_create([StoredImage(owner=profile, file=name, img_width=100, img_height=100)
+                                              for name in names])
+    thumbnails = []
+    for image in images[:-1]:
+        for index, (status, _) in enumerate(GeneratedImage.STATUS_CHOICES):
+            thumbnails.append(GeneratedImage(source_image=image, type=f'{index + 1}00x{index + 1}00', status=status,
+                                             slug=f'{image.id}s{index}', modified_image=f'/media/{image.id}.jpg'))
+    thumbnails[0].expire_time = 300
+    thumbnails[0].expire_date = timezone.now() + timedelta(seconds=300, microseconds=1234)
+    GeneratedImage.objects.bulk_create(thumbnails)
+
+
+def render_both(request):
+    images = StoredImage.objects.order_by('id') \
+        .prefetch_related(Prefetch('thumbnails', queryset=GeneratedImage.objects.order_by('id')))
+    expected = StoredImageSerializer(images, many=True, context={'request': request}).data
+
+    values = list(StoredImage.objects.order_by('id').values(*IMAGE_VALUES))
+    actual = serialize_images(values, get_thumbnail_rows([image['id'] for image in values]), request)
+    return JSONRenderer().render(expected), JSONRenderer().render(actual)
+
+
+@override_settings(ALLOWED_HOSTS=['example.com'])
+@pytest.mark.parametrize('path', ['/api/all/', '/api/all/?cursor=cD0xMjM%3D&page_size=10', '/api/all/7/'])
+@pytest.mark.parametrize('time_zone', ['UTC', 'Europe/Warsaw'])
+def test_output_identical_to_model_serializer(path, time_zone):
+    initial_data = db_data_preparation()
+    create_images(APIUserProfile.objects.get(user=initial_data['test_user']))
+    request = APIRequestFactory().get(path, HTTP_HOST='example.com:8000')
+
+    with timezone.override(time_zone):
+        expected, actual = render_both(request)
+
+    assert actual == expected
+
+
+@override_settings(MEDIA_URL='https://cdn.example.com/media/')
+def test_output_identical_with_absolute_media_url():
+    initial_data = db_data_preparation()
+    create_images(APIUserProfile.objects.get(user=initial_data['test_user']))
+    request = APIRequestFactory().get('/api/all/')
+
+    expected, actual = render_both(request)
+
+    assert actual == expected
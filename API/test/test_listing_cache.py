@@ -0,0 +1,93 @@
+import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from API.models import GeneratedImage, StoredImage
+from API.reaper import reap_expired
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, ENDPOINT_ALL
+from API.test.test_reaper import create_expired_thumbnails
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+
+
+# Versions of listings change once transactions commit
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.usefixtures('listing_cache'),
+]
+
+IMAGE_TABLES = (StoredImage._meta.db_table, GeneratedImage._meta.db_table)
+
+
+@pytest.fixture
+def listing_cache():
+    caches['default'].clear()
+    with override_settings(LISTING_CACHE_BACKEND='default', MEDIA_URL=TESTS_MEDIA_URL,
+                           MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False):
+        yield
+    caches['default'].clear()
+
+
+def image_queries(queries):
+    return [query['sql'] for query in queries if any(table in query['sql'] for table in IMAGE_TABLES)]
+
+
+def test_unchanged_listing_not_modified():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    response = client.get(ENDPOINT_ALL)
+    assert response.status_code == 200
+    assert 'no-cache' in response['Cache-Control']
+
+    with CaptureQueriesContext(connection) as queries:
+        not_modified = client.get(ENDPOINT_ALL, HTTP_IF_NONE_MATCH=response['ETag'])
+        cached = client.get(ENDPOINT_ALL)
+
+    assert not_modified.status_code == 304
+    assert not_modified['ETag'] == response['ETag']
+    assert cached.status_code == 200
+    assert cached.json() == response.json()
+    assert image_queries(queries) == []
+
+
+def test_listing_changes_with_images():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    etag = client.get(ENDPOINT_ALL)['ETag']
+
+    post_image(client)
+    response = client.get(ENDPOINT_ALL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert len(response.json()['results']) == 2
+
+    image_id = response.json()['results'][0]['id']
+    etag = response['ETag']
+    image_etag = client.get(f'{ENDPOINT_ALL}{image_id}/')['ETag']
+    GeneratedImage.objects.filter(source_image_id=image_id).delete()
+    assert client.get(ENDPOINT_ALL, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    response = client.get(f'{ENDPOINT_ALL}{image_id}/', HTTP_IF_NONE_MATCH=image_etag)
+    assert response.status_code == 200
+    assert response.json()['thumbnails'] == []
+
+
+def test_listing_changes_with_reaped_thumbnails():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    create_expired_thumbnails(client, 2)
+    response = client.get(ENDPOINT_ALL)
+
+    reap_expired()
+
+    assert client.get(ENDPOINT_ALL, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+
+def test_listing_without_cache_backend():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    etag = client.get(ENDPOINT_ALL)['ETag']
+
+    with override_settings(LISTING_CACHE_BACKEND=None):
+        response = client.get(ENDPOINT_ALL, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 200
+    assert not response.has_header('ETag')
@@ -0,0 +1,97 @@
+import pytest
+import time
+from django.test import override_settings
+from django.urls import reverse
+from API.metrics import StageTimer
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.test_views import create_timed_thumbnail
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT_METRICS = '/api/metrics/'
+
+
+def parse_server_timing(response):
+    """
+    :return: dict of stage: duration in milliseconds, from Server-Timing header
+    """
+    timings = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, duration = entry.split(';dur=')
+        timings[name] = float(duration)
+    return timings
+
+
+def test_nested_stages_are_not_counted_twice():
+    timer = StageTimer()
+    timer.enter('db')
+    time.sleep(0.01)
+    timer.enter('storage')
+    time.sleep(0.05)
+    timer.exit()
+    timer.exit()
+    timer.finish()
+
+    assert timer.durations['storage'] >= 0.05
+    assert 0.01 <= timer.durations['db'] < 0.05
+    assert timer.durations['db'] + timer.durations['storage'] <= timer.durations['total']
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_upload_stages_sent_in_server_timing_header():
+    client = create_credentials_client(db_data_preparation())
+
+    response = post_image(client)
+
+    assert response.status_code == 201
+    timings = parse_server_timing(response)
+    assert list(timings)[:4] == ['auth', 'receive', 'validate', 'db']
+    assert {'storage', 'render', 'decode', 'resize', 'encode', 'serialize', 'total'} <= set(timings)
+    assert sum(duration for name, duration in timings.items() if name != 'total') <= timings['total'] + 0.1
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file')
+def test_display_stages_sent_in_server_timing_header():
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+
+    response = client.get(reverse('display_image', args=[thumbnail.slug]))
+
+    assert {'resolve', 'respond', 'total'} <= set(parse_server_timing(response))
+    # Other endpoints are not timed
+    assert not client.get('/api/all/').has_header('Server-Timing')
+    with override_settings(SERVER_TIMING_HEADER=False):
+        assert not client.get(reverse('display_image', args=[thumbnail.slug])).has_header('Server-Timing')
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file',
+                   THUMBNAIL_QUEUE_ENABLED=False)
+def test_metrics_endpoint():
+    initial_data = db_data_preparation()
+    client = create_credentials_client(initial_data)
+    post_image(client)
+    thumbnail = create_timed_thumbnail(client)
+    for _ in range(3):
+        client.get(reverse('display_image', args=[thumbnail.slug]))
+
+    assert client.get(ENDPOINT_METRICS).status_code == 403
+    initial_data['test_user'].is_staff = True
+    initial_data['test_user'].save()
+    response = client.get(ENDPOINT_METRICS)
+
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    metrics = dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+                   if not line.startswith('#'))
+    assert metrics['imageupload_stage_duration_seconds_count{endpoint="upload",stage="decode"}'] == '1'
+    assert metrics['imageupload_stage_duration_seconds_bucket{endpoint="display",stage="total",le="+Inf"}'] == '3'
+    assert metrics['imageupload_stage_duration_seconds_count{endpoint="upload_timed",stage="total"}'] == '1'
+    # Time limited thumbnail of the same image reuses its 200x200 thumbnail
+    assert int(metrics['imageupload_thumbnails_rendered_total']) == 5
+    assert int(metrics['imageupload_bytes_written_total{kind="thumbnail"}']) > 0
+    assert int(metrics['imageupload_bytes_written_total{kind="source"}']) > 0
+    # Slug is resolved from database once, then from cache
+    assert metrics['imageupload_cache_hits_total{cache="slug"}'] == '2'
+    assert metrics['imageupload_cache_hit_ratio{cache="slug"}'] == '0.6667'
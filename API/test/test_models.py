@@ -1,11 +1,13 @@
 import os
 import pytest
 from django.contrib.auth.models import User
+from django.db import IntegrityError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import override_settings
 from API.models import CustomThumbnailSize, AccountTypePermissions, APIUserProfile,\
                        StoredImage, GeneratedImage
 from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, TEST_USER_PASS, TEST_USER_LOGIN
+from API.utils import bulk_create_generated_images
 
 
 pytestmark = pytest.mark.django_db
@@ -67,3 +69,53 @@ def test_generatedimage_to_string():
     generated_image = GeneratedImage.objects.create(source_image=source_image, type=200)
 
     assert generated_image.__str__() == f"{generated_image.id}"
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_generatedimage_slug_collision_is_regenerated(monkeypatch):
+    test_user = User.objects.create(username=TEST_USER_LOGIN, password=TEST_USER_PASS)
+    api_user = APIUserProfile.objects.create(user=test_user)
+    mock_image = SimpleUploadedFile(name='test_image.png', content=open('test_image.png', 'rb').read(),
+                                    content_type='image/png')
+    source_image = StoredImage.objects.create(owner=api_user, file=mock_image)
+    existing_image = GeneratedImage.objects.create(source_image=source_image, type=200)
+    slugs = iter([existing_image.slug, 'uniqueslug12345'])
+    monkeypatch.setattr('API.utils.get_random_string', lambda length: next(slugs))
+
+    generated_image = GeneratedImage.objects.create(source_image=source_image, type=400)
+
+    assert generated_image.slug == 'uniqueslug12345'
+    assert GeneratedImage.objects.count() == 2
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_generatedimage_other_integrity_error_is_not_retried(monkeypatch):
+    test_user = User.objects.create(username=TEST_USER_LOGIN, password=TEST_USER_PASS)
+    api_user = APIUserProfile.objects.create(user=test_user)
+    mock_image = SimpleUploadedFile(name='test_image.png', content=open('test_image.png', 'rb').read(),
+                                    content_type='image/png')
+    source_image = StoredImage.objects.create(owner=api_user, file=mock_image)
+    slugs = []
+    monkeypatch.setattr('API.utils.get_random_string', lambda length: slugs.append(1) or f'slug{len(slugs)}')
+
+    with pytest.raises(IntegrityError):
+        GeneratedImage.objects.create(source_image=source_image, type=None)
+
+    assert len(slugs) == 1
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_bulk_create_generated_images_does_not_read_slugs(django_assert_num_queries):
+    test_user = User.objects.create(username=TEST_USER_LOGIN, password=TEST_USER_PASS)
+    api_user = APIUserProfile.objects.create(user=test_user)
+    mock_image = SimpleUploadedFile(name='test_image.png', content=open('test_image.png', 'rb').read(),
+                                    content_type='image/png')
+    source_image = StoredImage.objects.create(owner=api_user, file=mock_image)
+    thumbnails = [GeneratedImage(source_image=source_image, type=f'{size}x{size}') for size in [200, 400, 500, 1000]]
+
+    # Savepoint, insert and savepoint release
+    with django_assert_num_queries(3):
+        bulk_create_generated_images(thumbnails)
+
+    assert len({thumbnail.slug for thumbnail in thumbnails}) == 4
+    assert GeneratedImage.objects.filter(slug__in=[thumbnail.slug for thumbnail in thumbnails]).count() == 4
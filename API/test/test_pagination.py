@@ -0,0 +1,77 @@
+import json
+import pytest
+from django.test import override_settings
+from API.models import APIUserProfile, GeneratedImage, StoredImage
+from API.test.constants_tests import ENDPOINT_ALL
+from API.test.utils import db_data_preparation, create_test_client
+
+
+pytestmark = pytest.mark.django_db
+
+
+def create_images(profile, count):
+    """
+    Inserts images with two thumbnails each, without files
+    :return: list of ids of created images
+    """
+    images = StoredImage.objects.bulk_create([StoredImage(owner=profile, file=f'image_{index}.png',
+                                                          img_width=100, img_height=100) for index in range(count)])
+    GeneratedImage.objects.bulk_create([GeneratedImage(source_image=image, type=thumbnail_type,
+                                                       slug=f'{image.id}_{thumbnail_type}')
+                                        for image in images for thumbnail_type in ('200x200', '400x400')])
+    return [image.id for image in images]
+
+
+def list_all_pages(client, url):
+    """
+    :return: tuple of listed image ids and number of fetched pages
+    """
+    ids = []
+    pages = 0
+    while url:
+        json_dict = json.loads(client.get(url).content.decode('utf8'))
+        ids.extend(image['id'] for image in json_dict['results'])
+        url = json_dict['next']
+        pages += 1
+    return ids, pages
+
+
+@override_settings(IMAGE_LIST_PAGE_SIZE=4)
+def test_list_walks_all_pages_by_cursor():
+    initial_data = db_data_preparation()
+    client = create_test_client(initial_data)
+    image_ids = create_images(APIUserProfile.objects.get(user=initial_data['test_user']), 10)
+
+    ids, pages = list_all_pages(client, ENDPOINT_ALL)
+
+    assert ids == image_ids
+    assert pages == 3
+
+
+@override_settings(IMAGE_LIST_PAGE_SIZE=4, IMAGE_LIST_MAX_PAGE_SIZE=6)
+def test_list_page_size_parameter_is_limited():
+    initial_data = db_data_preparation()
+    client = create_test_client(initial_data)
+    create_images(APIUserProfile.objects.get(user=initial_data['test_user']), 10)
+
+    json_dict = json.loads(client.get(f'{ENDPOINT_ALL}?page_size=100').content.decode('utf8'))
+
+    assert len(json_dict['results']) == 6
+
+
+def test_list_cursor_is_stable_while_images_are_added(django_assert_num_queries):
+    initial_data = db_data_preparation()
+    client = create_test_client(initial_data)
+    profile = APIUserProfile.objects.get(user=initial_data['test_user'])
+    image_ids = create_images(profile, 6)
+    first_page = json.loads(client.get(f'{ENDPOINT_ALL}?page_size=3').content.decode('utf8'))
+
+    new_ids = create_images(profile, 2)
+    # Page of images, and thumbnails of all images on page
+    with django_assert_num_queries(2):
+        second_page = json.loads(client.get(first_page['next']).content.decode('utf8'))
+
+    assert [image['id'] for image in first_page['results']] == image_ids[:3]
+    assert [image['id'] for image in second_page['results']] == image_ids[3:]
+    assert [len(image['thumbnails']) for image in second_page['results']] == [2, 2, 2]
+    assert list_all_pages(client, second_page['next'])[0] == new_ids
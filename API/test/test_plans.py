@@ -0,0 +1,59 @@
+import pytest
+from django.test import override_settings
+from API.models import CustomThumbnailSize
+from API.plans import get_thumbnail_plan, EMPTY_PLAN
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_plan_compiled_from_account_type(django_assert_num_queries):
+    initial_data = db_data_preparation()
+    account_type_id = initial_data['test_account_type'].id
+
+    plan = get_thumbnail_plan(account_type_id)
+    with django_assert_num_queries(0):
+        assert get_thumbnail_plan(account_type_id) is plan
+
+    assert plan.custom_sizes == (500, 1000)
+    assert plan.upload_types(840, 680) == ['200x200', '400x400', '840x680', '500x500', '1000x1000']
+    assert plan.allows_time_limited('200')
+    assert plan.allows_time_limited('500')
+    assert not plan.allows_time_limited('300')
+    assert not plan.allows_time_limited('abc')
+    assert get_thumbnail_plan(None) is EMPTY_PLAN
+
+
+def test_plan_rebuilt_after_account_type_changes():
+    initial_data = db_data_preparation()
+    account_type = initial_data['test_account_type']
+    assert get_thumbnail_plan(account_type.id).allow_time_limited
+
+    account_type.create_time_limited_link_perm = False
+    account_type.save()
+    assert not get_thumbnail_plan(account_type.id).allow_time_limited
+
+    account_type.custom_size.remove(initial_data['test_custom_thumbnail_size_1'])
+    assert get_thumbnail_plan(account_type.id).custom_sizes == (1000,)
+
+    CustomThumbnailSize.objects.create(size=300).accounttypepermissions_set.add(account_type)
+    assert get_thumbnail_plan(account_type.id).custom_sizes == (300, 1000)
+
+    initial_data['test_custom_thumbnail_size_2'].size = 700
+    initial_data['test_custom_thumbnail_size_2'].save()
+    assert get_thumbnail_plan(account_type.id).custom_sizes == (300, 700)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_timed_endpoint_custom_size_permission():
+    """
+    Custom sizes of account type are compared by value with requested type
+    """
+    initial_data = db_data_preparation()
+    client = create_credentials_client(initial_data)
+
+    assert post_image(client, '/api/timed/', expire_time=300, type='500').status_code == 201
+    assert post_image(client, '/api/timed/', expire_time=300, type='600').status_code == 403
+
@@ -0,0 +1,72 @@
+import logging
+import pytest
+from django.test import override_settings
+from API.query_budget import QueryBudgetExceeded, RecordedQuery, RequestQueries, find_repeated_queries, \
+    get_problems, normalize_sql
+from API.views import ImageUploadView
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.test_batch_upload import make_images, post_batch
+from API.test.utils import db_data_preparation, create_credentials_client, create_test_client
+
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT_ALL = '/api/all/'
+
+
+def test_normalize_sql():
+    assert normalize_sql('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "name" = \'a\'  LIMIT 21') == \
+        normalize_sql('SELECT * FROM "t" WHERE "id" IN (%s) AND "name" = \'b\' LIMIT 1') == \
+        'SELECT * FROM "t" WHERE "id" IN (%s, ...) AND "name" = ? LIMIT ?'
+    assert normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)') == \
+        normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s)')
+
+
+def test_repeated_queries_reported_with_stack():
+    stack = ('API/views.py:10 in list',)
+    queries = [RecordedQuery('SAVEPOINT "s1"', 'SAVEPOINT "s?"', 0.0, ())] * 3
+    queries += [RecordedQuery(f'SELECT * FROM "t" WHERE "id" = {pk}', 'SELECT * FROM "t" WHERE "id" = ?', 0.0, stack)
+                for pk in range(3)]
+
+    assert list(find_repeated_queries(queries, 3)) == ['SELECT * FROM "t" WHERE "id" = ?']
+    problems = get_problems(RequestQueries('GET', '/', 'view', 6, queries), 3)
+    assert problems == ['query run 3 times: SELECT * FROM "t" WHERE "id" = ?\n        API/views.py:10 in list']
+    assert len(get_problems(RequestQueries('GET', '/', 'view', 5, queries), 3)) == 2
+
+
+def test_queries_recorded_with_view_and_budget(request_queries):
+    client = create_credentials_client(db_data_preparation())
+
+    assert client.get(ENDPOINT_ALL).status_code == 200
+
+    recorded = request_queries[-1]
+    assert (recorded.method, recorded.path, recorded.view) == ('GET', ENDPOINT_ALL, 'ImageUploadView.list')
+    assert recorded.budget == ImageUploadView.list.query_budget
+    assert 0 < len(recorded.queries) <= recorded.budget
+    assert any(frame.startswith('API/') for query in recorded.queries for frame in query.stack)
+
+
+def test_exceeded_budget_raises_or_warns(monkeypatch, caplog):
+    client = create_credentials_client(db_data_preparation())
+    monkeypatch.setattr(ImageUploadView.list, 'query_budget', 0)
+
+    with pytest.raises(QueryBudgetExceeded, match=r'GET /api/all/ \(ImageUploadView.list\): \d+ queries run, '
+                                                  r'budget is 0'):
+        client.get(ENDPOINT_ALL)
+    with override_settings(QUERY_BUDGET_MODE='warn'), caplog.at_level(logging.WARNING, 'API.query_budget'):
+        assert client.get(ENDPOINT_ALL).status_code == 200
+    assert 'budget is 0' in caplog.text
+    with override_settings(QUERY_BUDGET_MODE=None):
+        assert client.get(ENDPOINT_ALL).status_code == 200
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_rendered_thumbnails_recorded_without_repeated_queries(request_queries):
+    client = create_test_client(db_data_preparation())
+
+    response, results = post_batch(client, make_images(6))
+
+    assert {result['status'] for result in results} == {201}
+    # Sources and thumbnails of all images are recorded in easy_thumbnails together
+    repeated = find_repeated_queries(request_queries[-1].queries, 2)
+    assert not [shape for shape in repeated if 'easy_thumbnails' in shape]
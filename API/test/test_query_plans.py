@@ -0,0 +1,145 @@
+import os
+import pytest
+from django.db import connection
+from django.utils import timezone
+from API.models import APIUserProfile, StoredImage, GeneratedImage
+
+
+# Seeding takes a while, so plans are only checked when QUERY_PLAN_TESTS is set.
+# Number of seeded thumbnails can be lowered for quicker local runs
+pytestmark = pytest.mark.skipif(not os.environ.get('QUERY_PLAN_TESTS'),
+                                reason='set QUERY_PLAN_TESTS to check query plans on seeded database')
+SEED_THUMBNAILS = int(os.environ.get('QUERY_PLAN_SEED_THUMBNAILS', 1000000))
+SEED_USERS = 2000
+SEED_USER_PREFIX = 'plan_user_'
+THUMBNAILS_PER_IMAGE = 5
+EXPIRING_EVERY = 20  # every n-th image has time limited thumbnail
+
+
+@pytest.fixture(scope='module')
+def seeded_profile(django_db_setup, django_db_blocker):
+    """
+    Seeds users with images and thumbnails using set-based inserts, and updates planner statistics.
+    Rows are committed, so seeded rows, and only them, are removed after tests of this module.
+    """
+    images_per_user = max(1, SEED_THUMBNAILS // THUMBNAILS_PER_IMAGE // SEED_USERS)
+    tables = {
+        'user': APIUserProfile.user.field.related_model._meta.db_table,
+        'profile': APIUserProfile._meta.db_table,
+        'image': StoredImage._meta.db_table,
+        'thumbnail': GeneratedImage._meta.db_table,
+    }
+    with django_db_blocker.unblock():
+        with connection.cursor() as cursor:
+            cursor.execute(f'''
+                INSERT INTO "{tables['user']}" (password, is_superuser, username, first_name, last_name, email,
+                                                is_staff, is_active, date_joined)
+                SELECT '', false, %s || i, '', '', '', false, true, now()
+                FROM generate_series(1, %s) i''', [SEED_USER_PREFIX, SEED_USERS])
+            cursor.execute(f'''
+                INSERT INTO "{tables['profile']}" (user_id)
+                SELECT id FROM "{tables['user']}" WHERE username LIKE %s''', [SEED_USER_PREFIX + '%'])
+            cursor.execute(f'''
+                INSERT INTO "{tables['image']}" (owner_id, img_height, img_width, file)
+                SELECT profile.id, 680, 840, 'plan/' || profile.id || '_' || i || '.png'
+                FROM "{tables['profile']}" profile
+                JOIN "{tables['user']}" auth_user ON auth_user.id = profile.user_id AND auth_user.username LIKE %s,
+                generate_series(1, %s) i''', [SEED_USER_PREFIX + '%', images_per_user])
+            # Foreign keys of inserted thumbnails are checked with plans based on current statistics
+            cursor.execute(f'ANALYZE "{tables["image"]}"')
+            cursor.execute(f'''
+                INSERT INTO "{tables['thumbnail']}" (source_image_id, modified_image, slug, type, created, status,
+                                                     expire_time, expire_date)
+                SELECT image.id, '', substr(md5(image.id || '_' || i), 1, 15), i * 100 || 'x' || i * 100, now(),
+                       'ready',
+                       CASE WHEN i = 1 AND image.id %% %s = 0 THEN 300 END,
+                       CASE WHEN i = 1 AND image.id %% %s = 0 THEN now() + (image.id %% 600 - 300) * interval '1 second' END
+                FROM "{tables['image']}" image, generate_series(1, %s) i
+                WHERE image.owner_id IN (SELECT profile.id FROM "{tables['profile']}" profile
+                                         JOIN "{tables['user']}" auth_user ON auth_user.id = profile.user_id
+                                         WHERE auth_user.username LIKE %s)''',
+                           [EXPIRING_EVERY, EXPIRING_EVERY, THUMBNAILS_PER_IMAGE, SEED_USER_PREFIX + '%'])
+            for table in tables.values():
+                cursor.execute(f'ANALYZE "{table}"')
+        profile = APIUserProfile.objects.filter(user__username=SEED_USER_PREFIX + '1').get()
+        yield profile
+        with connection.cursor() as cursor:
+            seeded_profiles = f'''SELECT profile.id FROM "{tables['profile']}" profile
+                                  JOIN "{tables['user']}" auth_user ON auth_user.id = profile.user_id
+                                  WHERE auth_user.username LIKE %s'''
+            cursor.execute(f'''DELETE FROM "{tables['thumbnail']}" WHERE source_image_id IN (
+                                   SELECT id FROM "{tables['image']}" WHERE owner_id IN ({seeded_profiles}))''',
+                           [SEED_USER_PREFIX + '%'])
+            cursor.execute(f'DELETE FROM "{tables["image"]}" WHERE owner_id IN ({seeded_profiles})',
+                           [SEED_USER_PREFIX + '%'])
+            cursor.execute(f'DELETE FROM "{tables["profile"]}" WHERE id IN ({seeded_profiles})',
+                           [SEED_USER_PREFIX + '%'])
+            cursor.execute(f'DELETE FROM "{tables["user"]}" WHERE username LIKE %s', [SEED_USER_PREFIX + '%'])
+
+
+def get_index_names(model, *columns):
+    """
+    :return: names of indexes of model table, which cover exactly given columns
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return [name for name, constraint in constraints.items()
+            if constraint['index'] and constraint['columns'] == list(columns)]
+
+
+def assert_uses_index(queryset, index_names):
+    """
+    Checks that plan of queryset has no sequential scan, and reads rows through one of expected indexes
+    """
+    plan = queryset.explain()
+    assert 'Seq Scan' not in plan, plan
+    assert any(name in plan for name in index_names), plan
+
+
+@pytest.mark.django_db
+def test_display_image_slug_lookup_plan(seeded_profile):
+    slug = GeneratedImage.objects.filter(source_image__owner=seeded_profile).values_list('slug', flat=True).first()
+    assert_uses_index(GeneratedImage.objects.filter(slug=slug), get_index_names(GeneratedImage, 'slug'))
+
+
+@pytest.mark.django_db
+def test_list_images_of_owner_plan(seeded_profile):
+    assert_uses_index(StoredImage.objects.filter(owner=seeded_profile.id).order_by('id'),
+                      ['storedimage_owner_id_idx'])
+
+
+@pytest.mark.django_db
+def test_list_page_of_owner_plan(seeded_profile):
+    # Cursor of next page is id of last image on previous page
+    image_ids = list(StoredImage.objects.filter(owner=seeded_profile).order_by('id').values_list('id', flat=True))
+    image_id = image_ids[len(image_ids) // 2]
+    assert_uses_index(StoredImage.objects.filter(owner=seeded_profile.id, id__gt=image_id).order_by('id')[:51],
+                      ['storedimage_owner_id_idx'])
+
+
+@pytest.mark.django_db
+def test_retrieve_image_of_owner_plan(seeded_profile):
+    image_id = StoredImage.objects.filter(owner=seeded_profile).values_list('id', flat=True).first()
+    assert_uses_index(StoredImage.objects.filter(owner=seeded_profile.id, id=image_id),
+                      ['storedimage_owner_id_idx'] + get_index_names(StoredImage, 'id'))
+
+
+@pytest.mark.django_db
+def test_latest_image_of_owner_plan(seeded_profile):
+    assert_uses_index(StoredImage.objects.filter(owner=seeded_profile).order_by('-id')[:1],
+                      ['storedimage_owner_id_idx'])
+
+
+@pytest.mark.django_db
+def test_thumbnails_of_images_plan(seeded_profile):
+    image_ids = list(StoredImage.objects.filter(owner=seeded_profile).values_list('id', flat=True))
+    assert_uses_index(GeneratedImage.objects.filter(source_image__in=image_ids),
+                      get_index_names(GeneratedImage, 'source_image_id'))
+
+
+@pytest.mark.django_db
+def test_expired_thumbnails_plan(seeded_profile):
+    # Batch of reaper, and lookup of all time limited thumbnails
+    assert_uses_index(GeneratedImage.objects.filter(expire_date__lte=timezone.now(), id__gt=0).order_by('id')[:500],
+                      ['generatedimage_expiring_id_idx'])
+    assert_uses_index(GeneratedImage.objects.filter(expire_date__isnull=False), ['generatedimage_expiring_idx'])
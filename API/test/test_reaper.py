@@ -0,0 +1,112 @@
+import os
+import pytest
+from datetime import timedelta
+from io import BytesIO, StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from easy_thumbnails.models import Source
+from PIL import Image
+from API.models import GeneratedImage, StoredImage, ImageBlob
+from API.reaper import reap_expired
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, CONTENT_TYPE_PNG
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+from API.utils import get_storage_name
+
+
+pytestmark = pytest.mark.django_db
+
+
+def create_expired_thumbnails(client, count):
+    """
+    Creates time limited thumbnails, each with its own source image of different content,
+    and moves their expire date to the past
+    :return: list of expired GeneratedImage objects
+    """
+    for index in range(count):
+        image = BytesIO()
+        Image.new('RGB', (300, 200), (index * 50, 100, 150)).save(image, 'PNG')
+        client.post('/api/timed/', {'file': SimpleUploadedFile('expired.png', image.getvalue(), CONTENT_TYPE_PNG),
+                                    'expire_time': 300, 'type': '200'}, format='multipart')
+    GeneratedImage.objects.filter(expire_date__isnull=False).update(expire_date=timezone.now() - timedelta(seconds=1))
+    return list(GeneratedImage.objects.filter(expire_date__isnull=False).select_related('source_image'))
+
+
+def media_path(image_url):
+    return os.path.join(TESTS_MEDIA_ROOT, get_storage_name(image_url))
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_reap_expired_thumbnails(django_capture_on_commit_callbacks):
+    """
+    Expired thumbnails, their files and source images are deleted, other thumbnails are kept
+    """
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    kept_thumbnails = list(GeneratedImage.objects.all())
+    expired = create_expired_thumbnails(client, 3)
+    expired_files = [media_path(thumbnail.modified_image.name) for thumbnail in expired] + \
+                    [thumbnail.source_image.file.path for thumbnail in expired]
+    assert all(os.path.exists(path) for path in expired_files)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        result = reap_expired(batch_size=2)
+
+    assert (result.thumbnails, result.sources, result.files, result.batches) == (3, 3, 6, 2)
+    assert not any(os.path.exists(path) for path in expired_files)
+    assert list(GeneratedImage.objects.all()) == kept_thumbnails
+    assert StoredImage.objects.count() == 1
+    assert ImageBlob.objects.count() == 1
+    assert Source.objects.count() == 1
+    assert all(os.path.exists(media_path(thumbnail.modified_image.name)) for thumbnail in kept_thumbnails)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_reap_expired_keeps_files_of_rolled_back_batch(monkeypatch, django_capture_on_commit_callbacks):
+    client = create_credentials_client(db_data_preparation())
+    expired = create_expired_thumbnails(client, 2)
+
+    def failing_release(source_ids):
+        raise RuntimeError
+    monkeypatch.setattr('API.reaper.release_sources', failing_release)
+    with pytest.raises(RuntimeError), django_capture_on_commit_callbacks(execute=True):
+        reap_expired()
+
+    assert GeneratedImage.objects.count() == 2
+    assert all(os.path.exists(media_path(thumbnail.modified_image.name)) for thumbnail in expired)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_reap_expired_resumes_after_stop():
+    client = create_credentials_client(db_data_preparation())
+    create_expired_thumbnails(client, 3)
+
+    assert reap_expired(batch_size=1, max_batches=2).thumbnails == 2
+    assert GeneratedImage.objects.count() == 1
+
+    output = StringIO()
+    call_command('reap_expired', stdout=output)
+    assert 'Deleted 1 expired thumbnails, 1 source images' in output.getvalue()
+    assert GeneratedImage.objects.count() == 0
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_reap_expired_keeps_shared_files():
+    """
+    Thumbnail rendered from the same content is shared with live thumbnail, and is kept with its blob
+    """
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    post_image(client, '/api/timed/', expire_time=300, type='200')
+    GeneratedImage.objects.filter(expire_date__isnull=False).update(expire_date=timezone.now() - timedelta(seconds=1))
+    expired = GeneratedImage.objects.select_related('source_image__blob').get(expire_date__isnull=False)
+    shared = GeneratedImage.objects.get(type='200x200')
+
+    result = reap_expired()
+
+    assert (result.thumbnails, result.sources, result.files) == (1, 1, 0)
+    assert shared.modified_image == expired.modified_image
+    assert os.path.exists(media_path(shared.modified_image.name))
+    assert ImageBlob.objects.get().refcount == 1
+    assert os.path.exists(expired.source_image.blob.file.path)
@@ -0,0 +1,73 @@
+import pytest
+from datetime import timedelta
+from django.test import override_settings
+from django.utils import timezone
+from API.models import GeneratedImage
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+from img.resolver import get_resolver
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(params=[None, 'default'], ids=['local', 'shared'])
+def resolver(request):
+    """
+    Resolver using in-process cache, or cache from CACHES
+    """
+    with override_settings(SLUG_CACHE_BACKEND=request.param, MEDIA_URL=TESTS_MEDIA_URL,
+                           MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False):
+        resolver = get_resolver()
+        resolver.clear()
+        yield resolver
+
+
+def create_thumbnail():
+    post_image(create_credentials_client(db_data_preparation()))
+    return GeneratedImage.objects.filter(type='200x200').get()
+
+
+def test_resolved_slug_is_cached(resolver, django_assert_num_queries):
+    thumbnail = create_thumbnail()
+
+    with django_assert_num_queries(1):
+        resolved = resolver.resolve(thumbnail.slug)
+    with django_assert_num_queries(0):
+        assert resolver.resolve(thumbnail.slug) == resolved
+
+    assert resolved.image_url == thumbnail.modified_image.name
+    assert resolved.content_type == 'image/jpeg'
+    assert resolver.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_unknown_slug_is_cached(resolver, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert resolver.resolve('unknownslug1234') is None
+    with django_assert_num_queries(0):
+        assert resolver.resolve('unknownslug1234') is None
+
+
+def test_slug_invalidated_on_change(resolver):
+    thumbnail = create_thumbnail()
+    resolver.resolve(thumbnail.slug)
+
+    thumbnail.expire_time = 300
+    thumbnail.save()
+    assert resolver.resolve(thumbnail.slug).expire_date is not None
+
+    thumbnail.delete()
+    assert resolver.resolve(thumbnail.slug) is None
+
+
+def test_expired_and_pending_thumbnails_not_cached(resolver, django_assert_num_queries):
+    thumbnail = create_thumbnail()
+    GeneratedImage.objects.filter(id=thumbnail.id).update(expire_date=timezone.now() - timedelta(seconds=1))
+    resolver.resolve(thumbnail.slug)
+    with django_assert_num_queries(1):
+        resolver.resolve(thumbnail.slug)
+
+    GeneratedImage.objects.filter(id=thumbnail.id).update(expire_date=None, status=GeneratedImage.STATUS_PENDING)
+    resolver.resolve(thumbnail.slug)
+    with django_assert_num_queries(1):
+        assert resolver.resolve(thumbnail.slug).status == GeneratedImage.STATUS_PENDING
@@ -0,0 +1,324 @@
+import math
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from easy_thumbnails import engine
+from easy_thumbnails.files import get_thumbnailer
+from PIL import Image, ImageChops, ImageFile, ImageStat
+from API.models import StoredImage, GeneratedImage, ThumbnailJob
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, MOCK_IMAGE_PATH, CONTENT_TYPE_PNG
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+from API import thumbnails
+from API.engines import decode_source_image
+from API.thumbnails import enqueue_thumbnails, process_pending_jobs, claim_jobs, parse_thumbnail_type, \
+    render_thumbnails, shutdown_render_pool, get_thumbnail_options, materialize_thumbnail, materialize_lock, \
+    render_thumbnail, THUMBNAIL_OPTIONS, _materialize_locks
+
+
+pytestmark = pytest.mark.django_db
+
+
+def create_source_image(initial_data, thumbnail_types):
+    """
+    Creates StoredImage of test user, with pending thumbnails of given types
+    """
+    mock_image = SimpleUploadedFile(name=MOCK_IMAGE_PATH, content=open(MOCK_IMAGE_PATH, 'rb').read(),
+                                    content_type=CONTENT_TYPE_PNG)
+    source_image = StoredImage.objects.create(owner=initial_data['test_api_user_profile'], file=mock_image)
+    for thumbnail_type in thumbnail_types:
+        GeneratedImage.objects.create(source_image=source_image, type=thumbnail_type,
+                                      status=GeneratedImage.STATUS_PENDING)
+    return source_image
+
+
+def test_parse_thumbnail_type():
+    assert parse_thumbnail_type('840x680') == (840, 680)
+    assert parse_thumbnail_type('200') == (200, 200)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_process_pending_jobs_renders_thumbnails():
+    initial_data = db_data_preparation()
+    source_image = create_source_image(initial_data, ['200x200', '400x400'])
+    enqueue_thumbnails(source_image)
+
+    processed = process_pending_jobs()
+
+    assert processed == 1
+    assert ThumbnailJob.objects.count() == 0
+    for thumbnail in source_image.thumbnails.all():
+        assert thumbnail.status == GeneratedImage.STATUS_READY
+        assert thumbnail.modified_image.name.startswith(TESTS_MEDIA_URL)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_JOB_MAX_ATTEMPTS=2)
+def test_failed_job_is_retried_then_marked_failed():
+    initial_data = db_data_preparation()
+    source_image = create_source_image(initial_data, ['200x200', '0x0'])
+    enqueue_thumbnails(source_image)
+
+    process_pending_jobs()
+    job = ThumbnailJob.objects.get()
+    statuses = {item.type: item.status for item in source_image.thumbnails.all()}
+
+    assert job.status == ThumbnailJob.STATUS_FAILED
+    assert job.attempts == 2
+    assert '0x0' in job.error
+    assert statuses == {'200x200': GeneratedImage.STATUS_READY, '0x0': GeneratedImage.STATUS_FAILED}
+    assert claim_jobs(10) == []
+
+
+@pytest.mark.parametrize('draft_decoding', [True, False])
+def test_render_thumbnails_decodes_source_once(monkeypatch, draft_decoding):
+    initial_data = db_data_preparation()
+    opened = []
+    image_open = Image.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args)
+        return image_open(*args, **kwargs)
+
+    with override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT,
+                           THUMBNAIL_DRAFT_DECODING=draft_decoding):
+        source_image = create_source_image(initial_data, [])
+        monkeypatch.setattr('PIL.Image.open', counting_open)
+        results = render_thumbnails(source_image.file, ['200x200', '400x400', '840x680', '1000x1000'])
+
+    assert len(opened) == 1
+    assert all(result.error is None for result in results.values())
+
+
+@pytest.mark.parametrize('render_mode', ['inline', 'thread', 'process'])
+def test_render_thumbnails_output_matches_get_thumbnail(render_mode):
+    initial_data = db_data_preparation()
+    thumbnail_types = ['200x200', '400x400', '840x680', '1000x1000']
+
+    with override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_RENDER_MODE=render_mode,
+                           THUMBNAIL_RENDER_WORKERS=2):
+        source_image = create_source_image(initial_data, [])
+        reference_image = create_source_image(initial_data, [])
+        try:
+            results = render_thumbnails(source_image.file, thumbnail_types)
+        finally:
+            shutdown_render_pool()
+
+        for thumbnail_type in thumbnail_types:
+            options = dict(THUMBNAIL_OPTIONS, size=parse_thumbnail_type(thumbnail_type))
+            reference = get_thumbnailer(reference_image.file).get_thumbnail(options)
+            rendered_name = results[thumbnail_type].url[len(TESTS_MEDIA_URL):]
+            with default_storage.open(rendered_name) as rendered, default_storage.open(reference.name) as expected:
+                assert rendered.read() == expected.read()
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_RENDER_MODE='thread',
+                   THUMBNAIL_MAX_CONCURRENT_RENDERS=1)
+def test_render_slots_limit_concurrent_renders(monkeypatch):
+    initial_data = db_data_preparation()
+    source_image = create_source_image(initial_data, [])
+    running = []
+    most_running = []
+    process_image = engine.process_image
+
+    def tracking_process_image(*args, **kwargs):
+        running.append(1)
+        most_running.append(len(running))
+        try:
+            return process_image(*args, **kwargs)
+        finally:
+            running.pop()
+    monkeypatch.setattr('API.engines.engine.process_image', tracking_process_image)
+
+    try:
+        results = render_thumbnails(source_image.file, ['200x200', '400x400', '500x500', '1000x1000'])
+    finally:
+        shutdown_render_pool()
+
+    assert all(result.error is None for result in results.values())
+    assert max(most_running) == 1
+
+
+@override_settings(THUMBNAIL_RENDER_MODE='process', THUMBNAIL_RENDER_WORKERS=2, THUMBNAIL_MAX_CONCURRENT_RENDERS=2)
+def test_render_slots_released_after_pool_reset(monkeypatch):
+    """
+    Renders sent to process pool release slot they took, even if slots were reset while they were running
+    """
+    futures = []
+
+    class Pool:
+        def submit(self, function, *args):
+            futures.append(Future())
+            return futures[-1]
+    monkeypatch.setattr(thumbnails, 'get_render_pool', Pool)
+    thumbnailer = get_thumbnailer(open(MOCK_IMAGE_PATH, 'rb'), relative_name='image.png')
+    missing_options = {thumbnail_type: get_thumbnail_options(thumbnail_type) for thumbnail_type in ('200', '400')}
+    slots = thumbnails.get_render_slots()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        generating = pool.submit(thumbnails._generate_multiprocess, thumbnailer, missing_options)
+        while len(futures) < 2:
+            pass
+        shutdown_render_pool()
+        for future in futures:
+            future.set_result({})
+        generating.result(timeout=5)
+
+    assert slots._value == 2
+
+
+def make_large_jpeg(width=3000, height=2000):
+    """
+    Returns content of photo-like JPEG, much larger than standard thumbnails
+    """
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width // 10, height // 10), 48).convert('L').resize((width, height), Image.BICUBIC)
+    photo = Image.merge('RGB', [gradient, noise, gradient.transpose(Image.ROTATE_180)])
+    content = BytesIO()
+    photo.save(content, format='JPEG', quality=90)
+    return content.getvalue()
+
+
+def create_large_jpeg(initial_data, content):
+    """
+    Creates StoredImage from given JPEG content
+    """
+    mock_image = SimpleUploadedFile(name='large_photo.jpg', content=content, content_type='image/jpeg')
+    return StoredImage.objects.create(owner=initial_data['test_api_user_profile'], file=mock_image)
+
+
+def psnr(image_a, image_b):
+    """
+    Peak signal-to-noise ratio of two same-sized images, in decibels
+    """
+    difference = ImageChops.difference(image_a.convert('RGB'), image_b.convert('RGB'))
+    mse = sum(rms ** 2 for rms in ImageStat.Stat(difference).rms) / 3
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_draft_decoding_shrinks_large_jpeg_unless_original_size_is_rendered():
+    initial_data = db_data_preparation()
+    source_image = create_large_jpeg(initial_data, make_large_jpeg())
+    thumbnailer = get_thumbnailer(source_image.file)
+    small_options = {thumbnail_type: thumbnailer.get_options(get_thumbnail_options(thumbnail_type))
+                     for thumbnail_type in ['200x200', '400x400']}
+    all_options = dict(small_options, **{'3000x2000': thumbnailer.get_options(get_thumbnail_options('3000x2000'))})
+
+    assert decode_source_image(thumbnailer, small_options).size == (1500, 1000)
+    assert decode_source_image(thumbnailer, all_options).size == (3000, 2000)
+
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_draft_decoding_closes_source_of_truncated_jpeg():
+    initial_data = db_data_preparation()
+    content = make_large_jpeg()
+    source_image = create_large_jpeg(initial_data, content[:len(content) * 2 // 3])
+    thumbnailer = get_thumbnailer(source_image.file)
+    thumbnailer.close()
+
+    with pytest.raises(OSError):
+        decode_source_image(thumbnailer, {'200x200': thumbnailer.get_options(get_thumbnail_options('200x200'))})
+
+    assert thumbnailer.closed
+    assert not ImageFile.LOAD_TRUNCATED_IMAGES
+
+
+def test_draft_decoding_quality_matches_full_decode():
+    initial_data = db_data_preparation()
+    thumbnail_types = ['200x200', '400x400']
+    content = make_large_jpeg()
+    rendered = {}
+    for draft_decoding in [True, False]:
+        with override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT,
+                               THUMBNAIL_DRAFT_DECODING=draft_decoding):
+            source_image = create_large_jpeg(initial_data, content)
+            results = render_thumbnails(source_image.file, thumbnail_types)
+            rendered[draft_decoding] = {}
+            for thumbnail_type, result in results.items():
+                with default_storage.open(result.url[len(TESTS_MEDIA_URL):]) as thumbnail:
+                    rendered[draft_decoding][thumbnail_type] = Image.open(BytesIO(thumbnail.read()))
+
+    for thumbnail_type in thumbnail_types:
+        assert rendered[True][thumbnail_type].size == rendered[False][thumbnail_type].size
+        assert psnr(rendered[True][thumbnail_type], rendered[False][thumbnail_type]) > 30
+
+
+def count_renders(monkeypatch):
+    """
+    Counts thumbnails rendered on first view
+    :return: list to which rendered thumbnail type is appended on each render
+    """
+    renders = []
+
+    def counting_render_thumbnail(source_file, thumbnail_type):
+        renders.append(thumbnail_type)
+        return render_thumbnail(source_file, thumbnail_type)
+    monkeypatch.setattr('API.thumbnails.render_thumbnail', counting_render_thumbnail)
+    return renders
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_lazy_thumbnails_rendered_on_first_view(monkeypatch):
+    initial_data = db_data_preparation()
+    initial_data['test_account_type'].lazy_thumbnails = True
+    initial_data['test_account_type'].save()
+    client = create_credentials_client(initial_data)
+    renders = count_renders(monkeypatch)
+
+    response = post_image(client)
+    thumbnail = GeneratedImage.objects.get(type='500x500')
+    first_view = client.get(reverse('display_image', args=[thumbnail.slug]))
+    second_view = client.get(reverse('display_image', args=[thumbnail.slug]))
+
+    assert response.status_code == 201
+    assert set(response.json()['thumbnails_status'].values()) == {GeneratedImage.STATUS_DEFERRED}
+    assert ThumbnailJob.objects.count() == 0
+    assert first_view.status_code == 200
+    assert second_view.status_code == 200
+    assert renders == ['500x500']
+    assert GeneratedImage.objects.filter(status=GeneratedImage.STATUS_DEFERRED).count() == 4
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_concurrent_first_views_render_once(monkeypatch):
+    initial_data = db_data_preparation()
+    source_image = create_source_image(initial_data, ['200x200'])
+    thumbnail = source_image.thumbnails.get()
+    GeneratedImage.objects.filter(id=thumbnail.id).update(status=GeneratedImage.STATUS_DEFERRED)
+    renders = count_renders(monkeypatch)
+
+    def view():
+        try:
+            return materialize_thumbnail(thumbnail.slug).status
+        finally:
+            connection.close()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        statuses = list(pool.map(lambda _: view(), range(4)))
+
+    assert statuses == [GeneratedImage.STATUS_READY] * 4
+    assert renders == ['200x200']
+
+
+def test_materialize_lock_only_blocks_same_slug():
+    entered = []
+
+    def render(slug):
+        with materialize_lock(slug):
+            entered.append(slug)
+    pool = ThreadPoolExecutor(max_workers=2)
+    with materialize_lock('first'):
+        same = pool.submit(render, 'first')
+        pool.submit(render, 'second').result(timeout=5)
+        assert entered == ['second']
+    same.result(timeout=5)
+    pool.shutdown()
+
+    assert entered == ['second', 'first']
+    assert _materialize_locks == {}
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from API.models import ImageBlob, StoredImage
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, MOCK_IMAGE_PATH, ENDPOINT_ALL, \
+                                    CONTENT_TYPE_PNG, TEST_IMAGE_WIDTH, TEST_IMAGE_HEIGHT
+from API.test.utils import db_data_preparation, create_test_client, post_image
+
+
+pytestmark = pytest.mark.django_db
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False)
+def test_ingested_upload_hash_and_dimensions():
+    client = create_test_client(db_data_preparation())
+
+    response = post_image(client)
+
+    assert response.status_code == 201
+    blob = ImageBlob.objects.get()
+    with open(MOCK_IMAGE_PATH, 'rb') as f:
+        assert blob.sha256 == hashlib.sha256(f.read()).hexdigest()
+    assert (blob.width, blob.height) == (TEST_IMAGE_WIDTH, TEST_IMAGE_HEIGHT)
+    assert (StoredImage.objects.get().img_width, StoredImage.objects.get().img_height) == \
+        (TEST_IMAGE_WIDTH, TEST_IMAGE_HEIGHT)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_UPLOAD_MAX_SIZE=1024)
+def test_too_large_upload_rejected():
+    client = create_test_client(db_data_preparation())
+
+    response = post_image(client)
+    json_dict = json.loads(response.content.decode('utf8'))
+
+    assert response.status_code == 400
+    assert json_dict['file'] == ['File is larger than 1024 bytes.']
+    assert not StoredImage.objects.exists()
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_non_image_upload_rejected():
+    client = create_test_client(db_data_preparation())
+    mock_file = SimpleUploadedFile(name='fake.png', content=b'not an image' * 1000, content_type=CONTENT_TYPE_PNG)
+
+    response = client.post(ENDPOINT_ALL, {'file': mock_file}, format='multipart')
+    json_dict = json.loads(response.content.decode('utf8'))
+
+    assert response.status_code == 400
+    assert json_dict['file'][0].startswith('Upload a valid image.')
+    assert not ImageBlob.objects.exists()
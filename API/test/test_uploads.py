@@ -0,0 +1,153 @@
+import json
+import os
+from datetime import timedelta
+import pytest
+from django.test import override_settings
+from django.utils import timezone
+from API.models import ImageBlob, StoredImage, UploadSession
+from API.reaper import reap_expired
+from API.resumable import get_session_path, lock_session_file
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, MOCK_IMAGE_PATH, TEST_IMAGE_WIDTH, \
+                                    TEST_IMAGE_HEIGHT
+from API.test.utils import db_data_preparation, create_test_client
+
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT_UPLOADS = '/api/uploads/'
+TESTS_UPLOAD_SESSION_ROOT = os.path.join(TESTS_MEDIA_ROOT, 'upload_sessions')
+
+
+def start_session(client, size, file_name='image.png'):
+    response = client.post(ENDPOINT_UPLOADS, {'file_name': file_name, 'size': size}, format='json')
+    assert response.status_code == 201
+    return json.loads(response.content.decode('utf8'))
+
+
+def put_chunk(client, session_id, content, start, total):
+    return client.put(f'{ENDPOINT_UPLOADS}{session_id}/', content, content_type='application/octet-stream',
+                      HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(content) - 1}/{total}')
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False,
+                   UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT)
+def test_chunked_upload_resumed_and_finalized():
+    client = create_test_client(db_data_preparation())
+    with open(MOCK_IMAGE_PATH, 'rb') as f:
+        content = f.read()
+    chunk_size = len(content) // 3 + 1
+    session = start_session(client, len(content))
+
+    assert put_chunk(client, session['id'], content[:chunk_size], 0, len(content)).status_code == 200
+    # Chunk sent again after the first one was received, like after lost response, does not fit offset
+    response = put_chunk(client, session['id'], content[:chunk_size], 0, len(content))
+    assert response.status_code == 409
+    assert json.loads(response.content.decode('utf8'))['offset'] == chunk_size
+
+    offset = json.loads(client.get(f'{ENDPOINT_UPLOADS}{session["id"]}/').content.decode('utf8'))['offset']
+    while offset < len(content):
+        response = put_chunk(client, session['id'], content[offset:offset + chunk_size], offset, len(content))
+        offset = json.loads(response.content.decode('utf8'))['offset']
+
+    response = client.post(f'{ENDPOINT_UPLOADS}{session["id"]}/finalize/')
+    json_dict = json.loads(response.content.decode('utf8'))
+
+    assert response.status_code == 201
+    assert set(json_dict['thumbnails_status'].values()) == {'ready'}
+    image = StoredImage.objects.get()
+    assert (image.img_width, image.img_height) == (TEST_IMAGE_WIDTH, TEST_IMAGE_HEIGHT)
+    with open(image.file.path, 'rb') as f:
+        assert f.read() == content
+    assert not UploadSession.objects.exists()
+    assert os.listdir(TESTS_UPLOAD_SESSION_ROOT) == []
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT)
+def test_session_used_by_other_request_is_locked():
+    client = create_test_client(db_data_preparation())
+    session = start_session(client, 100)
+
+    with lock_session_file(UploadSession.objects.get()) as part_file:
+        assert part_file is not None
+        response = put_chunk(client, session['id'], b'x' * 50, 0, 100)
+        assert response.status_code == 409
+        assert client.post(f'{ENDPOINT_UPLOADS}{session["id"]}/finalize/').status_code == 409
+        assert client.delete(f'{ENDPOINT_UPLOADS}{session["id"]}/').status_code == 409
+
+    assert put_chunk(client, session['id'], b'x' * 50, 0, 100).status_code == 200
+    assert UploadSession.objects.get().offset == 50
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False,
+                   UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT)
+def test_image_kept_when_thumbnails_of_finalized_upload_fail(monkeypatch):
+    client = create_test_client(db_data_preparation())
+    with open(MOCK_IMAGE_PATH, 'rb') as f:
+        content = f.read()
+    session = start_session(client, len(content))
+    put_chunk(client, session['id'], content, 0, len(content))
+
+    def failing_render(sources):
+        raise RuntimeError('render failed')
+    monkeypatch.setattr('API.uploads.render_thumbnail_batch', failing_render)
+    with pytest.raises(RuntimeError):
+        client.post(f'{ENDPOINT_UPLOADS}{session["id"]}/finalize/')
+
+    image = StoredImage.objects.get()
+    assert os.path.exists(image.file.path)
+    assert not UploadSession.objects.exists()
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT)
+def test_incomplete_upload_not_finalized():
+    client = create_test_client(db_data_preparation())
+    session = start_session(client, 100)
+    put_chunk(client, session['id'], b'x' * 50, 0, 100)
+
+    response = client.post(f'{ENDPOINT_UPLOADS}{session["id"]}/finalize/')
+
+    assert response.status_code == 409
+    assert json.loads(response.content.decode('utf8'))['offset'] == 50
+    assert not StoredImage.objects.exists()
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT)
+def test_finalized_non_image_rejected():
+    client = create_test_client(db_data_preparation())
+    content = b'not an image' * 300
+    session = start_session(client, len(content))
+    put_chunk(client, session['id'], content, 0, len(content))
+
+    response = client.post(f'{ENDPOINT_UPLOADS}{session["id"]}/finalize/')
+
+    assert response.status_code == 400
+    assert 'file' in json.loads(response.content.decode('utf8'))
+    assert not ImageBlob.objects.exists()
+    assert not UploadSession.objects.exists()
+
+
+@override_settings(UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT, IMAGE_UPLOAD_MAX_SIZE=1000)
+def test_session_validation():
+    client = create_test_client(db_data_preparation())
+
+    response = client.post(ENDPOINT_UPLOADS, {'file_name': 'image.txt', 'size': 1001}, format='json')
+    json_dict = json.loads(response.content.decode('utf8'))
+
+    assert response.status_code == 400
+    assert set(json_dict.keys()) == {'file_name', 'size'}
+
+
+@override_settings(UPLOAD_SESSION_ROOT=TESTS_UPLOAD_SESSION_ROOT)
+def test_expired_session_reaped():
+    client = create_test_client(db_data_preparation())
+    session = start_session(client, 100)
+    put_chunk(client, session['id'], b'x' * 100, 0, 100)
+    UploadSession.objects.update(expire_date=timezone.now() - timedelta(seconds=1))
+    path = get_session_path(UploadSession.objects.get())
+
+    assert put_chunk(client, session['id'], b'x' * 10, 0, 100).status_code == 410
+    assert client.get(f'{ENDPOINT_UPLOADS}{session["id"]}/').status_code == 410
+    assert client.post(f'{ENDPOINT_UPLOADS}{session["id"]}/finalize/').status_code == 410
+    assert reap_expired().sessions == 1
+    assert not UploadSession.objects.exists()
+    assert not os.path.exists(path)
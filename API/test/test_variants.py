@@ -0,0 +1,104 @@
+import os
+import pytest
+from datetime import timedelta
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from API.models import GeneratedImage
+from API.reaper import reap_expired
+from API.test.constants_tests import TESTS_MEDIA_ROOT, TESTS_MEDIA_URL
+from API.test.test_views import create_timed_thumbnail
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+from API.utils import get_storage_name
+from img.delivery import choose_variant_format
+
+
+pytestmark = pytest.mark.django_db
+
+ACCEPT_WEBP = 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'
+
+
+def media_path(image_url):
+    return os.path.join(TESTS_MEDIA_ROOT, get_storage_name(image_url))
+
+
+def test_variant_format_chosen_from_accept_header():
+    assert choose_variant_format(ACCEPT_WEBP, ['avif', 'webp']) == 'avif'
+    assert choose_variant_format(ACCEPT_WEBP, ['webp']) == 'webp'
+    assert choose_variant_format('image/avif;q=0.5, image/webp', ['avif', 'webp']) == 'webp'
+    assert choose_variant_format('image/webp;q=0, image/*', ['webp']) is None
+    assert choose_variant_format('*/*', ['avif', 'webp']) is None
+    assert choose_variant_format('', ['webp']) is None
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file',
+                   THUMBNAIL_VARIANT_FORMATS=['webp'])
+def test_variant_encoded_on_first_request(django_assert_num_queries):
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+    url = reverse('display_image', args=[thumbnail.slug])
+
+    webp_response = client.get(url, HTTP_ACCEPT=ACCEPT_WEBP)
+    body = b''.join(webp_response.streaming_content)
+    with django_assert_num_queries(1):
+        cached_response = client.get(url, HTTP_ACCEPT=ACCEPT_WEBP, HTTP_IF_NONE_MATCH=webp_response['ETag'])
+    jpeg_response = client.get(url)
+
+    assert webp_response['Content-Type'] == 'image/webp'
+    assert body[8:12] == b'WEBP'
+    assert cached_response.status_code == 304
+    assert jpeg_response['Content-Type'] == 'image/jpeg'
+    assert jpeg_response['ETag'] != webp_response['ETag']
+    for response in (webp_response, cached_response, jpeg_response):
+        assert response['Vary'] == 'Accept'
+    thumbnail.refresh_from_db()
+    assert thumbnail.variants['webp'].endswith('.q80.webp')
+    assert os.path.getsize(media_path(thumbnail.variants['webp'])) < os.path.getsize(
+        media_path(thumbnail.modified_image.name))
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, THUMBNAIL_QUEUE_ENABLED=False,
+                   THUMBNAIL_VARIANT_FORMATS=['webp'], THUMBNAIL_VARIANTS_EAGER=True)
+def test_variants_encoded_with_quality_of_account_type():
+    initial_data = db_data_preparation()
+    initial_data['test_account_type'].webp_quality = 40
+    initial_data['test_account_type'].save()
+    client = create_credentials_client(initial_data)
+
+    assert post_image(client).status_code == 201
+
+    variant_urls = [thumbnail.variants['webp'] for thumbnail in GeneratedImage.objects.all()]
+    assert any(variant_urls)
+    # Variant not smaller than thumbnail is not stored
+    assert all(url == '' or url.endswith('.q40.webp') for url in variant_urls)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file',
+                   THUMBNAIL_VARIANT_FORMATS=[])
+def test_thumbnail_sent_without_variant_formats():
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+
+    response = client.get(reverse('display_image', args=[thumbnail.slug]), HTTP_ACCEPT=ACCEPT_WEBP)
+
+    assert response['Content-Type'] == 'image/jpeg'
+    assert not response.has_header('Vary')
+    thumbnail.refresh_from_db()
+    assert thumbnail.variants == {}
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file',
+                   THUMBNAIL_VARIANT_FORMATS=['webp'])
+def test_variant_files_reaped_with_thumbnail(django_capture_on_commit_callbacks):
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+    client.get(reverse('display_image', args=[thumbnail.slug]), HTTP_ACCEPT=ACCEPT_WEBP)
+    thumbnail.refresh_from_db()
+    variant_path = media_path(thumbnail.variants['webp'])
+    assert os.path.exists(variant_path)
+    GeneratedImage.objects.filter(id=thumbnail.id).update(expire_date=timezone.now() - timedelta(seconds=1))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        reap_expired()
+
+    assert not os.path.exists(variant_path)
@@ -1,19 +1,22 @@
 import pytest
+from datetime import timedelta
 from django.test import override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from API.models import CustomThumbnailSize, AccountTypePermissions, APIUserProfile, StoredImage, GeneratedImage
 from API.test.constants_tests import TEST_USER_PASS, TEST_USER_LOGIN, TESTS_MEDIA_ROOT, TESTS_MEDIA_URL, \
     TEST_PROFILE_TYPE_NAME
-from API.test.utils import db_data_preparation
+from API.test.utils import db_data_preparation, create_credentials_client, post_image
+from API.thumbnails import process_pending_jobs
 
 
 pytestmark = pytest.mark.django_db  # all test functions can access db
 
 
-@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='template')
 def test_image_webpage():
     """
     Create thumbnail, test existence of corresponding image page where img should be visible
@@ -28,6 +31,7 @@ def test_image_webpage():
     mock_image = SimpleUploadedFile(name=mock_image_path, content=open(mock_image_path, 'rb').read(),
                                     content_type='image/png')
     client.post(endpoint_all, {'file': mock_image}, format='multipart')
+    process_pending_jobs()
     images = GeneratedImage.objects.select_related('source_image')\
                                    .filter(source_image__owner=initial_data['test_api_user_profile'])
 
@@ -41,3 +45,94 @@ def test_image_webpage():
     for index, response in enumerate(responses):
         assert response.status_code == 200
         assert 'img' in page_bodies[index]
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='template')
+def test_image_webpage_pending_thumbnail():
+    """
+    Thumbnail page reports that thumbnail is still being generated, before thumbnail worker renders it
+    """
+    initial_data = db_data_preparation()
+    client = APIClient()
+    token = Token.objects.create(user=initial_data['test_user'])
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    mock_image_path = "test_image.png"
+    mock_image = SimpleUploadedFile(name=mock_image_path, content=open(mock_image_path, 'rb').read(),
+                                    content_type='image/png')
+    client.post('/api/all/', {'file': mock_image}, format='multipart')
+    image = GeneratedImage.objects.filter(source_image__owner=initial_data['test_api_user_profile']).first()
+
+    response = client.get(reverse('display_image', args=[image.slug]))
+
+    assert response.status_code == 202
+    assert 'being generated' in response.content.decode('utf-8')
+
+
+def create_timed_thumbnail(client):
+    """
+    Creates time limited thumbnail, rendered during request
+    :return: GeneratedImage object
+    """
+    post_image(client, '/api/timed/', expire_time=300, type='200')
+    return GeneratedImage.objects.get(expire_date__isnull=False)
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file')
+def test_image_file_delivery():
+    """
+    Thumbnail file is sent directly, with validators allowing client to reuse its cached copy
+    """
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+
+    response = client.get(reverse('display_image', args=[thumbnail.slug]))
+    body = b''.join(response.streaming_content)
+    cached_response = client.get(reverse('display_image', args=[thumbnail.slug]),
+                                 HTTP_IF_NONE_MATCH=response['ETag'])
+
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'image/jpeg'
+    assert body.startswith(b'\xff\xd8')
+    assert 'Last-Modified' in response
+    assert 0 < int(response['Cache-Control'].split('max-age=')[1]) <= 300
+    assert cached_response.status_code == 304
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='nginx')
+def test_image_nginx_delivery():
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+
+    response = client.get(reverse('display_image', args=[thumbnail.slug]))
+
+    assert response.status_code == 200
+    assert response['X-Accel-Redirect'] == thumbnail.modified_image.name
+    assert response['X-Accel-Redirect'].startswith(TESTS_MEDIA_URL)
+    assert response.content == b''
+
+
+@pytest.mark.parametrize('mode', ['file', 'nginx', 'template'])
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT)
+def test_image_expired_and_unknown_slug(mode):
+    client = create_credentials_client(db_data_preparation())
+    thumbnail = create_timed_thumbnail(client)
+    GeneratedImage.objects.filter(id=thumbnail.id).update(expire_date=timezone.now() - timedelta(seconds=1))
+
+    with override_settings(IMAGE_DELIVERY_MODE=mode):
+        expired_response = client.get(reverse('display_image', args=[thumbnail.slug]))
+        unknown_response = client.get(reverse('display_image', args=['unknownslug1234']))
+
+    assert expired_response.status_code == 410
+    assert unknown_response.status_code == 404
+
+
+@override_settings(MEDIA_URL=TESTS_MEDIA_URL, MEDIA_ROOT=TESTS_MEDIA_ROOT, IMAGE_DELIVERY_MODE='file')
+def test_image_file_delivery_pending_thumbnail():
+    client = create_credentials_client(db_data_preparation())
+    post_image(client)
+    thumbnail = GeneratedImage.objects.first()
+
+    response = client.get(reverse('display_image', args=[thumbnail.slug]))
+
+    assert response.status_code == 202
+    assert 'no-store' in response['Cache-Control']
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 from API.models import CustomThumbnailSize, AccountTypePermissions, APIUserProfile, StoredImage, GeneratedImage
 
 from API.test.constants_tests import TEST_USER_LOGIN, TEST_USER_PASS, ENDPOINT_ALL, \
@@ -49,3 +51,26 @@ def create_test_client(initial_data, authorize=True):
         # api views check for authorization in the request header, therefore apiclient needs token in his header
         client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
     return client
+
+
+def create_credentials_client(initial_data, scheme='Token'):
+    """
+    Creates APIClient authenticated only by credentials in its header, so requests go through authentication classes
+    """
+    client = APIClient()
+    user = initial_data['test_user']
+    if scheme == 'Token':
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+    else:
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(AccessToken.for_user(user)))
+    return client
+
+
+def post_image(client, endpoint=ENDPOINT_ALL, **data):
+    """
+    Sends test image with additional form data to endpoint
+    :return: response
+    """
+    mock_image = SimpleUploadedFile(name=MOCK_IMAGE_PATH, content=open(MOCK_IMAGE_PATH, 'rb').read(),
+                                    content_type=CONTENT_TYPE_PNG)
+    return client.post(endpoint, {'file': mock_image, **data}, format='multipart')
@@ -0,0 +1,588 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from easy_thumbnails.conf import settings as easy_thumbnails_settings
+from easy_thumbnails.exceptions import EasyThumbnailsError
+from easy_thumbnails.files import ThumbnailFile, get_thumbnailer
+from easy_thumbnails.models import Source, Thumbnail
+from easy_thumbnails.signals import thumbnail_created
+from easy_thumbnails.utils import get_storage_hash
+from PIL import Image
+from API.engines import get_image_engine
+from API.listing_cache import mark_owners_changed
+from API.metrics import increment, stage
+from API.models import GeneratedImage, ThumbnailJob
+from API.plans import get_thumbnail_plan
+
+logger = logging.getLogger(__name__)
+
+
+# Options used for every generated thumbnail, size is added per thumbnail type
+THUMBNAIL_OPTIONS = {'upscale': True, 'crop': True}
+
+RenderResult = namedtuple('RenderResult', ['url', 'error'])
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_render_slots = None
+# Renders of the same deferred thumbnail in single process wait for each other on lock of its slug.
+# Dict holds slug: [lock, number of callers holding or waiting for it], lock is dropped when number drops to 0
+_materialize_locks = {}
+_materialize_locks_guard = threading.Lock()
+
+
+def _drop_inherited_connections():
+    """
+    Initializer of render processes. Database connections copied from parent process are
+    forgotten without closing, closing them would also close connections used by parent.
+    """
+    for connection in connections.all():
+        connection.connection = None
+
+
+def get_render_mode():
+    """
+    Returns THUMBNAIL_RENDER_MODE, except that thread pool is used in place of process pool for image engines
+    which cannot run in forked processes
+    """
+    mode = settings.THUMBNAIL_RENDER_MODE
+    if mode == 'process' and not get_image_engine().fork_safe:
+        return 'thread'
+    return mode
+
+
+def get_render_pool():
+    """
+    Returns thread or process pool used for rendering, depending on THUMBNAIL_RENDER_MODE.
+    Pool is created on first use and shared by all requests handled by this process.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            max_workers = settings.THUMBNAIL_RENDER_WORKERS or os.cpu_count()
+            if get_render_mode() == 'process':
+                _render_pool = ProcessPoolExecutor(max_workers=max_workers,
+                                                   mp_context=multiprocessing.get_context('fork'),
+                                                   initializer=_drop_inherited_connections)
+            else:
+                _render_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbnail-render')
+        return _render_pool
+
+
+def shutdown_render_pool():
+    """
+    Stops render pool, next render creates new one using current settings
+    """
+    global _render_pool, _render_slots
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown()
+        _render_pool = None
+        _render_slots = None
+
+
+def get_render_slots():
+    """
+    Returns semaphore limiting number of renders running at once in this process,
+    to THUMBNAIL_MAX_CONCURRENT_RENDERS
+    """
+    global _render_slots
+    with _render_pool_lock:
+        if _render_slots is None:
+            _render_slots = threading.BoundedSemaphore(settings.THUMBNAIL_MAX_CONCURRENT_RENDERS)
+        return _render_slots
+
+
+@contextmanager
+def render_slot():
+    """
+    Waits until number of running renders drops below THUMBNAIL_MAX_CONCURRENT_RENDERS.
+    In render processes it does nothing, since slots are held by parent process.
+    """
+    if multiprocessing.parent_process() is not None:
+        yield
+        return
+    slots = get_render_slots()
+    with slots:
+        yield
+
+
+def parse_thumbnail_type(thumbnail_type):
+    """
+    Converts thumbnail type string into (width, height) tuple of ints.
+    :param thumbnail_type: string like '200x200', or '200' for square timed thumbnails
+    """
+    sides = str(thumbnail_type).split('x')
+    if len(sides) == 1:
+        sides = sides * 2
+    return int(sides[0]), int(sides[1])
+
+
+def get_thumbnail_options(thumbnail_type):
+    """
+    Returns easy_thumbnails options used for rendering thumbnail of given type
+    """
+    return dict(THUMBNAIL_OPTIONS, size=parse_thumbnail_type(thumbnail_type))
+
+
+def generate_thumbnail_file(thumbnailer, source_image, options):
+    """
+    Resizes, crops and encodes source image opened by image engine. With Pillow engine output is the same
+    as of Thumbnailer.generate_thumbnail. Does not touch database or storage, so it is safe to run in render pool.
+    :return: tuple of thumbnail file name, encoded thumbnail and processed image of engine
+    """
+    sides = [float(side) for side in options['size']]
+    if max(sides) == 0 or min(sides) < 0:
+        raise EasyThumbnailsError("The source image has an invalid size ({0}x{1})".format(*options['size']))
+    image_engine = get_image_engine()
+    with render_slot():
+        with stage('resize'):
+            thumbnail_image = image_engine.resize_crop(source_image, options, thumbnailer)
+        filename = thumbnailer.get_thumbnail_name(options, transparent=image_engine.is_transparent(thumbnail_image))
+        with stage('encode'):
+            data = image_engine.encode(thumbnail_image, os.path.splitext(filename)[1][1:],
+                                       quality=options['quality'], subsampling=options['subsampling'])
+    return filename, data, thumbnail_image
+
+
+def _generate_inline(thumbnailer, missing_options):
+    """
+    Generates thumbnails one after another in calling thread, from source decoded once
+    """
+    with stage('decode'):
+        source_images = get_image_engine().open(thumbnailer, missing_options)
+    generated = {}
+    for thumbnail_type, options in missing_options.items():
+        try:
+            generated[thumbnail_type] = generate_thumbnail_file(thumbnailer, source_images[thumbnail_type], options)
+        except Exception as e:
+            generated[thumbnail_type] = e
+    return generated
+
+
+def _generate_threaded(thumbnailer, missing_options):
+    """
+    Generates thumbnails in render thread pool from source decoded once in calling thread.
+    Pillow and libvips release GIL while resizing and encoding, so sizes are rendered in parallel.
+    """
+    with stage('decode'):
+        source_images = get_image_engine().open(thumbnailer, missing_options)
+    futures = {thumbnail_type: get_render_pool().submit(generate_thumbnail_file, thumbnailer,
+                                                        source_images[thumbnail_type], options)
+               for thumbnail_type, options in missing_options.items()}
+    generated = {}
+    for thumbnail_type, future in futures.items():
+        try:
+            generated[thumbnail_type] = future.result()
+        except Exception as e:
+            generated[thumbnail_type] = e
+    return generated
+
+
+def _generate_in_process(source_name, missing_options):
+    """
+    Runs in render process pool. Decodes source once and generates all passed thumbnails.
+    """
+    thumbnailer = get_thumbnailer(source_name)
+    try:
+        generated = _generate_inline(thumbnailer, missing_options)
+    except Exception as e:
+        return {thumbnail_type: e for thumbnail_type in missing_options}
+    # Processed images are not sent back to parent process, only encoded thumbnails
+    return {thumbnail_type: item if isinstance(item, Exception) else item[:2] + (None,)
+            for thumbnail_type, item in generated.items()}
+
+
+def _generate_multiprocess(thumbnailer, missing_options):
+    """
+    Splits thumbnails between processes of render pool. Every process decodes source on its own,
+    so sizes are split into as few chunks as there are pool workers.
+    """
+    pool_size = settings.THUMBNAIL_RENDER_WORKERS or os.cpu_count()
+    chunks = [{} for _ in range(min(pool_size, len(missing_options)))]
+    for index, (thumbnail_type, options) in enumerate(missing_options.items()):
+        chunks[index % len(chunks)][thumbnail_type] = options
+    # Render slot is held by parent process for every chunk sent to the pool
+    futures = []
+    for chunk in chunks:
+        # Slot is released on the same semaphore, even if pool and slots are reset meanwhile
+        slots = get_render_slots()
+        slots.acquire()
+        future = get_render_pool().submit(_generate_in_process, thumbnailer.name, chunk)
+        future.add_done_callback(lambda f, slots=slots: slots.release())
+        futures.append((chunk, future))
+    generated = {}
+    for chunk, future in futures:
+        try:
+            generated.update(future.result())
+        except Exception as e:
+            generated.update({thumbnail_type: e for thumbnail_type in chunk})
+    return generated
+
+
+RENDER_MODE_GENERATORS = {
+    'inline': _generate_inline,
+    'thread': _generate_threaded,
+    'process': _generate_multiprocess,
+}
+
+
+def find_existing_thumbnails(thumbnailer, thumbnail_types):
+    """
+    Looks up thumbnails already rendered from source of thumbnailer
+    :return: tuple of dict of thumbnail type: RenderResult of found thumbnails and thumbnails which failed,
+             and dict of thumbnail type: options of missing thumbnails
+    """
+    results = {}
+    missing_options = {}
+    for thumbnail_type in thumbnail_types:
+        try:
+            options = thumbnailer.get_options(get_thumbnail_options(thumbnail_type))
+            thumbnail = thumbnailer.get_existing_thumbnail(options)
+        except Exception as e:
+            results[thumbnail_type] = RenderResult(None, e)
+            continue
+        if thumbnail is None:
+            missing_options[thumbnail_type] = options
+        else:
+            results[thumbnail_type] = RenderResult(thumbnail.url, None)
+    return results, missing_options
+
+
+def store_thumbnail_file(thumbnailer, thumbnail):
+    """
+    Saves ThumbnailFile of source of thumbnailer to storage, replacing existing file of the same name, like
+    Thumbnailer.save_thumbnail. Thumbnail is recorded in easy_thumbnails tables by record_thumbnails.
+    """
+    if easy_thumbnails_settings.THUMBNAIL_CACHE_DIMENSIONS:
+        # Dimensions are cached by easy_thumbnails, which records thumbnails one at a time
+        thumbnailer.save_thumbnail(thumbnail)
+        return
+    thumbnailer.thumbnail_storage.delete(thumbnail.name)
+    thumbnailer.thumbnail_storage.save(thumbnail.name, thumbnail)
+
+
+def record_thumbnails(recorded):
+    """
+    Records ThumbnailFiles saved with store_thumbnail_file in easy_thumbnails tables, along with their source
+    images, like Thumbnailer.save_thumbnail does for each of them, with number of queries independent of number
+    of thumbnails and sources
+    :param recorded: list of tuples of thumbnailer of source image and list of its ThumbnailFiles
+    """
+    recorded = [(thumbnailer, thumbnails) for thumbnailer, thumbnails in recorded if thumbnails]
+    if not recorded or easy_thumbnails_settings.THUMBNAIL_CACHE_DIMENSIONS:
+        return
+    now = timezone.now()
+    source_keys = {(get_storage_hash(thumbnailer.source_storage), thumbnailer.name) for thumbnailer, _ in recorded}
+    # Rows recorded before, also by concurrent renders, are skipped and have their modification time updated
+    Source.objects.bulk_create([Source(storage_hash=storage_hash, name=name, modified=now)
+                                for storage_hash, name in source_keys], ignore_conflicts=True)
+    source_filter = Q()
+    for storage_hash, name in source_keys:
+        source_filter |= Q(storage_hash=storage_hash, name=name)
+    Source.objects.filter(source_filter).update(modified=now)
+    source_ids = {(source.storage_hash, source.name): source.id for source in Source.objects.filter(source_filter)}
+
+    thumbnail_rows = [
+        Thumbnail(storage_hash=get_storage_hash(thumbnailer.thumbnail_storage), name=thumbnail.name, modified=now,
+                  source_id=source_ids[(get_storage_hash(thumbnailer.source_storage), thumbnailer.name)])
+        for thumbnailer, thumbnails in recorded for thumbnail in thumbnails]
+    Thumbnail.objects.bulk_create(thumbnail_rows, ignore_conflicts=True)
+    Thumbnail.objects.filter(source_id__in={row.source_id for row in thumbnail_rows},
+                             storage_hash__in={row.storage_hash for row in thumbnail_rows},
+                             name__in={row.name for row in thumbnail_rows}).update(modified=now)
+    for _, thumbnails in recorded:
+        for thumbnail in thumbnails:
+            thumbnail_created.send(sender=thumbnail)
+
+
+def store_generated_thumbnails(thumbnailer, missing_options, generated):
+    """
+    Saves thumbnails generated from source of thumbnailer to storage, to be recorded with record_thumbnails
+    :param generated: dict of thumbnail type: generated thumbnail, or exception raised while generating it
+    :return: tuple of dict of thumbnail type: RenderResult of thumbnails which failed, and dict of thumbnail type:
+             ThumbnailFile of saved thumbnails
+    """
+    failed = {}
+    saved = {}
+    for thumbnail_type, item in generated.items():
+        if isinstance(item, Exception):
+            failed[thumbnail_type] = RenderResult(None, item)
+            continue
+        filename, data, thumbnail_image = item
+        thumbnail = ThumbnailFile(filename, file=ContentFile(data), storage=thumbnailer.thumbnail_storage,
+                                  thumbnail_options=missing_options[thumbnail_type])
+        if isinstance(thumbnail_image, Image.Image):
+            # Dimensions of thumbnail are read from Pillow image, instead of encoded file
+            thumbnail.image = thumbnail_image
+        try:
+            with stage('storage'):
+                store_thumbnail_file(thumbnailer, thumbnail)
+        except Exception as e:
+            failed[thumbnail_type] = RenderResult(None, e)
+            continue
+        saved[thumbnail_type] = thumbnail
+        increment('bytes_written', len(data), label='thumbnail')
+    return failed, saved
+
+
+def _generate_batch(missing):
+    """
+    Generates missing thumbnails of many sources. Single source is rendered according to THUMBNAIL_RENDER_MODE.
+    Many sources are rendered one source per worker of render pool, each decoded in the worker rendering it,
+    unless render mode is inline.
+    :param missing: dict of key: tuple of thumbnailer and its missing options
+    :return: dict of key: dict of thumbnail type: generated thumbnail or exception
+    """
+    mode = get_render_mode()
+    if mode == 'inline' or len(missing) == 1:
+        generate = RENDER_MODE_GENERATORS[mode]
+        generated = {}
+        for key, (thumbnailer, missing_options) in missing.items():
+            try:
+                generated[key] = generate(thumbnailer, missing_options)
+            except Exception as e:
+                generated[key] = {thumbnail_type: e for thumbnail_type in missing_options}
+        return generated
+
+    futures = {}
+    for key, (thumbnailer, missing_options) in missing.items():
+        if mode == 'process':
+            # Render slot is held by parent process for every source sent to the pool
+            slots = get_render_slots()
+            slots.acquire()
+            future = get_render_pool().submit(_generate_in_process, thumbnailer.name, missing_options)
+            future.add_done_callback(lambda f, slots=slots: slots.release())
+        else:
+            future = get_render_pool().submit(_generate_inline, thumbnailer, missing_options)
+        futures[key] = future
+    generated = {}
+    for key, future in futures.items():
+        try:
+            generated[key] = future.result()
+        except Exception as e:
+            generated[key] = {thumbnail_type: e for thumbnail_type in missing[key][1]}
+    return generated
+
+
+def render_thumbnail_batch(sources):
+    """
+    Renders thumbnails of many source images, with the same output as render_thumbnails called for each of them.
+    Lookups and saving of thumbnails stay in calling thread, while sources are decoded and rendered in parallel.
+    :param sources: dict of key: tuple of FieldFile of source image and types of its thumbnails
+    :return: dict of key: dict of thumbnail type: RenderResult, containing url or exception raised during rendering
+    """
+    thumbnailers = {}
+    results = {}
+    missing = {}
+    for key, (source_file, thumbnail_types) in sources.items():
+        thumbnailer = get_thumbnailer(source_file)
+        results[key], missing_options = find_existing_thumbnails(thumbnailer, thumbnail_types)
+        thumbnailers[key] = thumbnailer
+        if missing_options:
+            missing[key] = (thumbnailer, missing_options)
+
+    if missing:
+        # Thumbnails rendered in pool are timed as whole, those rendered inline by stages of rendering
+        with stage('render'):
+            generated_batch = _generate_batch(missing)
+        saved = {}
+        for key, generated in generated_batch.items():
+            failed, saved[key] = store_generated_thumbnails(thumbnailers[key], missing[key][1], generated)
+            results[key].update(failed)
+        try:
+            with stage('storage'):
+                record_thumbnails([(thumbnailers[key], list(thumbnails.values())) for key, thumbnails in saved.items()])
+        except Exception as e:
+            for key, thumbnails in saved.items():
+                results[key].update({thumbnail_type: RenderResult(None, e) for thumbnail_type in thumbnails})
+        else:
+            for key, thumbnails in saved.items():
+                increment('thumbnails_rendered', len(thumbnails))
+                results[key].update({thumbnail_type: RenderResult(thumbnail.url, None)
+                                     for thumbnail_type, thumbnail in thumbnails.items()})
+    return {key: {thumbnail_type: results[key][thumbnail_type] for thumbnail_type in thumbnail_types}
+            for key, (source_file, thumbnail_types) in sources.items()}
+
+
+def render_thumbnails(source_file, thumbnail_types):
+    """
+    Renders thumbnails of all given types using source image decoded only once.
+    Thumbnails already rendered for source file are reused without decoding it.
+    With Pillow engine output is same as separate get_thumbnailer(source_file).get_thumbnail(options) call
+    for each type.
+    Missing thumbnails are generated according to THUMBNAIL_RENDER_MODE, inline, or in thread or process pool,
+    while lookups and saving of thumbnails stay in calling thread.
+    :param source_file: FieldFile of StoredImage
+    :param thumbnail_types: types of GeneratedImage, describing sizes of thumbnails
+    :return: dict of thumbnail type: RenderResult, containing url or exception raised during rendering
+    """
+    return render_thumbnail_batch({source_file.name: (source_file, thumbnail_types)})[source_file.name]
+
+
+def render_thumbnail(source_file, thumbnail_type):
+    """
+    Renders (or reuses already rendered) single thumbnail of source image
+    :param source_file: FieldFile of StoredImage
+    :param thumbnail_type: type of GeneratedImage, describing size of thumbnail
+    :return: url of rendered thumbnail
+    """
+    result = render_thumbnails(source_file, [thumbnail_type])[thumbnail_type]
+    if result.error is not None:
+        raise result.error
+    return result.url
+
+
+@contextmanager
+def materialize_lock(slug):
+    """
+    Holds lock of slug in this process, while renders of other slugs proceed
+    """
+    with _materialize_locks_guard:
+        entry = _materialize_locks.setdefault(slug, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _materialize_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _materialize_locks[slug]
+
+
+def materialize_thumbnail(slug):
+    """
+    Renders deferred thumbnail on its first view. Concurrent calls for the same slug render it only once;
+    calls made in the same process wait on a lock, and calls made by other processes wait on lock of the row.
+    :param slug: slug of GeneratedImage
+    :return: GeneratedImage with status ready, or failed if rendering failed; None if it does not exist
+    """
+    with materialize_lock(slug):
+        with transaction.atomic():
+            thumbnail = GeneratedImage.objects.select_for_update(of=('self',)).select_related('source_image')\
+                                              .filter(slug=slug).first()
+            if thumbnail is None or thumbnail.status != GeneratedImage.STATUS_DEFERRED:
+                # Rendered while waiting for the lock
+                return thumbnail
+            try:
+                thumbnail.modified_image = render_thumbnail(thumbnail.source_image.file, thumbnail.type)
+                thumbnail.status = GeneratedImage.STATUS_READY
+            except Exception:
+                logger.exception('Rendering deferred thumbnail %s failed', slug)
+                thumbnail.status = GeneratedImage.STATUS_FAILED
+            thumbnail.save(update_fields=['modified_image', 'status'])
+    return thumbnail
+
+
+def enqueue_thumbnails(source_image):
+    """
+    Creates job rendering all pending thumbnails of source image.
+    Job is picked up by process_thumbnails management command.
+    :param source_image: StoredImage object with pending GeneratedImage objects
+    """
+    return ThumbnailJob.objects.create(source_image=source_image)
+
+
+def enqueue_thumbnail_batch(source_images):
+    """
+    Creates jobs rendering pending thumbnails of many source images, with single query
+    """
+    return ThumbnailJob.objects.bulk_create([ThumbnailJob(source_image=source_image)
+                                             for source_image in source_images])
+
+
+def claim_jobs(limit):
+    """
+    Locks and marks as running up to limit queued jobs. Jobs left running by worker that
+    stopped responding for longer than THUMBNAIL_JOB_STALE_SECONDS are claimed again.
+    Rows locked by other workers are skipped, so multiple workers can run at once.
+    """
+    stale_date = timezone.now() - timedelta(seconds=settings.THUMBNAIL_JOB_STALE_SECONDS)
+    with transaction.atomic():
+        jobs = list(ThumbnailJob.objects.select_for_update(skip_locked=True)
+                    .select_related('source_image')
+                    .filter(Q(status=ThumbnailJob.STATUS_QUEUED) |
+                            Q(status=ThumbnailJob.STATUS_RUNNING, updated__lt=stale_date))
+                    .order_by('id')[:limit])
+        ThumbnailJob.objects.filter(id__in=[job.id for job in jobs])\
+                            .update(status=ThumbnailJob.STATUS_RUNNING, attempts=F('attempts') + 1,
+                                    updated=timezone.now())
+    for job in jobs:
+        job.status = ThumbnailJob.STATUS_RUNNING
+        job.attempts += 1
+    return jobs
+
+
+def process_job(job):
+    """
+    Renders pending thumbnails of job source image. Finished job is deleted, failed job is queued again
+    until it reaches THUMBNAIL_JOB_MAX_ATTEMPTS, after which remaining thumbnails are marked as failed.
+    :return: True if all thumbnails were rendered
+    """
+    # API.variants imports this module
+    from API.variants import set_eager_variants
+
+    source_image = job.source_image
+    pending_thumbnails = list(source_image.thumbnails.filter(status=GeneratedImage.STATUS_PENDING))
+    results = render_thumbnails(source_image.file, [thumbnail.type for thumbnail in pending_thumbnails])
+    rendered = []
+    errors = []
+    for thumbnail in pending_thumbnails:
+        result = results[thumbnail.type]
+        if result.error is not None:
+            errors.append(f'{thumbnail.type}: {result.error!r}')
+            continue
+        thumbnail.modified_image = result.url
+        thumbnail.status = GeneratedImage.STATUS_READY
+        rendered.append(thumbnail)
+    if settings.THUMBNAIL_VARIANTS_EAGER:
+        set_eager_variants(rendered, get_thumbnail_plan(source_image.owner.account_type_id))
+    GeneratedImage.objects.bulk_update(rendered, ['modified_image', 'status', 'variants'])
+    if rendered:
+        mark_owners_changed([source_image.owner_id])
+
+    if not errors:
+        job.delete()
+        return True
+
+    job.error = '\n'.join(errors)
+    if job.attempts >= settings.THUMBNAIL_JOB_MAX_ATTEMPTS:
+        job.status = ThumbnailJob.STATUS_FAILED
+        source_image.thumbnails.filter(status=GeneratedImage.STATUS_PENDING)\
+                               .update(status=GeneratedImage.STATUS_FAILED)
+        mark_owners_changed([source_image.owner_id])
+    else:
+        job.status = ThumbnailJob.STATUS_QUEUED
+    job.save()
+    return False
+
+
+def process_pending_jobs(limit=None):
+    """
+    Claims and processes queued jobs until there are none left, or limit of jobs is reached
+    :return: number of processed jobs
+    """
+    processed = 0
+    batch_size = settings.THUMBNAIL_WORKER_BATCH_SIZE
+    while limit is None or processed < limit:
+        if limit is not None:
+            batch_size = min(batch_size, limit - processed)
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            break
+        for job in jobs:
+            process_job(job)
+        processed += len(jobs)
+    return processed
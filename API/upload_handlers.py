@@ -0,0 +1,142 @@
+import hashlib
+from collections import namedtuple
+from io import BytesIO
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from API.custom_validators import MAGIC_SNIFF_SIZE, is_allowed_magic_type
+from API.engines import get_image_engine
+
+# Number of bytes from beginning of file kept in memory for reading image header
+HEADER_SIZE = 64 * 2 ** 10
+
+# status is the code of response the file would receive if sent alone, 400 or 413 for too large file
+UploadRejection = namedtuple('UploadRejection', ['field_name', 'file_name', 'message', 'status'])
+
+
+def probe_image(*sources):
+    """
+    Reads image format and dimensions from header of the first of sources image engine is able to open.
+    Sources are rewound afterwards.
+    :param sources: file objects with the same content
+    :return: tuple of image format and size, or (None, None) if image header could not be read
+    """
+    image_engine = get_image_engine()
+    for source in sources:
+        try:
+            return image_engine.probe(source)
+        except (OSError, SyntaxError, ValueError):
+            continue
+        finally:
+            source.seek(0)
+    return None, None
+
+
+class IngestedUploadedFile(TemporaryUploadedFile):
+    """
+    Uploaded file, with content hash, image format and size collected while it was received.
+    image_format and image_size are None when image header could not be read.
+    """
+    sha256 = None
+    image_format = None
+    image_size = None
+
+
+class IngestingUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded files to temporary files, reading each chunk once. While the file is received, its type
+    is checked with libmagic, content hash is computed and image format and dimensions are read from the header.
+    Files of other types than images, or larger than IMAGE_UPLOAD_MAX_SIZE, are rejected before they are
+    received completely. Reasons of rejections are listed in request.upload_rejections, request.upload_stopped
+    is set when rest of request was not received. Handler is set up for requests with many files
+    by set_batch_upload_limits.
+    """
+    # Too large file skips only itself, instead of stopping upload of all files
+    skip_large_files = False
+    # Files sent after this number of files are rejected before they are received
+    max_files = None
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.file_count = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_count += 1
+        if self.max_files is not None and self.file_count > self.max_files:
+            # Previous, already completed file must not be closed when this one is skipped
+            vars(self).pop('file', None)
+            self.reject(f'Ensure this field has no more than {self.max_files} files.')
+        self.file = IngestedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.sha256 = hashlib.sha256()
+        self.header = bytearray()
+        self.received = 0
+
+    def reject(self, message, status=400, stop_upload=False):
+        """
+        Discards currently received file, and records reason of rejection
+        :param status: status of response the file would receive if sent alone
+        :param stop_upload: stop reading request body, instead of only skipping rest of the file
+        """
+        if hasattr(self, 'file'):
+            self.file.close()
+        if not hasattr(self.request, 'upload_rejections'):
+            self.request.upload_rejections = []
+        self.request.upload_rejections.append(UploadRejection(self.field_name, self.file_name, message, status))
+        if stop_upload:
+            # Files sent after this one are not received either
+            self.request.upload_stopped = True
+            raise StopUpload(connection_reset=True)
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reject(f'File is larger than {settings.IMAGE_UPLOAD_MAX_SIZE} bytes.', status=413,
+                        stop_upload=not self.skip_large_files)
+
+        if len(self.header) < HEADER_SIZE:
+            sniffed = len(self.header) >= MAGIC_SNIFF_SIZE
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if not sniffed and len(self.header) >= MAGIC_SNIFF_SIZE:
+                self.check_type()
+
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        # Data is not passed to other handlers
+        return None
+
+    def check_type(self):
+        if not is_allowed_magic_type(self.header[:MAGIC_SNIFF_SIZE]):
+            self.reject('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+
+    def probe(self):
+        """
+        Reads image format and dimensions from header. Header can be larger than HEADER_SIZE,
+        then it is read from beginning of temporary file.
+        """
+        self.file.image_format, self.file.image_size = probe_image(BytesIO(self.header), self.file)
+
+    def file_complete(self, file_size):
+        if self.received < MAGIC_SNIFF_SIZE:
+            try:
+                self.check_type()
+            except SkipFile:
+                return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        self.probe()
+        return self.file
+
+
+def set_batch_upload_limits(request, max_files):
+    """
+    Sets up ingesting upload handlers of request with many files: too large file is skipped, instead of stopping
+    whole upload, and files beyond max_files are rejected before they are written to disk.
+    Has to be called before request body is parsed.
+    """
+    for handler in request.upload_handlers:
+        if isinstance(handler, IngestingUploadHandler):
+            handler.skip_large_files = True
+            handler.max_files = max_files
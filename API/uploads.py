@@ -0,0 +1,151 @@
+import logging
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from API.blobs import acquire_blobs, save_source_image
+from API.listing_cache import mark_owners_changed
+from API.models import GeneratedImage, StoredImage
+from API.plans import get_thumbnail_plan
+from API.thumbnails import enqueue_thumbnail_batch, enqueue_thumbnails, render_thumbnail_batch
+from API.utils import bulk_create_generated_images
+from API.variants import set_eager_variants
+
+logger = logging.getLogger(__name__)
+
+Upload = namedtuple('Upload', ['source_image', 'thumbnails', 'queued'])
+
+
+def create_thumbnail_batch(source_images, plan, raise_errors=False):
+    """
+    Creates all thumbnails of uploaded images permitted by plan, except timed thumbnails, inserting them with
+    single query. Thumbnails are rendered right away, reserved as pending and rendered by thumbnail worker when
+    THUMBNAIL_QUEUE_ENABLED is set, or deferred and rendered when first viewed, if account type renders
+    thumbnails lazily.
+    :param source_images: list of StoredImage objects
+    :param plan: ThumbnailPlan of account type of owner
+    :param raise_errors: raise exception of thumbnail which failed to render, instead of marking it failed
+    :return: tuple of list of lists of created GeneratedImage objects, one list per source image,
+             and flag set if they were queued
+    """
+    queue_enabled = settings.THUMBNAIL_QUEUE_ENABLED and not plan.lazy
+    if plan.lazy:
+        thumbnail_status = GeneratedImage.STATUS_DEFERRED
+    elif queue_enabled:
+        thumbnail_status = GeneratedImage.STATUS_PENDING
+    else:
+        thumbnail_status = GeneratedImage.STATUS_READY
+
+    thumbnail_types = [plan.upload_types(source_image.img_width, source_image.img_height)
+                       for source_image in source_images]
+    render_results = {}
+    if thumbnail_status == GeneratedImage.STATUS_READY:
+        # Images sharing blob are rendered once, all sizes from source image decoded once
+        sources = {source_image.file.name: (source_image.file, image_types)
+                   for source_image, image_types in zip(source_images, thumbnail_types)}
+        render_results = render_thumbnail_batch(sources)
+
+    thumbnails = []
+    for source_image, image_types in zip(source_images, thumbnail_types):
+        image_thumbnails = []
+        for thumbnail_type in image_types:
+            thumbnail = GeneratedImage(source_image=source_image,
+                                       type=thumbnail_type,
+                                       status=thumbnail_status)
+            result = render_results.get(source_image.file.name, {}).get(thumbnail_type)
+            if result is not None and result.error is not None:
+                if raise_errors:
+                    raise result.error
+                logger.error('Rendering thumbnail %s of %s failed: %s', thumbnail_type, source_image.file.name,
+                             result.error)
+                thumbnail.status = GeneratedImage.STATUS_FAILED
+            elif result is not None:
+                thumbnail.modified_image = result.url
+            image_thumbnails.append(thumbnail)
+        thumbnails.append(image_thumbnails)
+    set_eager_variants([thumbnail for image_thumbnails in thumbnails for thumbnail in image_thumbnails], plan)
+
+    bulk_create_generated_images([thumbnail for image_thumbnails in thumbnails for thumbnail in image_thumbnails])
+    # Images and thumbnails inserted in bulk do not send signals
+    mark_owners_changed({source_image.owner_id for source_image in source_images})
+    if queue_enabled:
+        queued_images = [source_image for source_image, image_thumbnails in zip(source_images, thumbnails)
+                         if image_thumbnails]
+        if len(queued_images) == 1:
+            enqueue_thumbnails(queued_images[0])
+        elif queued_images:
+            enqueue_thumbnail_batch(queued_images)
+    return thumbnails, queue_enabled
+
+
+def create_thumbnails(source_image, plan):
+    """
+    Creates all thumbnails of uploaded image permitted by plan, like create_thumbnail_batch.
+    Exception raised while rendering thumbnail is raised.
+    :return: tuple of list of created GeneratedImage objects, and flag set if they were queued
+    """
+    thumbnails, queued = create_thumbnail_batch([source_image], plan, raise_errors=True)
+    return thumbnails[0], queued
+
+
+def create_upload(serializer, profile):
+    """
+    Saves image sent to serializer, and creates its thumbnails permitted by account type of its owner
+    :param serializer: valid StoredImageSerializer
+    :param profile: ProfileRecord of user uploading image
+    :return: Upload
+    """
+    return create_upload_thumbnails(save_source_image(serializer, profile.to_profile()), profile)
+
+
+def create_upload_thumbnails(source_image, profile):
+    """
+    Creates thumbnails of saved image permitted by account type of its owner
+    :param source_image: StoredImage
+    :param profile: ProfileRecord of owner of image
+    :return: Upload
+    """
+    plan = get_thumbnail_plan(profile.account_type_id)
+    thumbnails, queued = create_thumbnails(source_image, plan)
+    return Upload(source_image, thumbnails, queued)
+
+
+def create_upload_batch(serializers, profile):
+    """
+    Saves images sent to many serializers, and creates their thumbnails permitted by account type of their owner.
+    Images, blobs and thumbnails are inserted with bulk queries, thumbnails of all images are rendered
+    in parallel. Thumbnail which failed to render is marked failed, without failing other uploads.
+    :param serializers: list of valid StoredImageSerializer objects
+    :param profile: ProfileRecord of user uploading images
+    :return: list of Upload, in order of serializers
+    """
+    if not serializers:
+        return []
+    owner = profile.to_profile()
+    with transaction.atomic():
+        blobs = acquire_blobs([serializer.validated_data['file'] for serializer in serializers])
+        source_images = StoredImage.objects.bulk_create([
+            StoredImage(owner=owner, blob=blob, file=blob.file.name, img_width=blob.width, img_height=blob.height)
+            for blob in blobs])
+    for serializer, source_image in zip(serializers, source_images):
+        serializer.instance = source_image
+
+    plan = get_thumbnail_plan(profile.account_type_id)
+    thumbnails, queued = create_thumbnail_batch(source_images, plan)
+    # Thumbnails listed by serializers are fetched with single query
+    prefetch_related_objects(source_images, 'thumbnails')
+    return [Upload(source_image, image_thumbnails, queued)
+            for source_image, image_thumbnails in zip(source_images, thumbnails)]
+
+
+def get_upload_data(request, serializer, upload):
+    """
+    Returns serialized uploaded image, extended with urls and statuses of its thumbnails
+    """
+    data = serializer.data
+    data['thumbnails'] = {}
+    data['thumbnails_status'] = {}
+    for thumbnail in upload.thumbnails:
+        data['thumbnails'][thumbnail.type] = request.get_host() + '/i/' + thumbnail.slug + '/'
+        data['thumbnails_status'][thumbnail.type] = thumbnail.status
+    return data
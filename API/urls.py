@@ -3,15 +3,17 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework.routers import DefaultRouter
 
 
-from .views import ImageUploadView, TimeLimitedThumbnailView
+from .views import ImageUploadView, MetricsView, TimeLimitedThumbnailView, UploadSessionView
 
 router = DefaultRouter()
 router.register('all', ImageUploadView, basename='standard')
 router.register('timed', TimeLimitedThumbnailView, basename='timed')
+router.register('uploads', UploadSessionView, basename='uploads')
 
 
 urlpatterns = [
     path('', include(router.urls), name='thumbnail'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('auth/', include('djoser.urls.authtoken')),
     path('auth/', include('djoser.urls.jwt')),
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
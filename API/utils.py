@@ -1,17 +1,50 @@
+import os
 from datetime import datetime, timedelta
 
 import pytz
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from django.utils.crypto import get_random_string
 from API import models
 
 
+SLUG_LENGTH = 15
+SLUG_SAVE_ATTEMPTS = 3
+
+
 def user_directory_path(instance, filename):
     """
     Used for specifying unique for each user file path of
     stored files, using his ID number.
     Usable in a imagefield model field, in upload_to parameter.
     """
-    return 'user_{0}/{1}'.format(instance.owner.user.id, filename)
+    return 'user_{0}/{1}'.format(instance.owner.user_id, filename)
+
+
+def blob_directory_path(instance, filename):
+    """
+    Used for naming files of ImageBlob model after hash of their content, keeping extension of uploaded file.
+    Usable in a imagefield model field, in upload_to parameter.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    return 'blobs/{0}/{1}{2}'.format(instance.sha256[:2], instance.sha256, extension)
+
+
+def get_storage_name(image_url):
+    """
+    Converts url of thumbnail file, stored in GeneratedImage.modified_image, to its name in media storage
+    """
+    if image_url.startswith(settings.MEDIA_URL):
+        return image_url[len(settings.MEDIA_URL):]
+    return image_url.lstrip('/')
+
+
+def generate_slug():
+    """
+    Generates random slug identifying GeneratedImage in its URL.
+    Uniqueness is guaranteed by unique index on slug column, instead of checking existing slugs.
+    """
+    return get_random_string(SLUG_LENGTH)
 
 
 def set_generated_image_model_slug_and_expire_date(obj):
@@ -22,11 +55,52 @@ def set_generated_image_model_slug_and_expire_date(obj):
     :param obj: object of GeneratedImage model
     """
     if not obj.slug:
-        obj.slug = get_random_string(15)
-    while models.GeneratedImage.objects.filter(slug=obj.slug).count() != 0:
-        obj.slug = get_random_string(15)
+        obj.slug = generate_slug()
 
     if obj.expire_time is not None and obj.expire_date is None:
         timezone = pytz.timezone('CET')
         now = datetime.now(timezone)
         obj.expire_date = now + timedelta(seconds=int(obj.expire_time))
+
+
+def is_slug_collision(error):
+    """
+    Tells whether IntegrityError was raised by unique index on slug of GeneratedImage.
+    Constraints of table are looked up only after error, as slugs collide very rarely.
+    """
+    constraint_name = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+    if constraint_name is None:
+        return False
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, models.GeneratedImage._meta.db_table)
+    constraint = constraints.get(constraint_name)
+    return constraint is not None and constraint['unique'] and constraint['columns'] == ['slug']
+
+
+def save_with_unique_slug(save, objects):
+    """
+    Calls save function, generating new slugs for objects whenever slug collides with existing one.
+    Collision of 15 random characters is very unlikely, so slugs are not checked before saving.
+    Other integrity errors are raised at once.
+    :param save: function saving objects, executed in a transaction savepoint
+    :param objects: GeneratedImage objects with slugs set
+    :return: value returned by save
+    """
+    for attempt in range(SLUG_SAVE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError as e:
+            if attempt == SLUG_SAVE_ATTEMPTS - 1 or not is_slug_collision(e):
+                raise
+            for obj in objects:
+                obj.slug = generate_slug()
+
+
+def bulk_create_generated_images(objects):
+    """
+    Sets slugs and expire dates of GeneratedImage objects, and inserts them with single query
+    """
+    for obj in objects:
+        set_generated_image_model_slug_and_expire_date(obj)
+    return save_with_unique_slug(lambda: models.GeneratedImage.objects.bulk_create(objects), objects)
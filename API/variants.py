@@ -0,0 +1,155 @@
+import logging
+import os
+from collections import namedtuple
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from easy_thumbnails.files import ThumbnailFile, get_thumbnailer
+from API.engines import get_image_engine
+from API.metrics import increment, stage
+from API.models import GeneratedImage
+from API.plans import get_thumbnail_plan
+from API.thumbnails import materialize_lock, record_thumbnails, render_slot, store_thumbnail_file
+from API.utils import get_storage_name
+
+try:
+    # Registers AVIF format in Pillow, AVIF variants are not encoded without it
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+VariantFormat = namedtuple('VariantFormat', ['content_type', 'extension'])
+
+# Formats thumbnails can be encoded in, besides format of source image
+VARIANT_FORMATS = {
+    'avif': VariantFormat('image/avif', 'avif'),
+    'webp': VariantFormat('image/webp', 'webp'),
+}
+
+
+def get_variant_formats():
+    """
+    Returns formats of THUMBNAIL_VARIANT_FORMATS which image engine can encode, in order of preference
+    """
+    image_engine = get_image_engine()
+    return [image_format for image_format in settings.THUMBNAIL_VARIANT_FORMATS
+            if image_format in VARIANT_FORMATS and image_engine.can_encode(VARIANT_FORMATS[image_format].extension)]
+
+
+def get_variant_name(image_url, image_format, quality):
+    """
+    Returns storage name of thumbnail variant. Variants of thumbnail file shared by many images are shared as well.
+    :param image_url: url of thumbnail file, stored in GeneratedImage.modified_image
+    """
+    root = os.path.splitext(get_storage_name(image_url))[0]
+    return f'{root}.q{quality}.{VARIANT_FORMATS[image_format].extension}'
+
+
+def encode_variant(source_file, image_url, image_format, quality, encoded_files=None):
+    """
+    Encodes thumbnail file in another format. Variant is saved as thumbnail of source image in easy_thumbnails,
+    so it is deleted along with other thumbnails of source. Variant encoded before is reused.
+    :param source_file: FieldFile of StoredImage thumbnail was rendered from
+    :param image_url: url of thumbnail file
+    :param image_format: key of VARIANT_FORMATS
+    :param encoded_files: list to which ThumbnailFile of encoded variant is appended, to be recorded in
+                          easy_thumbnails later with record_thumbnails, instead of right away
+    :return: url of variant, or empty string if variant is not smaller than thumbnail file
+    """
+    thumbnailer = get_thumbnailer(source_file)
+    storage = thumbnailer.thumbnail_storage
+    name = get_variant_name(image_url, image_format, quality)
+    if storage.exists(name):
+        return storage.url(name)
+
+    with storage.open(get_storage_name(image_url)) as file:
+        data = file.read()
+    image_engine = get_image_engine()
+    with render_slot(), stage('encode'):
+        encoded = image_engine.encode(image_engine.load(data), VARIANT_FORMATS[image_format].extension,
+                                      quality=quality)
+    if len(encoded) >= len(data):
+        return ''
+    variant = ThumbnailFile(name, file=ContentFile(encoded), storage=storage)
+    with stage('storage'):
+        store_thumbnail_file(thumbnailer, variant)
+        if encoded_files is None:
+            record_thumbnails([(thumbnailer, [variant])])
+        else:
+            encoded_files.append(variant)
+    increment('bytes_written', len(encoded), label='variant')
+    return storage.url(name)
+
+
+def encode_variants(source_file, image_url, plan, encoded_files):
+    """
+    Encodes thumbnail in all available variant formats, with qualities of plan. Variant which failed to encode
+    is skipped, and encoded when it is first requested.
+    :param plan: ThumbnailPlan of account type of owner of thumbnail
+    :param encoded_files: list to which ThumbnailFiles of encoded variants are appended, see encode_variant
+    :return: dict of format: url of variant, to be stored in GeneratedImage.variants
+    """
+    variants = {}
+    for image_format in get_variant_formats():
+        try:
+            variants[image_format] = encode_variant(source_file, image_url, image_format,
+                                                    plan.variant_quality(image_format), encoded_files)
+        except Exception:
+            logger.exception('Encoding %s variant of %s failed', image_format, image_url)
+    return variants
+
+
+def set_eager_variants(thumbnails, plan):
+    """
+    Encodes variants of ready thumbnails when THUMBNAIL_VARIANTS_EAGER is set. Variants are only set on objects,
+    not saved. Variant files of all thumbnails are recorded in easy_thumbnails together.
+    :param thumbnails: list of GeneratedImage objects, with source_image loaded
+    :param plan: ThumbnailPlan of account type of owner of thumbnails
+    """
+    if not settings.THUMBNAIL_VARIANTS_EAGER:
+        return
+    encoded_files = {}  # name of source file: tuple of its thumbnailer and list of its encoded variants
+    for thumbnail in thumbnails:
+        if thumbnail.status == GeneratedImage.STATUS_READY and thumbnail.modified_image:
+            source_file = thumbnail.source_image.file
+            _, source_encoded = encoded_files.setdefault(source_file.name, (get_thumbnailer(source_file), []))
+            thumbnail.variants = encode_variants(source_file, thumbnail.modified_image.name, plan, source_encoded)
+    try:
+        with stage('storage'):
+            record_thumbnails(list(encoded_files.values()))
+    except Exception:
+        # Variant files are stored, only their deletion along with thumbnails of source is affected
+        logger.exception('Recording variants of %s failed', ', '.join(encoded_files))
+
+
+def materialize_variant(slug, image_format):
+    """
+    Encodes variant of ready thumbnail on its first request. Concurrent calls for the same slug encode it once,
+    like materialize_thumbnail.
+    :param slug: slug of GeneratedImage
+    :param image_format: key of VARIANT_FORMATS
+    :return: url of variant, empty string if variant is not smaller than thumbnail, or None if it could not be
+             encoded
+    """
+    with materialize_lock(slug):
+        with transaction.atomic():
+            thumbnail = GeneratedImage.objects.select_for_update(of=('self',))\
+                                              .select_related('source_image__owner')\
+                                              .filter(slug=slug).first()
+            if thumbnail is None or thumbnail.status != GeneratedImage.STATUS_READY or not thumbnail.modified_image:
+                return None
+            if image_format in thumbnail.variants:
+                # Encoded while waiting for the lock
+                return thumbnail.variants[image_format]
+            plan = get_thumbnail_plan(thumbnail.source_image.owner.account_type_id)
+            try:
+                url = encode_variant(thumbnail.source_image.file, thumbnail.modified_image.name, image_format,
+                                     plan.variant_quality(image_format))
+            except Exception:
+                logger.exception('Encoding %s variant of thumbnail %s failed', image_format, slug)
+                return None
+            thumbnail.variants[image_format] = url
+            thumbnail.save(update_fields=['variants'])
+    return url
@@ -1,16 +1,61 @@
-import jwt
-from API.models import StoredImage, APIUserProfile, GeneratedImage
-from API.serializers import StoredImageSerializer, TimeLimitedImageSerializer
-from API.utils import set_generated_image_model_slug_and_expire_date
+from API.authentication import get_profile
+from API.blobs import save_source_image
+from API.fast_serializers import IMAGE_VALUES, get_thumbnail_rows, serialize_images
+from API.listing_cache import get_cached_payload, get_etag, get_listing_cache, get_listing_version, \
+                              get_payload_key, set_cached_payload
+from API.metrics import render_metrics, stage, timed_endpoint
+from API.models import StoredImage, GeneratedImage, UploadSession
+from API.pagination import StoredImageCursorPagination
+from API.plans import get_thumbnail_plan
+from API.query_budget import query_budget
+from API.resumable import append_chunk, assemble_file, create_session, delete_session, lock_session_file, \
+                          parse_content_range
+from API.serializers import StoredImageSerializer, TimeLimitedImageSerializer, UploadSessionSerializer
+from API.thumbnails import render_thumbnail
+from API.upload_handlers import set_batch_upload_limits
+from API.uploads import create_upload, create_upload_batch, create_upload_thumbnails, get_upload_data
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
-from easy_thumbnails.files import get_thumbnailer
+from contextlib import contextmanager
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework import viewsets, status
-from rest_framework.authtoken.admin import User
-from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from ImageUploadAPI.settings import SECRET_KEY
+from rest_framework.views import APIView
+
+
+def listing_response(request, owner_id, build_response, *key_parts):
+    """
+    Returns response listing images of user, built by build_response. When LISTING_CACHE_BACKEND is set,
+    data of successful response is cached until images of user change, and responses carry ETag, so client
+    which has current version receives 304 response, after single cache lookup.
+    :param owner_id: id of APIUserProfile of user
+    :param build_response: function returning Response
+    :param key_parts: values identifying response, in addition to url of request
+    """
+    if get_listing_cache() is None:
+        return build_response()
+    version = get_listing_version(owner_id)
+    payload_key = get_payload_key(request, owner_id, version, *key_parts)
+    etag = get_etag(payload_key)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = get_cached_payload(payload_key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            set_cached_payload(payload_key, response.data)
+    response['ETag'] = etag
+    # Clients revalidate cached response on every request
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 class ImageUploadView(viewsets.ViewSet):
@@ -26,24 +71,38 @@ class ImageUploadView(viewsets.ViewSet):
     serializer_class = StoredImageSerializer
     permission_classes = (IsAuthenticated,)
 
+    def perform_authentication(self, request):
+        with stage('auth'):
+            super().perform_authentication(request)
+
     @extend_schema(  # drf-spectacular documentation extension
+        parameters=[
+            OpenApiParameter(name='cursor', location=OpenApiParameter.QUERY,
+                             description='Cursor of page, taken from next or previous url', required=False),
+            OpenApiParameter(name='page_size', location=OpenApiParameter.QUERY, type=int,
+                             description='Number of images on page', required=False),
+        ],
         responses={200: OpenApiTypes.OBJECT,
                    401: OpenApiTypes.OBJECT},
         examples=[OpenApiExample(
             "200 OK",
             description="Response when user sends get request.",
-            value={"id": 0,
-                   "file": "string",
-                   "thumbnails": [
-                       {
-                           "id": 0,
-                           "type": 350,
-                           "image_url": "localhost:8000/i/qwertUbe9COTEy/",
-                           "expire_date": "2021-12-01T16:44:19.723Z",
-                           "created": "2021-12-01T16:44:19.723Z"
-                       }
-                   ]
-                   },
+            value={"next": "http://localhost:8000/api/all/?cursor=cD0xMjM%3D",
+                   "previous": None,
+                   "results": [
+                       {"id": 0,
+                        "file": "string",
+                        "thumbnails": [
+                            {
+                                "id": 0,
+                                "type": 350,
+                                "image_url": "localhost:8000/i/qwertUbe9COTEy/",
+                                "expire_date": "2021-12-01T16:44:19.723Z",
+                                "created": "2021-12-01T16:44:19.723Z",
+                                "status": "ready"
+                            }
+                        ]}
+                   ]},
             response_only=True,
             status_codes=["200"],
         ), OpenApiExample(
@@ -54,22 +113,25 @@ class ImageUploadView(viewsets.ViewSet):
             status_codes=["401"],
         )]
     )
+    @query_budget(3)
     def list(self, request):
         """
-        Lists all images and related thumbnails for specific user
+        Lists images and related thumbnails for specific user, page by page, ordered by id.
+        Next and previous pages are linked by cursor urls in response.
         """
-        # Normal user should include token or jwt token in his header
-        request_token = request.META.get('HTTP_AUTHORIZATION', " ").split(' ')
-        if request_token[0] == "Bearer":
-            data = jwt.decode(jwt=request_token[1], key=SECRET_KEY, algorithms=['HS256'])
-            token_user_id = data['user_id']
-        elif request_token[0] == "Token":
-            token_user_id = Token.objects.get(key=request_token[1]).user_id
-        token_user = User.objects.select_related('apiuserprofile').get(id=token_user_id)
-
-        queryset = StoredImage.objects.filter(owner=token_user.apiuserprofile.id)
-        serializer = StoredImageSerializer(queryset, many=True, context={"request": request})
-        return Response(serializer.data)
+        # User is authenticated by token or jwt token in his header
+        profile = get_profile(request.user)
+
+        def build_response():
+            # Images and thumbnails are read as values and serialized directly, thumbnails of whole page
+            # are fetched with single query
+            queryset = StoredImage.objects.filter(owner=profile.profile_id).values(*IMAGE_VALUES)
+            paginator = StoredImageCursorPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            thumbnail_rows = get_thumbnail_rows([image['id'] for image in page])
+            return paginator.get_paginated_response(serialize_images(page, thumbnail_rows, request))
+
+        return listing_response(request, profile.profile_id, build_response, 'list')
 
     @extend_schema(  # drf-spectacular documentation extension
         parameters=[
@@ -97,35 +159,40 @@ class ImageUploadView(viewsets.ViewSet):
                            "type": "200x200",
                            "image_url": "localhost:8000/i/qwertUbe9COTEy/",
                            "expire_date": "null",
-                           "created": "2021-12-01T16:16:04.917572Z"
+                           "created": "2021-12-01T16:16:04.917572Z",
+                           "status": "ready"
                        },
                        {
                            "id": 2,
                            "type": "400x400",
                            "image_url": "localhost:8000/i/qwertlH32N03SMm/",
                            "expire_date": "null",
-                           "created": "2021-12-01T16:16:04.917618Z"
+                           "created": "2021-12-01T16:16:04.917618Z",
+                           "status": "ready"
                        },
                        {
                            "id": 3,
                            "type": "840x680",
                            "image_url": "localhost:8000/i/qwertZ2Bg9zXp3M/",
                            "expire_date": "null",
-                           "created": "2021-12-01T16:16:04.917646Z"
+                           "created": "2021-12-01T16:16:04.917646Z",
+                           "status": "ready"
                        },
                        {
                            "id": 4,
                            "type": "500x500",
                            "image_url": "localhost:8000/i/qwerteAry621ywC/",
                            "expire_date": "null",
-                           "created": "2021-12-01T16:16:04.917672Z"
+                           "created": "2021-12-01T16:16:04.917672Z",
+                           "status": "ready"
                        },
                        {
                            "id": 5,
                            "type": "1000x1000",
                            "image_url": "localhost:8000/i/f2qwertnlboYlD1/",
                            "expire_date": "null",
-                           "created": "2021-12-01T16:16:04.917696Z"
+                           "created": "2021-12-01T16:16:04.917696Z",
+                           "status": "ready"
                        }
                    ]},
             response_only=True,
@@ -144,27 +211,24 @@ class ImageUploadView(viewsets.ViewSet):
             status_codes=["404"],
         )]
     )
+    @query_budget(2)
     def retrieve(self, request, pk=None):
         """
         Lists specific uploaded image and related thumbnails if it exists, and user owns it.
         """
-        request_token = request.META.get('HTTP_AUTHORIZATION', " ").split(' ')
-        if request_token[0] == "Bearer":
-            data = jwt.decode(jwt=request_token[1], key=SECRET_KEY, algorithms=['HS256'])
-            token_user_id = data['user_id']
-        elif request_token[0] == "Token":
-            token_user_id = Token.objects.get(key=request_token[1]).user_id
         # Identify user by token sent by user in request header
-        token_user = User.objects.select_related('apiuserprofile').get(id=token_user_id)
+        profile = get_profile(request.user)
 
-        try:
-            queryset = StoredImage.objects.get(owner=token_user.apiuserprofile.id, id=pk)
-        except StoredImage.DoesNotExist:
-            data = {"detail": "Item not found"}
-            return Response(data, status=status.HTTP_404_NOT_FOUND)
+        def build_response():
+            image = StoredImage.objects.filter(owner=profile.profile_id, id=pk).values(*IMAGE_VALUES).first()
+            if image is None:
+                data = {"detail": "Item not found"}
+                return Response(data, status=status.HTTP_404_NOT_FOUND)
+
+            data = serialize_images([image], get_thumbnail_rows([image['id']]), request)[0]
+            return Response(data, status=status.HTTP_200_OK)
 
-        serializer = StoredImageSerializer(queryset, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return listing_response(request, profile.profile_id, build_response, 'retrieve', pk)
 
     @extend_schema(  # drf-spectacular documentation extension
         parameters=[
@@ -172,6 +236,7 @@ class ImageUploadView(viewsets.ViewSet):
                              required=True)
         ],
         responses={201: OpenApiTypes.OBJECT,
+                   202: OpenApiTypes.OBJECT,
                    400: OpenApiTypes.OBJECT,
                    401: OpenApiTypes.OBJECT
                    },
@@ -191,9 +256,32 @@ class ImageUploadView(viewsets.ViewSet):
                        "840x680": "localhost:8000/i/qwertD58FxlnpLg/",
                        "500x500": "localhost:8000/i/qwert6mZc15bZap/",
                        "1000x1000": "localhost:8000/i/qwertAOGmWghPlz/"
+                   },
+                   "thumbnails_status": {
+                       "200x200": "ready",
+                       "400x400": "ready",
+                       "840x680": "ready",
+                       "500x500": "ready",
+                       "1000x1000": "ready"
                    }},
             response_only=True,
             status_codes=["201"],
+        ), OpenApiExample(
+            "202 Thumbnails queued",
+            description="Example response when thumbnail queue is enabled. URLs are reserved right away, "
+                        "thumbnails are viewable after their status changes to ready.",
+            value={"id": 1,
+                   "file": "http://localhost:8000/media/user_1/image_name.png",
+                   "thumbnails": {
+                       "200x200": "localhost:8000/i/qwertmDw5pmYm9O/",
+                       "400x400": "localhost:8000/i/qwerte7EiCdMyAX/"
+                   },
+                   "thumbnails_status": {
+                       "200x200": "pending",
+                       "400x400": "pending"
+                   }},
+            response_only=True,
+            status_codes=["202"],
         ), OpenApiExample(
             "400 No file parameter",
             description="Response when 'file' parameter is not included.",
@@ -210,95 +298,110 @@ class ImageUploadView(viewsets.ViewSet):
             status_codes=["401"],
         )]
     )
+    @timed_endpoint('upload')
+    @query_budget(26)
     def create(self, request):
         """
         Checks authorization of user, then creates thumbnails for all available for user profile permissions, except
-        timed thumbnails
+        timed thumbnails. When THUMBNAIL_QUEUE_ENABLED is set, thumbnails are only reserved and rendered
+        by process_thumbnails management command. Thumbnails of account types with lazy_thumbnails set are
+        rendered when first viewed.
         """
-        try:
-            # Normal user should include token or jwt token in his header
-            request_token = request.META.get('HTTP_AUTHORIZATION', " ").split(' ')
-            if request_token[0] == "Bearer":
-                data = jwt.decode(jwt=request_token[1], key=SECRET_KEY, algorithms=['HS256'])
-                token_user_id = data['user_id']
-                token_user = User.objects.get(id=token_user_id)
-            elif request_token[0] == "Token":
-                token_user = Token.objects.get(key=request_token[1]).only('user_id')
-        except AttributeError:
-            # Admin who does not include token, but is logged in can still use API
-            token_user = request.user
-
-        serializer = StoredImageSerializer(data=request.data, context={"request": request})  # image sent by user
+        # User is authenticated by token or jwt token in his header
+        with stage('auth'):
+            profile = get_profile(request.user)
+
+        with stage('receive'):
+            data = request.data  # request body is parsed here
+        serializer = StoredImageSerializer(data=data, context={"request": request})  # image sent by user
 
         # Check permissions, and create all permitted thumbnails
-        if serializer.is_valid():
-            serializer.save(owner=token_user.apiuserprofile)
-
-            # Get user permissions, custom thumbnail sizes and original image object
-            queryset_permissions = APIUserProfile.objects.select_related('account_type') \
-                .prefetch_related('account_type__custom_size').get(user=token_user.id)
-            source_image = StoredImage.objects.filter(owner=token_user.apiuserprofile).latest('id')
-
-            # Create all thumbnail images, assign them to specific URLs
-            # TODO move size strings to constant variables to allow easier modification+possibly
-            # TODO thumbnails_aliases from settings.py
-            sizes = ['200x200',
-                     '400x400',
-                     f'{source_image.img_width}x{source_image.img_height}']
-
-            default_permissions = [queryset_permissions.account_type.create_200px_thumbnail_perm,
-                                   queryset_permissions.account_type.create_400px_thumbnail_perm,
-                                   queryset_permissions.account_type.create_original_img_link_perm]
-
-            # Create standard allowed thumbnails
-            thumbnails_to_be_bulk_created = []
-            for index, permission in enumerate(default_permissions):
-                if permission is True:
-                    # TODO possibly move thumbnail creation to separate place/async function/celery
-                    x_side = sizes[index].split('x')[0]
-                    y_side = sizes[index].split('x')[1]
-                    options = {'size': (x_side, y_side), 'upscale': True, 'crop': True}
-                    img = get_thumbnailer(source_image.file).get_thumbnail(options)
-
-                    thumbnail = GeneratedImage(source_image=source_image,
-                                               modified_image=img.url,
-                                               type=sizes[index])
-                    thumbnails_to_be_bulk_created.append(thumbnail)
-
-            # Iterate over custom sizes assigned to account type, and create custom sized thumbnails
-            related_custom_sizes = queryset_permissions.account_type.custom_size
-            if default_permissions[2] is True and related_custom_sizes.count() > 0:
-                for index, item in enumerate(related_custom_sizes.all()):
-                    side = f"{str(item.size)}"
-                    options = {'size': (side, side), 'upscale': True, 'crop': True}
-                    img = get_thumbnailer(source_image.file).get_thumbnail(options)
-
-                    side = str(related_custom_sizes.all()[index].size)
-                    side_full = f'{side}x{side}'
-
-                    thumbnail = GeneratedImage(source_image=source_image,
-                                               modified_image=img.url,
-                                               type=side_full)
-                    thumbnails_to_be_bulk_created.append(thumbnail)
-
-            response_thumbnails_data = {'thumbnails': {}}
-            for index, item in enumerate(thumbnails_to_be_bulk_created):
-                set_generated_image_model_slug_and_expire_date(item)
-                response_thumbnails_data['thumbnails'][item.type] = request.get_host() + '/i/' + item.slug + '/'
-
-            GeneratedImage.objects.bulk_create(thumbnails_to_be_bulk_created)
-            # Dictionary containing created thumbnails
-
-            updated_serializer_data = serializer.data
-            updated_serializer_data.update(response_thumbnails_data)
-            return Response(updated_serializer_data, status=status.HTTP_201_CREATED)
+        with stage('validate'):
+            valid = serializer.is_valid()
+        if valid:
+            # Decoding, resizing, encoding and storage are timed as stages of their own
+            with stage('db'):
+                upload = create_upload(serializer, profile)
+            response_status = status.HTTP_202_ACCEPTED if upload.queued else status.HTTP_201_CREATED
+            with stage('serialize'):
+                data = get_upload_data(request, serializer, upload)
+            return Response(data, status=response_status)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+    @extend_schema(  # drf-spectacular documentation extension
+        request={'multipart/form-data': {'type': 'object',
+                                         'properties': {'files': {'type': 'array',
+                                                                  'items': {'type': 'string', 'format': 'binary'}}}}},
+        responses={207: OpenApiTypes.OBJECT,
+                   400: OpenApiTypes.OBJECT,
+                   401: OpenApiTypes.OBJECT,
+                   413: OpenApiTypes.OBJECT},
+        examples=[OpenApiExample(
+            "207 Images uploaded",
+            description="Result of every sent file, with status code and response it would receive "
+                        "from /api/all/ endpoint",
+            value=[{"file_name": "image_name.png",
+                    "status": 201,
+                    "data": {"id": 1,
+                             "file": "http://localhost:8000/media/blobs/4e/4e07408562be.png",
+                             "thumbnails": {"200x200": "localhost:8000/i/qwertmDw5pmYm9O/"},
+                             "thumbnails_status": {"200x200": "ready"}}},
+                   {"file_name": "notes.txt",
+                    "status": 400,
+                    "data": {"file": ["Incorrect file type. Allowed types: jpg png"]}}],
+            response_only=True,
+            status_codes=["207"],
+        )]
+    )
+    @action(detail=False, methods=['post'])
+    @query_budget(18)
+    def batch(self, request):
+        """
+        Uploads many images sent in files parameter at once, creating all thumbnails available for user profile,
+        like separate requests to /api/all/ would. Files are processed independently, invalid or too large files
+        do not prevent upload of the others. Response contains result of every file.
+        """
+        profile = get_profile(request.user)
+
+        # Files beyond the limit are rejected while request body is parsed, without writing them to disk
+        set_batch_upload_limits(request, settings.BATCH_UPLOAD_MAX_FILES)
+        files = request.FILES.getlist('files')  # request body is parsed here
+        rejections = [rejection for rejection in getattr(request, 'upload_rejections', [])
+                      if rejection.field_name == 'files']
+        if not files and not rejections:
+            return Response({"files": ["No file was submitted."]}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) + len(rejections) > settings.BATCH_UPLOAD_MAX_FILES:
+            data = {"files": [f"Ensure this field has no more than {settings.BATCH_UPLOAD_MAX_FILES} files."]}
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [{"file_name": rejection.file_name, "status": rejection.status,
+                    "data": {"file": [rejection.message]}} for rejection in rejections]
+        serializers = [StoredImageSerializer(data={'file': file}, context={"request": request}) for file in files]
+        valid_serializers = [serializer for serializer in serializers if serializer.is_valid()]
+        # Uploads are returned in order of valid serializers
+        uploads = iter(create_upload_batch(valid_serializers, profile))
+
+        for file, serializer in zip(files, serializers):
+            if serializer.errors:
+                results.append({"file_name": file.name, "status": status.HTTP_400_BAD_REQUEST,
+                                "data": serializer.errors})
+                continue
+            upload = next(uploads)
+            upload_status = status.HTTP_202_ACCEPTED if upload.queued else status.HTTP_201_CREATED
+            results.append({"file_name": file.name, "status": upload_status,
+                            "data": get_upload_data(request, serializer, upload)})
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+
 class TimeLimitedThumbnailView(viewsets.ViewSet):
     serializer_class = TimeLimitedImageSerializer
     permission_classes = (IsAuthenticated,)
 
+    def perform_authentication(self, request):
+        with stage('auth'):
+            super().perform_authentication(request)
+
     @extend_schema(  # drf-spectacular documentation extension
         parameters=[
             OpenApiParameter(name='file', location=OpenApiParameter.QUERY, description='attached image',
@@ -363,25 +466,18 @@ class TimeLimitedThumbnailView(viewsets.ViewSet):
             status_codes=["403"],
         )]
     )
+    @timed_endpoint('upload_timed')
+    @query_budget(20)
     def create(self, request):
         """
         Checks authorization of user, then creates a time limited thumbnail if user permission allows it
         """
-        try:
-            # Normal user should include token or jwt token in his header
-            request_token = request.META.get('HTTP_AUTHORIZATION', " ").split(' ')
-            if request_token[0] == "Bearer":
-                data = jwt.decode(jwt=request_token[1], key=SECRET_KEY, algorithms=['HS256'])
-                token_user_id = data['user_id']
-                token_user = User.objects.get(id=token_user_id)
-            elif request_token[0] == "Token":
-                token_user_id = Token.objects.get(key=request_token[1]).only('user_id').user_id
-                token_user = User.objects.get(id=token_user_id)
-        except AttributeError:
-            # Admin who does not include token, but is logged in can still use API
-            token_user = request.user
-
-        request_data_cleared = request.data
+        # User is authenticated by token or jwt token in his header
+        with stage('auth'):
+            profile = get_profile(request.user)
+
+        with stage('receive'):
+            request_data_cleared = request.data  # request body is parsed here
 
         # If file key is not present, serializer.is_valid() will detect it and return proper response
         if 'file' in request_data_cleared.keys():
@@ -401,47 +497,264 @@ class TimeLimitedThumbnailView(viewsets.ViewSet):
                 return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
         serializer = TimeLimitedImageSerializer(data=request_data_cleared, context={"request": request})
 
-        if serializer.is_valid():
-            queryset_permissions = APIUserProfile.objects.select_related('account_type') \
-                .prefetch_related('account_type__custom_size').get(user=token_user)
-
+        with stage('validate'):
+            valid = serializer.is_valid()
+        if valid:
             img_expire_time = request.POST.get('expire_time', '')
             img_type = request.POST.get('type', '')
 
             # Check permissions for creating time limited thumbnail and specific type of thumbnail
-            custom_time_permission = queryset_permissions.account_type.create_time_limited_link_perm
-            if img_type == '200':
-                custom_size_permission = queryset_permissions.account_type.create_200px_thumbnail_perm
-            elif img_type == '400':
-                custom_size_permission = queryset_permissions.account_type.create_400px_thumbnail_perm
-            else:
-                related_custom_sizes = queryset_permissions.account_type.custom_size.all()
-                custom_size_permission = True
-                # Image type requested by user is not allowed by his profile type
-                if img_type not in related_custom_sizes:
-                    custom_size_permission = False
-            if custom_time_permission is False or custom_size_permission is False:
+            plan = get_thumbnail_plan(profile.account_type_id)
+            if not plan.allows_time_limited(img_type):
                 error_msg = {"error": "Your profile type does not have permission to create time limited or this size "
                                       "of thumbnail"
                              }
                 return Response(error_msg, status=status.HTTP_403_FORBIDDEN)
 
-            serializer.save(owner=token_user.apiuserprofile)
-
-            source_image = StoredImage.objects.filter(owner=token_user.apiuserprofile).latest('id')
-            options = {'size': (img_type, img_type), 'upscale': True, 'crop': True}
-            img = get_thumbnailer(source_image.file).get_thumbnail(options)
-            thumbnail = GeneratedImage.objects.create(source_image=source_image,
-                                                      modified_image=img.url,
-                                                      type=str(img_type),
-                                                      expire_time=img_expire_time)
+            with stage('db'):
+                source_image = save_source_image(serializer, profile.to_profile())
+                modified_image = render_thumbnail(source_image.file, img_type)
+                thumbnail = GeneratedImage.objects.create(source_image=source_image,
+                                                          modified_image=modified_image,
+                                                          type=str(img_type),
+                                                          expire_time=img_expire_time)
 
-            response_thumbnails_data = {'thumbnails': {}}
-            response_thumbnails_data['thumbnails'][str(img_type)] = request.get_host() + '/i/' + thumbnail.slug + '/'
+            with stage('serialize'):
+                response_thumbnails_data = {'thumbnails': {}}
+                response_thumbnails_data['thumbnails'][str(img_type)] = \
+                    request.get_host() + '/i/' + thumbnail.slug + '/'
 
-            # Dictionary containing created thumbnails
-            updated_serializer_data = serializer.data
-            updated_serializer_data.update(response_thumbnails_data)
+                # Dictionary containing created thumbnails
+                updated_serializer_data = serializer.data
+                updated_serializer_data.update(response_thumbnails_data)
 
             return Response(updated_serializer_data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadSessionView(viewsets.ViewSet):
+    """
+    Resumable upload of large images. User starts upload session by sending POST request with file_name and size
+    of image to /api/uploads/, then sends chunks of file with PUT requests to /api/uploads/<id>/, each with
+    Content-Range header like 'bytes 0-1048575/5242880'. Chunk has to start at offset of session, which can be
+    checked with GET request to /api/uploads/<id>/ when upload was interrupted.
+    POST request to /api/uploads/<id>/finalize/ creates image and its thumbnails, like upload to /api/all/.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = (IsAuthenticated,)
+    lookup_value_regex = '[0-9a-f-]{36}'
+
+    @staticmethod
+    def get_session(pk, profile):
+        """
+        Returns session of user, or None if it does not exist
+        """
+        return UploadSession.objects.filter(id=pk, owner=profile.profile_id).first()
+
+    @classmethod
+    @contextmanager
+    def lock_session(cls, pk, profile):
+        """
+        Locks file of session of user for the duration of the block, see lock_session_file.
+        :return: context manager yielding tuple of session read after file was locked, its opened file
+                 and response sent when session cannot be used, which is None otherwise
+        """
+        session = cls.get_session(pk, profile)
+        if session is None:
+            yield None, None, cls.missing_session_response(pk, profile)
+            return
+        with lock_session_file(session) as part_file:
+            # Session finalized or cancelled by request which held the lock is deleted
+            session = cls.get_session(pk, profile) if part_file is not None else None
+            if session is None:
+                yield None, None, cls.missing_session_response(pk, profile)
+            else:
+                yield session, part_file, None
+
+    @staticmethod
+    def expired_session_response():
+        data = {"detail": "Upload session expired"}
+        return Response(data, status=status.HTTP_410_GONE)
+
+    @staticmethod
+    def missing_session_response(pk, profile):
+        if UploadSession.objects.filter(id=pk, owner=profile.profile_id).exists():
+            data = {"detail": "Upload session is being used by other request"}
+            return Response(data, status=status.HTTP_409_CONFLICT)
+        data = {"detail": "Item not found"}
+        return Response(data, status=status.HTTP_404_NOT_FOUND)
+
+    @extend_schema(  # drf-spectacular documentation extension
+        responses={201: OpenApiTypes.OBJECT,
+                   400: OpenApiTypes.OBJECT,
+                   401: OpenApiTypes.OBJECT},
+        examples=[OpenApiExample(
+            "request body",
+            description="Name of uploaded file, with png or jpg extension, and its size in bytes",
+            value={"file_name": "image_name.png", "size": 5242880},
+            request_only=True,
+        ), OpenApiExample(
+            "201 Upload session created",
+            description="Response when upload session is started",
+            value={"id": "3fa85f64-5717-4562-b3fc-2c963f66afa6",
+                   "file_name": "image_name.png",
+                   "size": 5242880,
+                   "offset": 0,
+                   "expire_date": "2021-12-02T16:44:19.723Z"},
+            response_only=True,
+            status_codes=["201"],
+        )]
+    )
+    @query_budget(2)
+    def create(self, request):
+        """
+        Starts upload session
+        """
+        profile = get_profile(request.user)
+
+        serializer = UploadSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            session = create_session(profile.profile_id, serializer.validated_data['file_name'],
+                                     serializer.validated_data['size'])
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT,
+                              401: OpenApiTypes.OBJECT,
+                              404: OpenApiTypes.OBJECT,
+                              410: OpenApiTypes.OBJECT})
+    @query_budget(1)
+    def retrieve(self, request, pk=None):
+        """
+        Displays upload session, with offset at which next chunk has to start
+        """
+        profile = get_profile(request.user)
+
+        session = self.get_session(pk, profile)
+        if session is None:
+            data = {"detail": "Item not found"}
+            return Response(data, status=status.HTTP_404_NOT_FOUND)
+        if session.expire_date <= timezone.now():
+            return self.expired_session_response()
+        return Response(UploadSessionSerializer(session).data)
+
+    @extend_schema(request=OpenApiTypes.BINARY,
+                   parameters=[OpenApiParameter(name='Content-Range', location=OpenApiParameter.HEADER,
+                                                description='Range of bytes of file sent in request body, '
+                                                            'like bytes 0-1048575/5242880',
+                                                required=True)],
+                   responses={200: OpenApiTypes.OBJECT,
+                              400: OpenApiTypes.OBJECT,
+                              401: OpenApiTypes.OBJECT,
+                              404: OpenApiTypes.OBJECT,
+                              409: OpenApiTypes.OBJECT,
+                              410: OpenApiTypes.OBJECT})
+    @query_budget(3)
+    def update(self, request, pk=None):
+        """
+        Receives chunk of file sent in request body. Chunk is streamed to disk, and file of session is locked
+        meanwhile, so chunks of one session are not received at the same time.
+        """
+        profile = get_profile(request.user)
+
+        content_range = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+        if content_range is None:
+            data = {"detail": "Content-Range header like 'bytes 0-1023/4096' is required"}
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = content_range
+        length = end - start + 1
+        if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+            data = {"detail": "Content-Length does not match Content-Range"}
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        with self.lock_session(pk, profile) as (session, part_file, error_response):
+            if error_response is not None:
+                return error_response
+            if session.expire_date <= timezone.now():
+                return self.expired_session_response()
+            if total != session.size:
+                data = {"detail": f"File size in Content-Range does not match size of upload: {session.size}"}
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+            if start != session.offset:
+                data = {"detail": "Chunk has to start at offset of upload", "offset": session.offset}
+                return Response(data, status=status.HTTP_409_CONFLICT)
+
+            written = append_chunk(session, part_file, request.stream, length)
+
+        if written != length:
+            # Received part of chunk is kept, upload is continued from offset of session
+            data = {"detail": "Chunk was not received completely", "offset": session.offset}
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+    @extend_schema(responses={204: None,
+                              401: OpenApiTypes.OBJECT,
+                              404: OpenApiTypes.OBJECT,
+                              409: OpenApiTypes.OBJECT})
+    @query_budget(2)
+    def destroy(self, request, pk=None):
+        """
+        Cancels upload session, deleting received chunks
+        """
+        profile = get_profile(request.user)
+
+        with self.lock_session(pk, profile) as (session, part_file, error_response):
+            if error_response is not None:
+                return error_response
+            delete_session(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(request=None,
+                   responses={201: OpenApiTypes.OBJECT,
+                              202: OpenApiTypes.OBJECT,
+                              400: OpenApiTypes.OBJECT,
+                              401: OpenApiTypes.OBJECT,
+                              404: OpenApiTypes.OBJECT,
+                              409: OpenApiTypes.OBJECT,
+                              410: OpenApiTypes.OBJECT})
+    @action(detail=True, methods=['post'])
+    @query_budget(22)
+    def finalize(self, request, pk=None):
+        """
+        Creates image from completely received file, and all its thumbnails permitted for user profile, the same
+        way as upload to /api/all/ does. Session is deleted afterwards, also when file is not a valid image.
+        """
+        profile = get_profile(request.user)
+
+        with self.lock_session(pk, profile) as (session, part_file, error_response):
+            if error_response is not None:
+                return error_response
+            if session.expire_date <= timezone.now():
+                return self.expired_session_response()
+            if session.offset != session.size:
+                data = {"detail": "Upload is not complete", "offset": session.offset}
+                return Response(data, status=status.HTTP_409_CONFLICT)
+
+            file = assemble_file(session)
+            try:
+                serializer = StoredImageSerializer(data={'file': file}, context={"request": request})
+                # Image is committed before thumbnails are rendered, and before session stops being locked
+                source_image = save_source_image(serializer, profile.to_profile()) if serializer.is_valid() else None
+            finally:
+                # File was moved to storage, or cannot become image, so session is not used again
+                file.close()
+                delete_session(session)
+
+        if source_image is None:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        upload = create_upload_thumbnails(source_image, profile)
+        response_status = status.HTTP_202_ACCEPTED if upload.queued else status.HTTP_201_CREATED
+        return Response(get_upload_data(request, serializer, upload), status=response_status)
+
+
+class MetricsView(APIView):
+    """
+    Metrics collected by web process handling the request, in Prometheus text format: durations of stages
+    of upload and thumbnail requests, numbers of rendered thumbnails and written bytes, and hits of caches.
+    Available to staff users.
+    """
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(responses={200: OpenApiTypes.STR, 401: OpenApiTypes.OBJECT, 403: OpenApiTypes.OBJECT})
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -8,9 +8,77 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
+import tempfile
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.exceptions import RequestAborted, RequestDataTooBig
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse
+from django.test.utils import override_settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ImageUploadAPI.settings')
 
-application = get_asgi_application()
+
+class ProjectASGIHandler(ASGIHandler):
+    """
+    Handler serving requests with ASGI_MIDDLEWARE and ASGI_URLCONF, in which upload and display views do not
+    block event loop. Request body is received without holding any thread, and request with body larger
+    than ASGI_MAX_BODY_SIZE is rejected before it is received.
+    """
+    def load_middleware(self, is_async=False):
+        with override_settings(MIDDLEWARE=settings.ASGI_MIDDLEWARE):
+            super().load_middleware(is_async)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            headers = dict(scope.get('headers') or [])
+            content_length = headers.get(b'content-length', b'')
+            if content_length.isdigit() and int(content_length) > settings.ASGI_MAX_BODY_SIZE:
+                await self.send_response(self.body_too_large_response(), send)
+                return
+        try:
+            await super().__call__(scope, receive, send)
+        except RequestDataTooBig:
+            # Body without declared length grew above limit while it was received
+            await self.send_response(self.body_too_large_response(), send)
+
+    @staticmethod
+    def body_too_large_response():
+        return HttpResponse('413 Payload too large', status=413)
+
+    async def read_body(self, receive):
+        """
+        Receives request body like ASGIHandler, counting its size
+        """
+        body_file = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode='w+b')
+        received = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body_file.close()
+                raise RequestAborted()
+            body = message.get('body', b'')
+            received += len(body)
+            if received > settings.ASGI_MAX_BODY_SIZE:
+                body_file.close()
+                raise RequestDataTooBig()
+            body_file.write(body)
+            if not message.get('more_body', False):
+                break
+        body_file.seek(0)
+        return body_file
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = ProjectASGIHandler()
+
+# Deletes expired thumbnails periodically, if enabled in settings
+from API.reaper import start_reaper_scheduler  # noqa: E402
+start_reaper_scheduler()
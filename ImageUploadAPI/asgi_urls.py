@@ -0,0 +1,12 @@
+"""
+URLs of requests served by ASGI (ImageUploadAPI.asgi). They are the same as ROOT_URLCONF, except that upload and
+display views are run by API.async_views.async_view, so they do not block event loop.
+"""
+from importlib import import_module
+from django.conf import settings
+from API.async_views import async_urlpatterns
+
+# Image uploads and listing, batch uploads, time limited thumbnail uploads and thumbnail urls
+ASYNC_VIEW_NAMES = {'standard-list', 'standard-batch', 'timed-list', 'display_image'}
+
+urlpatterns = async_urlpatterns(import_module(settings.ROOT_URLCONF).urlpatterns, ASYNC_VIEW_NAMES)
@@ -88,6 +88,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'API.middleware.StageTimingMiddleware',
+    'API.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -179,9 +181,113 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'API.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'API.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
+
+# Thumbnails of uploaded images are rendered by process_thumbnails management command,
+# when disabled thumbnails are rendered during upload request
+THUMBNAIL_QUEUE_ENABLED = True
+THUMBNAIL_JOB_MAX_ATTEMPTS = 3
+THUMBNAIL_JOB_STALE_SECONDS = 600  # running job is claimed again by other worker after this time
+THUMBNAIL_WORKER_BATCH_SIZE = 10
+THUMBNAIL_WORKER_POLL_SECONDS = 2
+
+# Thumbnails of single upload are rendered one by one ('inline'), or spread over cores of the machine
+# using pool of threads ('thread') or processes ('process') with THUMBNAIL_RENDER_WORKERS workers (None - cpu count)
+THUMBNAIL_RENDER_MODE = 'inline'
+THUMBNAIL_RENDER_WORKERS = None
+THUMBNAIL_MAX_CONCURRENT_RENDERS = 4  # limit of renders running at once, in single web or worker process
+
+# Sources much larger than rendered thumbnails are decoded at reduced scale (JPEG draft mode) and shrunk with
+# Image.reduce before final resize, while staying THUMBNAIL_REDUCING_GAP times larger than the thumbnail
+THUMBNAIL_DRAFT_DECODING = True
+THUMBNAIL_REDUCING_GAP = 2.0
+
+# Image processing library used to read uploaded images and render thumbnails: Pillow ('pillow'), or libvips
+# ('vips', requires pyvips package), which decodes large sources in a streaming way using less memory.
+# libvips cannot run in forked processes, so with 'vips' process render mode uses threads
+THUMBNAIL_ENGINE = 'pillow'
+
+# Users resolved from tokens and their profiles are cached in each process. Changes are applied right away
+# in the process that made them, other processes may use previous values for up to AUTH_CACHE_TTL_SECONDS
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TTL_SECONDS = 60
+
+# Thumbnail permissions of each account type are compiled once and cached in each process
+THUMBNAIL_PLAN_CACHE_SIZE = 1000
+THUMBNAIL_PLAN_CACHE_TTL_SECONDS = 300
+
+# Thumbnail pages /i/<slug>/ send thumbnail file directly ('file'), hand it over to nginx /media/ location with
+# X-Accel-Redirect header ('nginx'), or render html page displaying it ('template')
+IMAGE_DELIVERY_MODE = environ.get('IMAGE_DELIVERY_MODE', 'file')
+IMAGE_CACHE_MAX_AGE = 86400  # seconds, time limited thumbnails are cached until they expire
+
+# Thumbnails are also encoded in THUMBNAIL_VARIANT_FORMATS, sent by /i/<slug>/ to clients listing them in Accept
+# header (earlier formats preferred), other clients receive thumbnail in format of source image. Variants are encoded
+# when thumbnails are rendered if THUMBNAIL_VARIANTS_EAGER is set, otherwise on first request accepting them.
+# AVIF is encoded only with pillow-avif-plugin installed. Quality can be set per account type.
+THUMBNAIL_VARIANT_FORMATS = ['avif', 'webp']
+THUMBNAIL_VARIANTS_EAGER = False
+THUMBNAIL_VARIANT_QUALITY = {'avif': 60, 'webp': 80}
+
+# Thumbnail slugs resolved by /i/<slug>/ are cached in each process (None), or in one of CACHES, given its alias.
+# Ready thumbnails are cached up to SLUG_CACHE_TTL_SECONDS, and not after they expire, unknown slugs
+# for SLUG_CACHE_NEGATIVE_TTL_SECONDS
+SLUG_CACHE_BACKEND = None
+SLUG_CACHE_SIZE = 100000
+SLUG_CACHE_TTL_SECONDS = 3600
+SLUG_CACHE_NEGATIVE_TTL_SECONDS = 10
+
+# Expired thumbnails are deleted by reap_expired management command, or by thread started in each web process
+# when REAPER_SCHEDULER_ENABLED is set
+REAPER_BATCH_SIZE = 500
+REAPER_SCHEDULER_ENABLED = False
+REAPER_INTERVAL_SECONDS = 300
+
+# Uploaded files are streamed to temporary files once, while their type, hash and image dimensions are read.
+# Files which are not images or are larger than IMAGE_UPLOAD_MAX_SIZE bytes are rejected while being received
+FILE_UPLOAD_HANDLERS = ['API.upload_handlers.IngestingUploadHandler']
+IMAGE_UPLOAD_MAX_SIZE = 20 * 2 ** 20
+
+# Large images can be uploaded in chunks by resumable upload sessions, see /api/uploads/. Received chunks are kept
+# in UPLOAD_SESSION_ROOT, session which does not receive any chunk for UPLOAD_SESSION_TTL_SECONDS expires
+UPLOAD_SESSION_ROOT = os.path.join(BASE_DIR, 'upload_sessions')
+UPLOAD_SESSION_TTL_SECONDS = 86400
+
+# Number of files accepted by single request to batch upload endpoint /api/all/batch/
+BATCH_UPLOAD_MAX_FILES = 100
+
+# Images listed by /api/all/ are split into pages, navigated by cursor links in response
+IMAGE_LIST_PAGE_SIZE = 50
+IMAGE_LIST_MAX_PAGE_SIZE = 1000
+
+# Responses of /api/all/ listing images of user are cached in one of CACHES, given its alias, until images of user
+# change, and carry ETags, so unchanged responses are answered with 304. Cache has to be shared by all processes,
+# like memcached or redis, disabled when None
+LISTING_CACHE_BACKEND = None
+LISTING_CACHE_TTL_SECONDS = 300
+
+# Time spent in stages of upload, timed upload and thumbnail requests (authentication, receiving, validation,
+# database, decoding, resizing, encoding, storage) is collected into histograms of each process, exposed with
+# other metrics on /api/metrics/ for staff users, and sent in Server-Timing header when SERVER_TIMING_HEADER is set
+SERVER_TIMING_HEADER = True
+
+# In development and tests queries of each request are recorded. Requests running more queries than budget declared
+# on their view with API.query_budget.query_budget, or the same query (differing only in parameters)
+# QUERY_REPEAT_THRESHOLD times or more, are logged with stack traces ('warn'), or fail with QueryBudgetExceeded
+# ('raise', set for tests). Queries are not recorded when None
+QUERY_BUDGET_MODE = 'warn' if DEBUG else None
+QUERY_REPEAT_THRESHOLD = 5
+
+# Requests served by ASGI (ImageUploadAPI.asgi, e.g. by uvicorn) use ASGI_URLCONF, where upload and display views
+# run in up to ASGI_SYNC_WORKERS threads of each process, while bodies of requests are received and responses sent
+# without holding threads. Debug toolbar middleware supports only sync requests, it would handle requests one
+# at a time. Requests with body larger than ASGI_MAX_BODY_SIZE bytes are rejected before it is received
+ASGI_URLCONF = 'ImageUploadAPI.asgi_urls'
+ASGI_MIDDLEWARE = [middleware for middleware in MIDDLEWARE if not middleware.startswith('debug_toolbar.')]
+ASGI_SYNC_WORKERS = 8
+ASGI_MAX_BODY_SIZE = BATCH_UPLOAD_MAX_FILES * IMAGE_UPLOAD_MAX_SIZE + 2 ** 20
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ImageUploadAPI.settings')
 
 application = get_wsgi_application()
+
+# Deletes expired thumbnails periodically, if enabled in settings
+from API.reaper import start_reaper_scheduler  # noqa: E402
+start_reaper_scheduler()
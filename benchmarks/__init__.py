@@ -0,0 +1,31 @@
+"""
+Performance benchmarks, run as modules from project root, e.g. ``python -m benchmarks.render_pool``.
+They use project settings, so environment variables from .env file are required.
+"""
+import os
+import random
+
+import django
+
+
+def setup_django():
+    """
+    Configures Django using project settings, has to be called before importing project modules
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ImageUploadAPI.settings')
+    django.setup()
+
+
+def make_test_image(path, width, height, image_format='JPEG'):
+    """
+    Saves photo-like test image (smooth gradients with noise) of given size and format
+    """
+    from PIL import Image, ImageFilter
+
+    noise = Image.effect_noise((width // 8, height // 8), 64).convert('L')
+    gradient = Image.linear_gradient('L').resize((width, height))
+    channels = [gradient, noise.resize((width, height), Image.BICUBIC),
+                gradient.transpose(Image.ROTATE_180).filter(ImageFilter.GaussianBlur(2))]
+    random.shuffle(channels)
+    Image.merge('RGB', channels).save(path, format=image_format, quality=90)
+    return path
@@ -0,0 +1,76 @@
+"""
+Decode time, render time and peak RSS of full decode and draft (reduced-scale) decode of large JPEG,
+when rendering small thumbnails only.
+
+    python -m benchmarks.decode_paths --source-size 6000x4000 --types 200x200 400x400
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+from benchmarks import setup_django, make_test_image
+
+
+def measure(media_root, thumbnail_types, draft_decoding, repeats, results):
+    """
+    Runs in separate process, so peak RSS of each path is measured on its own
+    """
+    from django.test import override_settings
+    from easy_thumbnails.files import get_thumbnailer
+    from API.engines import decode_source_image
+    from API.thumbnails import get_thumbnail_options, _generate_inline
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with override_settings(MEDIA_ROOT=media_root, THUMBNAIL_DRAFT_DECODING=draft_decoding):
+        thumbnailer = get_thumbnailer('source.jpg')
+        missing_options = {thumbnail_type: thumbnailer.get_options(get_thumbnail_options(thumbnail_type))
+                           for thumbnail_type in thumbnail_types}
+        decode_timings = []
+        render_timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decoded_size = decode_source_image(thumbnailer, missing_options).size
+            decode_timings.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            _generate_inline(thumbnailer, missing_options)
+            render_timings.append(time.perf_counter() - start)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((statistics.median(decode_timings), statistics.median(render_timings), decoded_size,
+                 (peak_rss - baseline_rss) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-size', default='6000x4000', help='size of generated source JPEG')
+    parser.add_argument('--types', nargs='+', default=['200x200', '400x400'], help='thumbnail types to render')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    width, height = (int(side) for side in args.source_size.split('x'))
+    context = multiprocessing.get_context('fork')
+    print(f'{" ".join(args.types)} thumbnails of {args.source_size} JPEG')
+    print(f'{"path":<6} {"decoded size":>13} {"decode ms":>10} {"render ms":>10} {"peak RSS MB":>12}')
+    with tempfile.TemporaryDirectory() as media_root:
+        # Source is generated in separate process, so its memory does not count into measured peak RSS
+        generator = context.Process(target=make_test_image, args=(os.path.join(media_root, 'source.jpg'), width, height))
+        generator.start()
+        generator.join()
+        for name, draft_decoding in [('full', False), ('draft', True)]:
+            results = context.Queue()
+            process = context.Process(target=measure,
+                                      args=(media_root, args.types, draft_decoding, args.repeats, results))
+            process.start()
+            decode_time, render_time, decoded_size, peak_rss = results.get()
+            process.join()
+            decoded = 'x'.join(str(side) for side in decoded_size)
+            print(f'{name:<6} {decoded:>13} {decode_time * 1000:>10.1f} {render_time * 1000:>10.1f} '
+                  f'{peak_rss:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
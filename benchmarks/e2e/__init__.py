@@ -0,0 +1,13 @@
+"""
+End-to-end benchmark of upload, list, retrieve and thumbnail endpoints, on seeded database of its own.
+Requests are sent through Django test client, and to gunicorn (or uvicorn, with --modes asgi) serving
+the project over HTTP.
+
+    python -m benchmarks.e2e seed --users 100000 --images 1000000
+    python -m benchmarks.e2e run --requests 500 --output results.json
+    python -m benchmarks.e2e run --requests 500 --baseline baseline.json
+    python -m benchmarks.e2e compare results.json baseline.json
+    python -m benchmarks.e2e drop
+
+Database and media directory used by benchmark are set in benchmarks.e2e.settings.
+"""
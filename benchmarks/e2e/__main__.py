@@ -0,0 +1,119 @@
+import argparse
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+from benchmarks import setup_django
+from benchmarks.e2e import __doc__ as usage
+from benchmarks.e2e.report import compare_results, load_results, print_regressions, print_results, save_results
+from benchmarks.e2e.runner import SCENARIOS
+
+
+def seed_command(args):
+    from benchmarks.e2e.dataset import create_database, get_dataset_size, seed
+
+    create_database()
+    seed(args.users, max(1, args.images // args.users), args.thumbnails, args.clients, args.chunk_images)
+    print('Dataset:', get_dataset_size())
+
+
+def run_command(args):
+    from benchmarks.e2e.dataset import get_dataset_size, get_targets
+    from benchmarks.e2e.runner import SERVER_TRANSPORTS, ClientTransport, run_scenarios
+
+    targets = get_targets(args.clients)
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'dataset': get_dataset_size(),
+        'options': {'requests': args.requests, 'uploads': args.uploads, 'warmup': args.warmup,
+                    'clients': args.clients, 'concurrency': args.concurrency, 'workers': args.workers},
+        'results': {},
+    }
+    for mode in args.modes:
+        print(f'Measuring {mode}..')
+        if mode == 'client':
+            transport = ClientTransport()
+            results['results'][mode] = run_scenarios(transport, args.scenarios, targets, args.requests, args.uploads,
+                                                     args.warmup, 1)
+        else:
+            transport = SERVER_TRANSPORTS[mode](args.workers, args.port)
+            transport.start()
+            try:
+                results['results'][mode] = run_scenarios(transport, args.scenarios, targets, args.requests,
+                                                         args.uploads, args.warmup, args.concurrency)
+            finally:
+                transport.stop()
+    print_results(results)
+    if args.output:
+        save_results(args.output, results)
+    if args.baseline:
+        regressions = compare_results(results, load_results(args.baseline), args.threshold)
+        print_regressions(regressions)
+        return 1 if regressions else 0
+    return 0
+
+
+def compare_command(args):
+    regressions = compare_results(load_results(args.results), load_results(args.baseline), args.threshold)
+    print_regressions(regressions)
+    return 1 if regressions else 0
+
+
+def drop_command(args):
+    from benchmarks.e2e.dataset import drop_database
+
+    drop_database()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.e2e', description=usage,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='create benchmark database and add users with images to it')
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--images', type=int, default=10000, help='number of images, spread evenly over users')
+    seed_parser.add_argument('--thumbnails', type=int, default=3, choices=range(1, 6),
+                             help='number of thumbnails of each image')
+    seed_parser.add_argument('--clients', type=int, default=10, help='number of users which can send requests')
+    seed_parser.add_argument('--chunk-images', type=int, default=100000,
+                             help='number of images inserted in single transaction')
+    seed_parser.set_defaults(handler=seed_command)
+
+    run_parser = commands.add_parser('run', help='measure requests to seeded database')
+    run_parser.add_argument('--modes', nargs='+', choices=['client', 'wsgi', 'asgi'], default=['client', 'wsgi'],
+                            help='asgi mode requires uvicorn')
+    run_parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    run_parser.add_argument('--requests', type=int, default=200, help='measured requests of each read scenario')
+    run_parser.add_argument('--uploads', type=int, default=20, help='measured requests of each upload scenario')
+    run_parser.add_argument('--warmup', type=int, default=10, help='requests of each read scenario sent first')
+    run_parser.add_argument('--clients', type=int, default=10, help='number of seeded users sending requests')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='concurrent requests sent to server')
+    run_parser.add_argument('--workers', type=int, default=4, help='number of gunicorn or uvicorn workers')
+    run_parser.add_argument('--port', type=int, default=8765)
+    run_parser.add_argument('--output', help='path of JSON file results are saved to')
+    run_parser.add_argument('--baseline', help='path of JSON results to compare with')
+    run_parser.add_argument('--threshold', type=float, default=0.2,
+                            help='allowed relative growth of latency and memory against baseline')
+    run_parser.set_defaults(handler=run_command)
+
+    compare_parser = commands.add_parser('compare', help='compare saved results with baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+    compare_parser.set_defaults(handler=compare_command)
+
+    drop_parser = commands.add_parser('drop', help='drop benchmark database and its media directory')
+    drop_parser.set_defaults(handler=drop_command)
+
+    args = parser.parse_args()
+    if args.command != 'compare':
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.e2e.settings')
+        setup_django()
+    return args.handler(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
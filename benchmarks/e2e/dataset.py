@@ -0,0 +1,240 @@
+"""
+Synthetic dataset of users, account types, images and thumbnails, inserted with set-based statements in chunks,
+so it scales to millions of rows. All seeded images point at a single source file, and thumbnails at files
+rendered from it, so seeded files take little space.
+"""
+import hashlib
+import os
+import shutil
+from collections import namedtuple
+
+from benchmarks import make_test_image
+
+USER_PREFIX = 'bench_user_'
+TOKEN_PREFIX = 'bench_token_'
+SOURCE_NAME = 'benchmark/source.jpg'
+SOURCE_SIZE = (1600, 1200)
+# Types of thumbnails of each seeded image, in order. Last one is the original size link
+THUMBNAIL_TYPES = ['200x200', '400x400', '500x500', '1000x1000', '1600x1200']
+EXPIRING_EVERY = 20  # every n-th image has additional time limited thumbnail
+EXPIRING_TYPE = '200'
+EXPIRING_TIME = 30000
+
+# Name, permissions and custom sizes of seeded account types. Users sending requests have the last one
+AccountType = namedtuple('AccountType', ['name', 'permissions', 'custom_sizes'])
+ACCOUNT_TYPES = [
+    AccountType('bench_basic', {'create_200px_thumbnail_perm': True}, []),
+    AccountType('bench_premium', {'create_200px_thumbnail_perm': True, 'create_400px_thumbnail_perm': True,
+                                  'create_original_img_link_perm': True}, []),
+    AccountType('bench_enterprise', {'create_200px_thumbnail_perm': True, 'create_400px_thumbnail_perm': True,
+                                     'create_original_img_link_perm': True,
+                                     'create_custom_sized_thumbnail_perm': True,
+                                     'create_time_limited_link_perm': True}, [500, 1000]),
+]
+
+# User sending benchmark requests, his token, images and slugs of their thumbnails
+Target = namedtuple('Target', ['username', 'token', 'image_ids', 'slugs'])
+
+
+def get_username(index):
+    return f'{USER_PREFIX}{index}'
+
+
+def get_token(username):
+    """
+    Tokens of seeded users are derived from their names, so they are known without reading them from database
+    """
+    return hashlib.md5(f'{TOKEN_PREFIX}{username}'.encode('utf-8')).hexdigest()
+
+
+def get_tables():
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+    from API.models import APIUserProfile, GeneratedImage, StoredImage
+
+    return {
+        'user': User._meta.db_table,
+        'token': Token._meta.db_table,
+        'profile': APIUserProfile._meta.db_table,
+        'image': StoredImage._meta.db_table,
+        'thumbnail': GeneratedImage._meta.db_table,
+    }
+
+
+def create_database():
+    """
+    Creates benchmark database if it does not exist, and applies migrations
+    """
+    from django.core.management import call_command
+    from django.db import connection
+
+    name = connection.settings_dict['NAME']
+    with connection._nodb_cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', [name])
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE {connection.ops.quote_name(name)}')
+    call_command('migrate', verbosity=0)
+
+
+def drop_database():
+    """
+    Drops benchmark database and deletes media directory of benchmark
+    """
+    from django.conf import settings
+    from django.db import connection
+
+    name = connection.settings_dict['NAME']
+    connection.close()
+    with connection._nodb_cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS {connection.ops.quote_name(name)}')
+    shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+
+def get_thumbnail_name(thumbnail_type):
+    return f'benchmark/thumbnail_{thumbnail_type}.jpg'
+
+
+def create_media_files():
+    """
+    Saves source image and its thumbnails of all seeded types in media directory, if they are missing
+    """
+    from django.conf import settings
+    from PIL import Image, ImageOps
+
+    source_path = os.path.join(settings.MEDIA_ROOT, SOURCE_NAME)
+    os.makedirs(os.path.dirname(source_path), exist_ok=True)
+    if not os.path.exists(source_path):
+        make_test_image(source_path, *SOURCE_SIZE)
+    with Image.open(source_path) as source:
+        for thumbnail_type in THUMBNAIL_TYPES + [f'{EXPIRING_TYPE}x{EXPIRING_TYPE}']:
+            path = os.path.join(settings.MEDIA_ROOT, get_thumbnail_name(thumbnail_type))
+            if not os.path.exists(path):
+                size = tuple(int(side) for side in thumbnail_type.split('x'))
+                ImageOps.fit(source, size).save(path, quality=85)
+
+
+def create_account_types():
+    """
+    :return: ids of seeded account types, in order of ACCOUNT_TYPES
+    """
+    from API.models import AccountTypePermissions, CustomThumbnailSize
+
+    ids = []
+    for account_type in ACCOUNT_TYPES:
+        instance, created = AccountTypePermissions.objects.get_or_create(name=account_type.name,
+                                                                         defaults=account_type.permissions)
+        if created:
+            instance.custom_size.add(*[CustomThumbnailSize.objects.get_or_create(size=size)[0]
+                                       for size in account_type.custom_sizes])
+        ids.append(instance.id)
+    return ids
+
+
+def seed_chunk(cursor, tables, first, last, account_type_ids, clients, images_per_user, thumbnails_per_image):
+    """
+    Inserts users of indexes first to last, with profiles, images and thumbnails, in single statement
+    """
+    from django.conf import settings
+
+    thumbnail_types = THUMBNAIL_TYPES[:thumbnails_per_image]
+    thumbnail_urls = [settings.MEDIA_URL + get_thumbnail_name(thumbnail_type) for thumbnail_type in thumbnail_types]
+    expiring_url = settings.MEDIA_URL + get_thumbnail_name(f'{EXPIRING_TYPE}x{EXPIRING_TYPE}')
+    cursor.execute(f'''
+        WITH new_users AS (
+            INSERT INTO "{tables['user']}" (password, is_superuser, username, first_name, last_name, email,
+                                            is_staff, is_active, date_joined)
+            SELECT '', false, %(prefix)s || i, '', '', '', false, true, now()
+            FROM generate_series(%(first)s, %(last)s) i
+            RETURNING id, username
+        ), new_profiles AS (
+            INSERT INTO "{tables['profile']}" (user_id, account_type_id)
+            SELECT new_users.id, CASE WHEN i <= %(clients)s THEN %(client_type)s
+                                      ELSE (%(account_types)s::bigint[])[1 + i %% %(type_count)s] END
+            FROM generate_series(%(first)s, %(last)s) i
+            JOIN new_users ON new_users.username = %(prefix)s || i
+            RETURNING id
+        ), new_images AS (
+            INSERT INTO "{tables['image']}" (owner_id, img_width, img_height, file)
+            SELECT new_profiles.id, %(width)s, %(height)s, %(source)s
+            FROM new_profiles, generate_series(1, %(images)s)
+            RETURNING id
+        )
+        INSERT INTO "{tables['thumbnail']}" (source_image_id, modified_image, slug, type, created, status,
+                                             expire_time, expire_date, variants)
+        SELECT new_images.id, (%(urls)s::text[])[i], substr(md5(new_images.id || '_' || i), 1, 15),
+               (%(types)s::text[])[i], now(), 'ready', NULL::integer, NULL::timestamptz, '{{}}'::jsonb
+        FROM new_images, generate_series(1, %(thumbnails)s) i
+        UNION ALL
+        SELECT new_images.id, %(expiring_url)s, substr(md5(new_images.id || '_expiring'), 1, 15), %(expiring_type)s,
+               now(), 'ready', %(expire_time)s, now() + %(expire_time)s * interval '1 second', '{{}}'::jsonb
+        FROM new_images
+        WHERE new_images.id %% %(expiring_every)s = 0''', {
+        'prefix': USER_PREFIX, 'first': first, 'last': last, 'clients': clients,
+        'client_type': account_type_ids[-1], 'account_types': account_type_ids, 'type_count': len(account_type_ids),
+        'width': SOURCE_SIZE[0], 'height': SOURCE_SIZE[1], 'source': SOURCE_NAME, 'images': images_per_user,
+        'urls': thumbnail_urls, 'types': thumbnail_types, 'thumbnails': len(thumbnail_types),
+        'expiring_url': expiring_url, 'expiring_type': EXPIRING_TYPE, 'expire_time': EXPIRING_TIME,
+        'expiring_every': EXPIRING_EVERY,
+    })
+
+
+def seed(users, images_per_user, thumbnails_per_image, clients, chunk_images=100000, progress=print):
+    """
+    Adds users to benchmark database, continuing numbering of users seeded before. Every chunk of users is
+    committed separately, so memory and transaction size do not grow with size of dataset.
+    :param clients: number of first users, which have tokens and account type permitting all thumbnails
+    :param chunk_images: approximate number of images inserted by single statement
+    """
+    from django.db import connection
+
+    create_media_files()
+    account_type_ids = create_account_types()
+    tables = get_tables()
+    chunk_users = max(1, chunk_images // images_per_user)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM "{tables["user"]}" WHERE username LIKE %s', [USER_PREFIX + '%'])
+        seeded = cursor.fetchone()[0]
+        for first in range(seeded + 1, seeded + users + 1, chunk_users):
+            last = min(first + chunk_users - 1, seeded + users)
+            seed_chunk(cursor, tables, first, last, account_type_ids, clients, images_per_user,
+                       thumbnails_per_image)
+            progress(f'users {first}-{last} seeded')
+        cursor.execute(f'''
+            INSERT INTO "{tables['token']}" (key, user_id, created)
+            SELECT md5(%s || username), id, now() FROM "{tables['user']}" WHERE username = ANY(%s)
+            ON CONFLICT DO NOTHING''', [TOKEN_PREFIX, [get_username(index) for index in range(1, clients + 1)]])
+        for table in tables.values():
+            cursor.execute(f'ANALYZE "{table}"')
+
+
+def get_dataset_size():
+    """
+    :return: dict with number of seeded users, images and thumbnails, estimated from planner statistics
+    """
+    from django.db import connection
+
+    tables = get_tables()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relname, reltuples::bigint FROM pg_class WHERE relname IN %s',
+                       [(tables['user'], tables['image'], tables['thumbnail'])])
+        rows = dict(cursor.fetchall())
+    return {'users': rows.get(tables['user'], 0), 'images': rows.get(tables['image'], 0),
+            'thumbnails': rows.get(tables['thumbnail'], 0)}
+
+
+def get_targets(clients, images_per_client=20):
+    """
+    :return: list of Target for first users of dataset, which send benchmark requests
+    """
+    from API.models import GeneratedImage, StoredImage
+
+    targets = []
+    for index in range(1, clients + 1):
+        username = get_username(index)
+        image_ids = list(StoredImage.objects.filter(owner__user__username=username)
+                         .order_by('id').values_list('id', flat=True)[:images_per_client])
+        slugs = list(GeneratedImage.objects.filter(source_image_id__in=image_ids).values_list('slug', flat=True))
+        if not image_ids or not slugs:
+            raise ValueError(f'User {username} has no seeded images, run seed command first')
+        targets.append(Target(username, get_token(username), image_ids, slugs))
+    return targets
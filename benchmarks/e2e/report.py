@@ -0,0 +1,99 @@
+"""
+Summaries of measured requests, saved as JSON, and comparison of results with baseline saved before
+"""
+import json
+import statistics
+from collections import namedtuple
+
+LATENCY_METRICS = ['p50_ms', 'p95_ms', 'p99_ms']
+MIN_LATENCY_DELTA_MS = 1.0  # smaller differences are within noise of single run
+# Averages vary slightly with order of requests, as caches are filled by first requests of each user
+MIN_QUERIES_DELTA = 0.5
+
+Regression = namedtuple('Regression', ['mode', 'scenario', 'metric', 'baseline', 'current'])
+
+
+def summarize(latencies, statuses, queries, wall_time, rss):
+    """
+    :param latencies: seconds taken by each request
+    :param statuses: status codes of responses
+    :param queries: numbers of queries of each request, or None when they are not known
+    :param wall_time: seconds taken by all requests, which may have been sent concurrently
+    :param rss: tuple of current and peak resident memory, in bytes
+    :return: dict with percentiles of latency in milliseconds, throughput, errors, queries per request and memory
+    """
+    milliseconds = [latency * 1000 for latency in latencies]
+    cut_points = statistics.quantiles(milliseconds, n=100, method='inclusive') if len(milliseconds) > 1 \
+        else milliseconds * 99
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'p50_ms': round(cut_points[49], 2),
+        'p95_ms': round(cut_points[94], 2),
+        'p99_ms': round(cut_points[98], 2),
+        'mean_ms': round(statistics.fmean(milliseconds), 2),
+        'requests_per_second': round(len(latencies) / wall_time, 1),
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+        'rss_mb': round(rss[0] / 2 ** 20, 1),
+        'peak_rss_mb': round(rss[1] / 2 ** 20, 1),
+    }
+
+
+def save_results(path, results):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Finds metrics which got worse than in baseline. Latency and memory regress when they grow by more than
+    threshold, queries per request when they grow by more than MIN_QUERIES_DELTA, and errors when there
+    are any more of them.
+    Scenarios missing from either results are skipped.
+    :param threshold: allowed relative growth, like 0.2 for 20%
+    :return: list of Regression
+    """
+    regressions = []
+    for mode, scenarios in results['results'].items():
+        for scenario, summary in scenarios.items():
+            base = baseline['results'].get(mode, {}).get(scenario)
+            if base is None:
+                continue
+
+            def regressed(metric, allowed, min_delta=0.0):
+                return summary.get(metric) is not None and base.get(metric) is not None \
+                    and summary[metric] > allowed and summary[metric] - base[metric] > min_delta
+
+            checks = [(metric, base[metric] * (1 + threshold), MIN_LATENCY_DELTA_MS) for metric in LATENCY_METRICS]
+            checks += [('queries_per_request', base['queries_per_request'], MIN_QUERIES_DELTA),
+                       ('errors', base['errors'], 0.0),
+                       ('peak_rss_mb', base['peak_rss_mb'] * (1 + threshold), 0.0)]
+            regressions += [Regression(mode, scenario, metric, base[metric], summary[metric])
+                            for metric, allowed, min_delta in checks if regressed(metric, allowed, min_delta)]
+    return regressions
+
+
+def print_results(results):
+    for mode, scenarios in results['results'].items():
+        print(f'{mode}:')
+        print(f'  {"scenario":<13} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} '
+              f'{"errors":>7} {"RSS MB":>7} {"peak MB":>8}')
+        for scenario, summary in scenarios.items():
+            queries = summary['queries_per_request']
+            print(f'  {scenario:<13} {summary["requests_per_second"]:>8.1f} {summary["p50_ms"]:>8.1f} '
+                  f'{summary["p95_ms"]:>8.1f} {summary["p99_ms"]:>8.1f} '
+                  f'{queries if queries is not None else "-":>8} {summary["errors"]:>7} '
+                  f'{summary["rss_mb"]:>7.1f} {summary["peak_rss_mb"]:>8.1f}')
+
+
+def print_regressions(regressions):
+    if not regressions:
+        print('No regressions against baseline')
+    for regression in regressions:
+        print(f'REGRESSION {regression.mode} {regression.scenario} {regression.metric}: '
+              f'{regression.baseline} -> {regression.current}')
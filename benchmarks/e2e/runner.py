@@ -0,0 +1,264 @@
+"""
+Sends benchmark requests through Django test client, in the same process, or over HTTP to gunicorn (WSGI)
+or uvicorn (ASGI), started with benchmark settings
+"""
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import make_test_image
+from benchmarks.e2e.report import summarize
+
+UPLOAD_SIZE = (1024, 768)
+TIMED_TYPE = '200'
+TIMED_EXPIRE_TIME = '300'
+
+# Request to send, files maps field name to tuple of file name, content and content type
+BenchmarkRequest = namedtuple('BenchmarkRequest', ['method', 'path', 'token', 'data', 'files'])
+
+SCENARIOS = ['upload', 'upload_timed', 'list', 'retrieve', 'display']
+UPLOAD_SCENARIOS = {'upload', 'upload_timed'}
+
+
+def make_upload_files(count):
+    """
+    :return: list of distinct JPEG images, so every upload stores new blob instead of reusing existing one
+    """
+    files = []
+    for index in range(count):
+        data = io.BytesIO()
+        make_test_image(data, *UPLOAD_SIZE)
+        files.append((f'upload_{index}.jpg', data.getvalue(), 'image/jpeg'))
+    return files
+
+
+def build_requests(scenario, targets, count, upload_files=None):
+    """
+    :param targets: list of dataset.Target, requests are spread over them in turn
+    :param upload_files: iterator of files to upload, required by upload scenarios
+    :return: list of BenchmarkRequest of scenario
+    """
+    requests = []
+    for index in range(count):
+        target = targets[index % len(targets)]
+        round_index = index // len(targets)
+        if scenario == 'upload':
+            request = BenchmarkRequest('POST', '/api/all/', target.token, {}, {'file': next(upload_files)})
+        elif scenario == 'upload_timed':
+            request = BenchmarkRequest('POST', '/api/timed/', target.token,
+                                       {'type': TIMED_TYPE, 'expire_time': TIMED_EXPIRE_TIME},
+                                       {'file': next(upload_files)})
+        elif scenario == 'list':
+            request = BenchmarkRequest('GET', '/api/all/', target.token, {}, {})
+        elif scenario == 'retrieve':
+            image_id = target.image_ids[round_index % len(target.image_ids)]
+            request = BenchmarkRequest('GET', f'/api/all/{image_id}/', target.token, {}, {})
+        elif scenario == 'display':
+            request = BenchmarkRequest('GET', f'/i/{target.slugs[round_index % len(target.slugs)]}/', None, {}, {})
+        else:
+            raise ValueError(f'Unknown scenario {scenario}')
+        requests.append(request)
+    return requests
+
+
+def read_memory(pids):
+    """
+    :return: tuple of current and peak resident memory of processes, in bytes
+    """
+    current = peak = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        current += int(line.split()[1]) * 1024
+                    elif line.startswith('VmHWM:'):
+                        peak += int(line.split()[1]) * 1024
+        except FileNotFoundError:
+            pass
+    return current, peak
+
+
+def get_process_tree(pid):
+    """
+    :return: pid and pids of all descendants of process
+    """
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    # Process name in second field can contain spaces, parent pid is second field after it
+                    parents[int(entry)] = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (FileNotFoundError, ProcessLookupError):
+                pass
+    tree = [pid]
+    for current in tree:
+        tree += [child for child, parent in parents.items() if parent == current]
+    return tree
+
+
+class ClientTransport:
+    """
+    Sends requests through Django test client in current process, counting queries of each request
+    """
+    name = 'client'
+
+    def __init__(self):
+        from rest_framework.test import APIClient
+
+        self.client = APIClient()
+
+    def send(self, request):
+        """
+        :return: tuple of status code and number of queries
+        """
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        data = dict(request.data)
+        for field, (name, content, content_type) in request.files.items():
+            data[field] = SimpleUploadedFile(name, content, content_type)
+        headers = {'HTTP_AUTHORIZATION': f'Token {request.token}'} if request.token else {}
+        with CaptureQueriesContext(connection) as queries:
+            if request.method == 'POST':
+                response = self.client.post(request.path, data, format='multipart', **headers)
+            else:
+                response = self.client.get(request.path, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            response.close()
+        return response.status_code, len(queries)
+
+    def run(self, requests, concurrency):
+        """
+        Requests are sent one by one, test client is not meant to be shared by threads
+        :return: tuple of latencies, statuses, query counts and wall time
+        """
+        latencies, statuses, queries = [], [], []
+        start = time.perf_counter()
+        for request in requests:
+            request_start = time.perf_counter()
+            status, query_count = self.send(request)
+            latencies.append(time.perf_counter() - request_start)
+            statuses.append(status)
+            queries.append(query_count)
+        return latencies, statuses, queries, time.perf_counter() - start
+
+    def memory(self):
+        return read_memory([os.getpid()])
+
+
+class WSGIServerTransport:
+    """
+    Sends requests over HTTP to gunicorn, serving project with benchmark settings in separate processes.
+    Queries of requests are not known in this mode.
+    """
+    name = 'wsgi'
+    server_name = 'gunicorn'
+
+    def __init__(self, workers, port):
+        self.workers = workers
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.port = port
+        self.process = None
+        self._sessions = threading.local()
+
+    def get_command(self):
+        return [sys.executable, '-m', 'gunicorn', 'ImageUploadAPI.wsgi:application',
+                '--bind', f'127.0.0.1:{self.port}', '--workers', str(self.workers), '--log-level', 'warning']
+
+    def start(self, timeout=30):
+        environment = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'benchmarks.e2e.settings'}
+        self.process = subprocess.Popen(self.get_command(), env=environment)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'{self.server_name} exited with code {self.process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f'{self.server_name} did not start listening on port {self.port} in {timeout} seconds')
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def get_session(self):
+        import requests
+
+        if not hasattr(self._sessions, 'session'):
+            self._sessions.session = requests.Session()
+        return self._sessions.session
+
+    def send(self, request):
+        """
+        :return: tuple of status code and latency in seconds
+        """
+        headers = {'Authorization': f'Token {request.token}'} if request.token else {}
+        start = time.perf_counter()
+        response = self.get_session().request(request.method, self.base_url + request.path, headers=headers,
+                                              data=request.data, files=request.files or None)
+        response.content  # whole body is received
+        return response.status_code, time.perf_counter() - start
+
+    def run(self, requests, concurrency):
+        """
+        Requests are sent by concurrency threads, each with its own connection
+        :return: tuple of latencies, statuses, query counts (None) and wall time
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            responses = list(executor.map(self.send, requests))
+        wall_time = time.perf_counter() - start
+        return [latency for _, latency in responses], [status for status, _ in responses], None, wall_time
+
+    def memory(self):
+        return read_memory(get_process_tree(self.process.pid))
+
+
+class ASGIServerTransport(WSGIServerTransport):
+    """
+    Sends requests over HTTP to uvicorn, serving project through ImageUploadAPI.asgi in separate processes
+    """
+    name = 'asgi'
+    server_name = 'uvicorn'
+
+    def get_command(self):
+        return [sys.executable, '-m', 'uvicorn', 'ImageUploadAPI.asgi:application', '--host', '127.0.0.1',
+                '--port', str(self.port), '--workers', str(self.workers), '--log-level', 'warning']
+
+
+# Transports of modes sending requests over HTTP
+SERVER_TRANSPORTS = {transport.name: transport for transport in (WSGIServerTransport, ASGIServerTransport)}
+
+
+def run_scenarios(transport, scenarios, targets, request_count, upload_count, warmup, concurrency):
+    """
+    Measures each scenario with transport. Read scenarios are warmed up with warmup requests which are not
+    measured, uploads are not, as each of them adds rows and files.
+    :return: dict of scenario: summary of its requests
+    """
+    results = {}
+    upload_files = iter(make_upload_files(upload_count * len(UPLOAD_SCENARIOS & set(scenarios))))
+    for scenario in scenarios:
+        if scenario in UPLOAD_SCENARIOS:
+            requests = build_requests(scenario, targets, upload_count, upload_files)
+        else:
+            transport.run(build_requests(scenario, targets, warmup), concurrency)
+            requests = build_requests(scenario, targets, request_count)
+        latencies, statuses, queries, wall_time = transport.run(requests, concurrency)
+        results[scenario] = summarize(latencies, statuses, queries, wall_time, transport.memory())
+    return results
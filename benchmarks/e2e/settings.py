@@ -0,0 +1,19 @@
+"""
+Project settings, with database and media directory of their own, so seeded rows and files do not mix with
+development data
+"""
+import os
+from os import environ
+
+from ImageUploadAPI.settings import *  # noqa: F401,F403
+from ImageUploadAPI.settings import BASE_DIR, DATABASES, DB_NAME
+
+DEBUG = False
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
+
+DATABASES = {'default': {**DATABASES['default'], 'NAME': environ.get('BENCHMARK_DB_NAME', f'benchmark_{DB_NAME}')}}
+MEDIA_ROOT = environ.get('BENCHMARK_MEDIA_ROOT', os.path.join(BASE_DIR, 'benchmark_media'))
+
+# Uploads are measured with thumbnails rendered during request, set BENCHMARK_THUMBNAIL_QUEUE=1 to only queue them
+THUMBNAIL_QUEUE_ENABLED = environ.get('BENCHMARK_THUMBNAIL_QUEUE') == '1'
+QUERY_BUDGET_MODE = None  # queries are not recorded while measured
@@ -0,0 +1,79 @@
+"""
+Throughput and peak RSS of image engines (THUMBNAIL_ENGINE), rendering thumbnails of 12MP JPEG and 4K PNG.
+Engines which are not installed are skipped.
+
+    python -m benchmarks.image_engines --types 200x200 400x400 --repeats 5
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks import setup_django, make_test_image
+
+# Name of source file, its size and format
+SOURCES = [
+    ('photo.jpg', (4000, 3000), 'JPEG'),
+    ('screen.png', (3840, 2160), 'PNG'),
+]
+
+
+def measure(engine_name, media_root, source_name, thumbnail_types, repeats, results):
+    """
+    Runs in separate, spawned process, so peak RSS of each engine is measured on its own, and libvips
+    is not started in a forked process
+    """
+    setup_django()
+    from django.test import override_settings
+    from easy_thumbnails.files import get_thumbnailer
+    from API.thumbnails import get_thumbnail_options, _generate_inline
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with override_settings(MEDIA_ROOT=media_root, THUMBNAIL_ENGINE=engine_name):
+        thumbnailer = get_thumbnailer(source_name)
+        missing_options = {thumbnail_type: thumbnailer.get_options(get_thumbnail_options(thumbnail_type))
+                           for thumbnail_type in thumbnail_types}
+        start = time.perf_counter()
+        for _ in range(repeats):
+            generated = _generate_inline(thumbnailer, missing_options)
+        elapsed = time.perf_counter() - start
+    errors = [str(item) for item in generated.values() if isinstance(item, Exception)]
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((repeats / elapsed, (peak_rss - baseline_rss) / 1024, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--types', nargs='+', default=['200x200', '400x400'], help='thumbnail types to render')
+    parser.add_argument('--engines', nargs='+', default=['pillow', 'vips'])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from API.engines import pyvips
+    engines = [name for name in args.engines if name != 'vips' or pyvips is not None]
+    context = multiprocessing.get_context('spawn')
+    print(f'{" ".join(args.types)} thumbnails, engines: {" ".join(engines)}')
+    print(f'{"source":<12} {"engine":<8} {"sources/s":>10} {"peak RSS MB":>12}')
+    with tempfile.TemporaryDirectory() as media_root:
+        for source_name, (width, height), image_format in SOURCES:
+            # Source is generated in separate process, so its memory does not count into measured peak RSS
+            generator = context.Process(target=make_test_image,
+                                        args=(os.path.join(media_root, source_name), width, height, image_format))
+            generator.start()
+            generator.join()
+            for engine_name in engines:
+                results = context.Queue()
+                process = context.Process(target=measure, args=(engine_name, media_root, source_name, args.types,
+                                                                args.repeats, results))
+                process.start()
+                throughput, peak_rss, errors = results.get()
+                process.join()
+                print(f'{source_name:<12} {engine_name:<8} {throughput:>10.2f} {peak_rss:>12.1f}'
+                      + (f'  errors: {"; ".join(errors)}' if errors else ''))
+
+
+if __name__ == '__main__':
+    main()
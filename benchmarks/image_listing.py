@@ -0,0 +1,87 @@
+"""
+Serialization throughput of pages of image list, with StoredImageSerializer and with values-based
+serialize_images used by list and retrieve endpoints. Rows are built in memory, so only serialization is measured.
+
+    python -m benchmarks.image_listing --page-size 1000 --thumbnails 5
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks import setup_django
+
+
+def build_page(page_size, thumbnails_per_image):
+    """
+    :return: tuple of model instances with prefetched thumbnails, values of images and values of thumbnails
+    """
+    from django.utils import timezone
+    from API.models import GeneratedImage, StoredImage
+
+    now = timezone.now()
+    instances = []
+    image_values = []
+    thumbnail_rows = []
+    for image_id in range(1, page_size + 1):
+        image = StoredImage(id=image_id, file=f'blobs/{image_id % 256:02x}/{image_id:064x}.jpg',
+                            img_width=4000, img_height=3000)
+        thumbnails = []
+        for index in range(thumbnails_per_image):
+            thumbnail = GeneratedImage(id=image_id * 100 + index, source_image=image,
+                                       type=f'{index + 2}00x{index + 2}00', slug=f'{image_id:09d}{index:06d}',
+                                       created=now, status='ready',
+                                       expire_date=now + timedelta(seconds=300) if index == 0 else None)
+            thumbnails.append(thumbnail)
+            thumbnail_rows.append((image_id, thumbnail.id, thumbnail.type, thumbnail.slug, thumbnail.expire_date,
+                                   thumbnail.created, thumbnail.status))
+        prefetched = GeneratedImage.objects.none()
+        prefetched._result_cache = thumbnails
+        prefetched._prefetch_done = True
+        image._prefetched_objects_cache = {'thumbnails': prefetched}
+        instances.append(image)
+        image_values.append({'id': image_id, 'file': image.file.name})
+    return instances, image_values, thumbnail_rows
+
+
+def measure(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page-size', type=int, default=1000, help='number of images on page')
+    parser.add_argument('--thumbnails', type=int, default=5, help='number of thumbnails of each image')
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIRequestFactory
+    from API.fast_serializers import serialize_images
+    from API.serializers import StoredImageSerializer
+
+    instances, image_values, thumbnail_rows = build_page(args.page_size, args.thumbnails)
+    request = APIRequestFactory().get('/api/all/', HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    renderer = JSONRenderer()
+    paths = {
+        'model serializer': lambda: renderer.render(
+            StoredImageSerializer(instances, many=True, context={'request': request}).data),
+        'values': lambda: renderer.render(serialize_images(image_values, thumbnail_rows, request)),
+    }
+
+    print(f'Pages of {args.page_size} images with {args.thumbnails} thumbnails each, rendered to JSON')
+    print(f'{"path":<17} {"page ms":>9} {"pages/s":>8} {"images/s":>9}')
+    for name, function in paths.items():
+        median = measure(function, args.repeats)
+        print(f'{name:<17} {median * 1000:>9.1f} {1 / median:>8.1f} {args.page_size / median:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
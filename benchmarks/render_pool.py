@@ -0,0 +1,64 @@
+"""
+Wall time of rendering all thumbnail sizes of single upload, for each render mode and number of pool workers.
+
+    python -m benchmarks.render_pool --source-size 4000x3000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks import setup_django, make_test_image
+
+
+def run(source_size, thumbnail_types, workers_counts, repeats):
+    from django.test import override_settings
+    from easy_thumbnails.files import get_thumbnailer
+    from API.thumbnails import RENDER_MODE_GENERATORS, get_thumbnail_options, shutdown_render_pool
+
+    width, height = source_size
+    rows = []
+    with tempfile.TemporaryDirectory() as media_root:
+        make_test_image(os.path.join(media_root, 'source.jpg'), width, height)
+        for mode in RENDER_MODE_GENERATORS:
+            for workers in (workers_counts if mode != 'inline' else [1]):
+                with override_settings(MEDIA_ROOT=media_root, THUMBNAIL_RENDER_MODE=mode,
+                                       THUMBNAIL_RENDER_WORKERS=workers, THUMBNAIL_MAX_CONCURRENT_RENDERS=workers):
+                    thumbnailer = get_thumbnailer('source.jpg')
+                    missing_options = {thumbnail_type: thumbnailer.get_options(get_thumbnail_options(thumbnail_type))
+                                       for thumbnail_type in thumbnail_types}
+                    generate = RENDER_MODE_GENERATORS[mode]
+                    generate(thumbnailer, missing_options)  # warm up pool
+                    timings = []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        generate(thumbnailer, missing_options)
+                        timings.append(time.perf_counter() - start)
+                    shutdown_render_pool()
+                rows.append((mode, workers, statistics.median(timings), min(timings)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-size', default='4000x3000', help='size of generated source JPEG')
+    parser.add_argument('--types', nargs='+', default=['200x200', '400x400', '4000x3000', '500x500', '1000x1000'],
+                        help='thumbnail types rendered for every upload')
+    parser.add_argument('--workers', nargs='+', type=int, default=sorted({1, 2, 4, os.cpu_count()}),
+                        help='pool sizes to measure')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    source_size = tuple(int(side) for side in args.source_size.split('x'))
+    rows = run(source_size, args.types, args.workers, args.repeats)
+
+    print(f'{len(args.types)} thumbnails of {args.source_size} JPEG, {os.cpu_count()} cores available')
+    print(f'{"mode":<8} {"workers":>7} {"median ms":>10} {"min ms":>8}')
+    for mode, workers, median, best in rows:
+        print(f'{mode:<8} {workers:>7} {median * 1000:>10.1f} {best * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Capacity of server under slow clients: latency of thumbnail requests (/i/<slug>/) sent while clients on slow
+connections upload images to /api/all/, for gunicorn serving project through WSGI and uvicorn through ASGI.
+Sync gunicorn worker is held by slow upload until its whole body is received, uvicorn receives bodies
+without holding threads. Requires database seeded with ``python -m benchmarks.e2e seed``, and uvicorn.
+
+    python -m benchmarks.slow_clients --workers 4 --slow-clients 0 8 32 128 --slow-seconds 10
+"""
+import argparse
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+
+
+def send_slow_upload(port, token, body, content_type, duration, pieces):
+    """
+    Sends upload in pieces spread evenly over duration, like client on slow connection
+    :return: status code of response, or None when connection failed
+    """
+    head = (f'POST /api/all/ HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAuthorization: Token {token}\r\n'
+            f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n')
+    size = -(-len(body) // pieces)
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=duration + 60) as connection:
+            connection.sendall(head.encode())
+            for start in range(0, len(body), size):
+                time.sleep(duration / pieces)
+                connection.sendall(body[start:start + size])
+            status_line = connection.makefile('rb').readline()
+        return int(status_line.split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def measure(transport, targets, upload, slow_clients, args):
+    """
+    Sends thumbnail requests while slow_clients uploads are being received by server
+    :param upload: tuple of multipart body of upload and its content type
+    :return: summary of thumbnail requests, with number of slow uploads which succeeded
+    """
+    from benchmarks.e2e.report import summarize
+    from benchmarks.e2e.runner import build_requests
+
+    body, content_type = upload
+    with ThreadPoolExecutor(max(slow_clients, 1)) as executor:
+        uploads = [executor.submit(send_slow_upload, transport.port, targets[index % len(targets)].token, body,
+                                   content_type, args.slow_seconds, args.slow_pieces)
+                   for index in range(slow_clients)]
+        # Slow clients connect and send headers first
+        time.sleep(min(1.0, args.slow_seconds / 2))
+        latencies, statuses, _, wall_time = transport.run(build_requests('display', targets, args.requests),
+                                                          args.concurrency)
+        summary = summarize(latencies, statuses, None, wall_time, transport.memory())
+        summary['uploads_succeeded'] = sum(1 for upload in uploads if (upload.result() or 500) < 300)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--workers', type=int, default=4, help='number of gunicorn or uvicorn workers')
+    parser.add_argument('--slow-clients', type=int, nargs='+', default=[0, 8, 32, 128],
+                        help='numbers of uploads on slow connections, measured one after another')
+    parser.add_argument('--slow-seconds', type=float, default=10, help='time taken to send each slow upload')
+    parser.add_argument('--slow-pieces', type=int, default=20, help='number of pieces slow upload is sent in')
+    parser.add_argument('--requests', type=int, default=200, help='thumbnail requests sent during slow uploads')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent thumbnail requests')
+    parser.add_argument('--clients', type=int, default=10, help='number of seeded users sending requests')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.e2e.settings')
+    setup_django()
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from benchmarks.e2e.dataset import get_targets
+    from benchmarks.e2e.runner import SERVER_TRANSPORTS, build_requests, make_upload_files
+
+    targets = get_targets(args.clients)
+    name, content, file_content_type = make_upload_files(1)[0]
+    upload = (encode_multipart(BOUNDARY, {'file': SimpleUploadedFile(name, content, file_content_type)}),
+              MULTIPART_CONTENT)
+    print(f'{args.workers} workers, slow uploads of {len(upload[0]) // 1024} KiB sent in {args.slow_seconds}s')
+    print(f'{"mode":<6} {"slow":>5} {"req/s":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"errors":>7} '
+          f'{"uploads ok":>11} {"peak MB":>8}')
+    for mode in args.modes:
+        transport = SERVER_TRANSPORTS[mode](args.workers, args.port)
+        transport.start()
+        try:
+            transport.run(build_requests('display', targets, args.concurrency * 5), args.concurrency)  # warm up
+            for slow_clients in args.slow_clients:
+                summary = measure(transport, targets, upload, slow_clients, args)
+                print(f'{mode:<6} {slow_clients:>5} {summary["requests_per_second"]:>8.1f} '
+                      f'{summary["p50_ms"]:>9.1f} {summary["p95_ms"]:>9.1f} {summary["p99_ms"]:>9.1f} '
+                      f'{summary["errors"]:>7} {summary["uploads_succeeded"]:>5}/{slow_clients:<5} '
+                      f'{summary["peak_rss_mb"]:>8.1f}')
+        finally:
+            transport.stop()
+
+
+if __name__ == '__main__':
+    main()
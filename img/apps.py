@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ImgConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'img'
+
+    def ready(self):
+        # Connects handlers invalidating cached thumbnail slugs
+        from img import signals  # noqa: F401
@@ -0,0 +1,120 @@
+import hashlib
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseGone
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from API.models import GeneratedImage
+from API.utils import get_storage_name
+from API.variants import VARIANT_FORMATS
+
+DELIVERY_TEMPLATE = 'template'
+DELIVERY_FILE = 'file'
+DELIVERY_NGINX = 'nginx'
+
+
+def is_expired(expire_date, now=None):
+    return expire_date is not None and expire_date <= (now or timezone.now())
+
+
+def get_max_age(expire_date, now=None):
+    """
+    Returns number of seconds thumbnail can be cached for. Time limited thumbnail is not cached after it expires.
+    """
+    if expire_date is None:
+        return settings.IMAGE_CACHE_MAX_AGE
+    remaining = (expire_date - (now or timezone.now())).total_seconds()
+    return max(0, min(int(remaining), settings.IMAGE_CACHE_MAX_AGE))
+
+
+def get_etag(image_url):
+    # Thumbnail file name contains name of source image and options it was rendered with
+    return '"%s"' % hashlib.md5(image_url.encode('utf-8')).hexdigest()
+
+
+def parse_accept(accept):
+    """
+    Returns dict of media type: quality value, of media types listed in Accept header
+    """
+    accepted = {}
+    for item in accept.split(','):
+        media_type, *params = (part.strip() for part in item.split(';'))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            accepted[media_type.lower()] = quality
+    return accepted
+
+
+def choose_variant_format(accept, formats):
+    """
+    Picks format of thumbnail variant to send to client. Only formats listed explicitly in Accept header are
+    chosen, image/* and */* are sent also by clients which do not support them.
+    :param accept: value of Accept header
+    :param formats: available formats, keys of VARIANT_FORMATS in order of preference
+    :return: format with highest quality value, or None if client accepts none of them
+    """
+    accepted = parse_accept(accept)
+    qualities = {image_format: accepted.get(VARIANT_FORMATS[image_format].content_type, 0) for image_format in formats}
+    candidates = [image_format for image_format in formats if qualities[image_format] > 0]
+    return max(candidates, key=qualities.get, default=None)
+
+
+def status_response(thumbnail_status):
+    """
+    Returns response for thumbnail which has no file to send yet
+    """
+    if thumbnail_status == GeneratedImage.STATUS_PENDING:
+        response = HttpResponse('Thumbnail is being generated', status=202, content_type='text/plain')
+        response['Retry-After'] = settings.THUMBNAIL_WORKER_POLL_SECONDS
+    else:
+        response = HttpResponse('Thumbnail could not be generated', status=500, content_type='text/plain')
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def file_response(request, image_url, content_type, expire_date, last_modified, mode, negotiated=False):
+    """
+    Returns response sending thumbnail file, or 304 response when client has current version of the file.
+    In nginx mode file is sent by nginx, from location passed in X-Accel-Redirect header.
+    :param image_url: url of thumbnail file, stored in GeneratedImage.modified_image, or of its variant
+    :param content_type: content type of thumbnail file
+    :param expire_date: expire date of time limited thumbnail, or None
+    :param last_modified: datetime thumbnail was created
+    :param mode: DELIVERY_FILE or DELIVERY_NGINX
+    :param negotiated: file was chosen by Accept header of request, response is marked to vary on it
+    """
+    now = timezone.now()
+    if is_expired(expire_date, now):
+        return HttpResponseGone()
+
+    etag = get_etag(image_url)
+    last_modified_timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_timestamp)
+    if response is None:
+        if mode == DELIVERY_NGINX:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = image_url
+        else:
+            try:
+                file = default_storage.open(get_storage_name(image_url))
+            except FileNotFoundError:
+                raise Http404('Thumbnail file not found')
+            response = FileResponse(file, content_type=content_type)
+
+    response['ETag'] = etag
+    if last_modified_timestamp is not None:
+        response['Last-Modified'] = http_date(last_modified_timestamp)
+    patch_cache_control(response, public=True, max_age=get_max_age(expire_date, now))
+    if expire_date is not None:
+        response['Expires'] = http_date(expire_date.timestamp())
+    if negotiated:
+        patch_vary_headers(response, ('Accept',))
+    return response
@@ -0,0 +1,144 @@
+import mimetypes
+import threading
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from API.cache import TTLCache
+from API.models import GeneratedImage
+from img.delivery import get_max_age
+
+# Images cached in shared cache before variants were added are resolved without them
+ResolvedImage = namedtuple('ResolvedImage', ['image_url', 'expire_date', 'content_type', 'status', 'created',
+                                             'variants'], defaults=({},))
+
+# Cached in place of slugs which do not exist
+MISSING = 'missing'
+
+
+class LocalSlugCache:
+    """
+    Slug cache kept in memory of single process
+    """
+    def __init__(self):
+        self._cache = TTLCache(settings.SLUG_CACHE_SIZE, settings.SLUG_CACHE_TTL_SECONDS)
+
+    def get(self, slug):
+        return self._cache.get(slug)
+
+    def set(self, slug, value, ttl):
+        self._cache.set(slug, value, ttl)
+
+    def delete(self, slug):
+        self._cache.delete(slug)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SharedSlugCache:
+    """
+    Slug cache kept in one of CACHES configured in settings, shared by processes using the same cache
+    """
+    key_prefix = 'img:slug:'
+
+    def __init__(self, alias):
+        self._cache = caches[alias]
+
+    def get(self, slug):
+        return self._cache.get(self.key_prefix + slug)
+
+    def set(self, slug, value, ttl):
+        self._cache.set(self.key_prefix + slug, value, ttl)
+
+    def delete(self, slug):
+        self._cache.delete(self.key_prefix + slug)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SlugResolver:
+    """
+    Resolves slugs of thumbnail urls to thumbnail files, caching results.
+    Ready thumbnails are cached until they expire, but not longer than SLUG_CACHE_TTL_SECONDS. Thumbnails which
+    are not ready are not cached, their status is changed by thumbnail worker or on first view. Unknown slugs
+    are cached for SLUG_CACHE_NEGATIVE_TTL_SECONDS, so guessed slugs do not reach the database.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def resolve(self, slug):
+        """
+        :param slug: slug from thumbnail url
+        :return: ResolvedImage, or None if thumbnail does not exist
+        """
+        cached = self.backend.get(slug)
+        if cached is not None:
+            self._count(hit=True)
+            return None if cached == MISSING else cached
+        self._count(hit=False)
+
+        row = GeneratedImage.objects.filter(slug=slug) \
+            .values_list('modified_image', 'expire_date', 'status', 'created', 'variants').first()
+        if row is None:
+            self.backend.set(slug, MISSING, settings.SLUG_CACHE_NEGATIVE_TTL_SECONDS)
+            return None
+
+        image_url, expire_date, status, created, variants = row
+        content_type = mimetypes.guess_type(image_url)[0] or 'application/octet-stream'
+        resolved = ResolvedImage(image_url, expire_date, content_type, status, created, variants)
+        if status == GeneratedImage.STATUS_READY:
+            ttl = min(get_max_age(expire_date, timezone.now()), settings.SLUG_CACHE_TTL_SECONDS)
+            if ttl > 0:
+                self.backend.set(slug, resolved, ttl)
+        return resolved
+
+    def invalidate(self, slug):
+        self.backend.delete(slug)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """
+    Returns SlugResolver using cache selected by SLUG_CACHE_BACKEND; None for in-process cache,
+    or alias of one of CACHES
+    """
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            alias = settings.SLUG_CACHE_BACKEND
+            _resolver = SlugResolver(SharedSlugCache(alias) if alias else LocalSlugCache())
+        return _resolver
+
+
+@receiver(setting_changed)
+def reset_resolver(setting, **kwargs):
+    global _resolver
+    if setting.startswith('SLUG_CACHE_'):
+        with _resolver_lock:
+            _resolver = None
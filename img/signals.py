@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from API.models import GeneratedImage
+from img.resolver import get_resolver
+
+
+@receiver([post_save, post_delete], sender=GeneratedImage, dispatch_uid='img_thumbnail_changed')
+def thumbnail_changed(sender, instance, **kwargs):
+    # Changes made with queryset update() or bulk_update() do not send signals, and need to invalidate slugs directly
+    if instance.slug:
+        get_resolver().invalidate(instance.slug)
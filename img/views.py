@@ -1,27 +1,73 @@
-from datetime import datetime
-import pytz
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render
 from django.views import View
+from API.metrics import stage, timed_endpoint
 from API.models import GeneratedImage
+from API.query_budget import query_budget
+from API.thumbnails import materialize_thumbnail
+from API.variants import VARIANT_FORMATS, get_variant_formats, materialize_variant
+from img.delivery import DELIVERY_TEMPLATE, choose_variant_format, file_response, is_expired, status_response
+from img.resolver import get_resolver
 
 
 class DisplayImageView(View):
+    @timed_endpoint('display')
+    @query_budget(11)
     def get(self, request, slug):
         """
-        Displays uploaded image
+        Displays uploaded image. Depending on IMAGE_DELIVERY_MODE, thumbnail file is sent directly
+        ('file'), handed over to nginx ('nginx'), or shown on html page ('template'). File is sent in format
+        of its variant accepted by client, see THUMBNAIL_VARIANT_FORMATS.
         :param request:
         :param slug: string consisting or multiple random characters, identifying specific image to display
         """
-        img = GeneratedImage.objects.get(slug=slug)
-        image_path = img.modified_image
+        resolver = get_resolver()
+        with stage('resolve'):
+            img = resolver.resolve(slug)
+        if img is not None and img.status == GeneratedImage.STATUS_DEFERRED and not is_expired(img.expire_date):
+            # Thumbnail of account type with lazy thumbnails is rendered on its first view
+            with stage('materialize'):
+                materialize_thumbnail(slug)
+            with stage('resolve'):
+                img = resolver.resolve(slug)
+        if img is None:
+            raise Http404('Thumbnail not found')
+        image_path = img.image_url
+        expired = is_expired(img.expire_date)
 
-        # Check if image is expired, same timezone as in database should be used
-        utc = pytz.UTC
-        expired = False
-        if img.expire_date is not None:
-            if img.expire_date.replace(tzinfo=utc) < datetime.now().replace(tzinfo=utc):
-                expired = True
+        mode = settings.IMAGE_DELIVERY_MODE
+        if mode != DELIVERY_TEMPLATE:
+            # Thumbnails rendered by thumbnail worker are not viewable until they are ready
+            if img.status != GeneratedImage.STATUS_READY and not expired:
+                return status_response(img.status)
+            content_type = img.content_type
+            formats = get_variant_formats()
+            image_format = choose_variant_format(request.headers.get('Accept', ''), formats)
+            if image_format is not None and not expired:
+                if image_format in img.variants:
+                    variant_url = img.variants[image_format]
+                else:
+                    with stage('materialize'):
+                        variant_url = materialize_variant(slug, image_format)
+                # Thumbnail is sent when variant is not smaller, or could not be encoded
+                if variant_url:
+                    image_path, content_type = variant_url, VARIANT_FORMATS[image_format].content_type
+            # File is opened here, its content is sent after response is returned
+            with stage('respond'):
+                return file_response(request, image_path, content_type, img.expire_date, img.created, mode,
+                                     negotiated=bool(formats))
+
+        response_status = 200
+        if expired:
+            response_status = 410
+        elif img.status == GeneratedImage.STATUS_PENDING:
+            response_status = 202
+        elif img.status == GeneratedImage.STATUS_FAILED:
+            response_status = 500
 
         context = {'image_path': image_path,
-                   'expired': expired}
-        return render(request, 'img/image.html', context=context)
+                   'expired': expired,
+                   'status': img.status}
+        with stage('respond'):
+            return render(request, 'img/image.html', context=context, status=response_status)